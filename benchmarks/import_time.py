@@ -0,0 +1,96 @@
+#-*- coding: UTF-8 -*-
+##
+ # import_time.py
+ #
+ # Description: Guard the startup time of the command line: run the quick
+ #              code paths (--version, --help) in fresh interpreters, fail
+ #              when one of them loads a heavy dependency (arcpy, GDAL,
+ #              psycopg2, ruamel.yaml) or takes longer than --max_seconds
+ #
+ ##
+import sys, json, time, logging, argparse, subprocess
+from os import path
+
+ROOT = path.dirname(path.dirname(path.abspath(__file__)))
+
+HEAVY_MODULES = ["arcpy", "archook", "osgeo", "psycopg2", "ruamel"]
+
+COMMANDS = {
+	"version": ["--version"],
+	"help": ["--help"]
+}
+
+# run in a fresh interpreter: the command line, then the heavy modules loaded
+PROBE = """
+import sys, json
+sys.argv = ["fgdb2postgis"] + json.loads(sys.argv[1])
+from fgdb2postgis.__main__ import main
+try:
+	main()
+except SystemExit:
+	pass
+heavy = %s
+loaded = sorted(set([m.split(".")[0] for m in sys.modules if m.split(".")[0] in heavy]))
+sys.stderr.write("\\nLOADED " + json.dumps(loaded) + "\\n")
+""" % json.dumps(HEAVY_MODULES)
+
+
+def probe(argv):
+	start = time.time()
+	proc = subprocess.Popen([sys.executable, "-c", PROBE, json.dumps(argv)], cwd=ROOT,
+		stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+	out, err = proc.communicate()
+	seconds = time.time() - start
+	loaded = None
+	for line in err.decode("utf-8", "replace").splitlines():
+		if line.startswith("LOADED "):
+			loaded = json.loads(line[len("LOADED "):])
+	if loaded is None:
+		logging.error( err.decode("utf-8", "replace") )
+	return seconds, loaded
+
+def run(args):
+	results = {}
+	for name, argv in sorted(COMMANDS.items()):
+		runs = [probe(argv) for i in range(args.repeat)]
+		seconds = sorted([r[0] for r in runs])
+		results[name] = { "argv": argv, "median": seconds[len(seconds) // 2], "min": seconds[0],
+			"loaded": runs[-1][1] }
+	return results
+
+def check(results, max_seconds):
+	ok = True
+	logging.info( "%-10s %10s %10s  %s" % ("command", "median", "min", "heavy modules") )
+	for name, r in sorted(results.items()):
+		logging.info( "%-10s %9.3fs %9.3fs  %s" % (name, r["median"], r["min"],
+			", ".join(r["loaded"]) if r["loaded"] else "-") )
+		if r["loaded"] is None:
+			logging.error( "%s: the probe failed" % name )
+			ok = False
+		elif r["loaded"]:
+			logging.error( "%s loads %s" % (name, ", ".join(r["loaded"])) )
+			ok = False
+		if r["median"] > max_seconds:
+			logging.error( "%s takes %.3fs, more than %.3fs" % (name, r["median"], max_seconds) )
+			ok = False
+	return ok
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Check the startup time of the fgdb2postgis command line.')
+	parser.add_argument('--repeat', type=int, default=5, help='Runs per command, the median is compared. Default 5')
+	parser.add_argument('--max_seconds', type=float, default=1.0, help='Maximum median startup time. Default 1.0')
+	parser.add_argument('--json', help='Save the timings to this json file')
+	args = parser.parse_args()
+
+	logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+	results = run(args)
+	if args.json:
+		with open(args.json, "w") as f:
+			json.dump(results, f, indent=2)
+	sys.exit(0 if check(results, args.max_seconds) else 1)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,170 @@
+#-*- coding: UTF-8 -*-
+##
+ # run_benchmark.py
+ #
+ # Description: Time the FileGDB -> PostGIS pipeline, stage by stage, on a
+ #              synthetic file geodatabase against a throwaway database of a
+ #              local PostgreSQL/PostGIS instance
+ #
+ # Results are saved in benchmarks/results, one json file per run, and
+ # compared with the previous run made with the same parameters.
+ #
+ ##
+import os, sys, json, time, glob, shutil, logging, argparse, tempfile
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+
+import psycopg2
+from synthetic_fgdb import create_fgdb
+from fgdb2postgis.filegdb import FileGDB
+from fgdb2postgis.postgis import PostGIS
+from fgdb2postgis.report import RunReport
+from fgdb2postgis.sqlunits import is_session_statement
+from fgdb2postgis.version import get_version
+
+RESULTS_DIR = path.join(path.dirname(path.abspath(__file__)), "results")
+
+# parameters that identify comparable runs
+PARAMS = ["layers", "rows", "vertices", "domains", "datasets", "tables", "engine", "backend", "inventory", "jobs", "chunk_rows"]
+
+
+def drop_database(args):
+	conn = psycopg2.connect(dbname="postgres", host=args.host, port=args.port, user=args.user, password=args.password)
+	conn.set_isolation_level(0)
+	cursor = conn.cursor()
+	cursor.execute("DROP DATABASE IF EXISTS {} ;".format(args.database))
+	cursor.close()
+	conn.close()
+
+def run(args, workdir):
+	gdb = path.join(workdir, "bench.gdb")
+	report = RunReport(gdb)
+
+	with report.stage("create_fgdb"):
+		create_fgdb(gdb, args.layers, args.rows, args.vertices, args.domains, 5, args.datasets, args.tables)
+
+	cwd = os.getcwd()
+	os.chdir(workdir)
+	try:
+		filegdb = FileGDB("bench.gdb", False, "lookup_tables", inventory=args.inventory, jobs=args.jobs,
+			catalog_cache=False, backend=args.backend)
+		postgis = PostGIS(args.host, args.port, args.user, args.password, args.database, "EPSG:4326", "EPSG:4326",
+			jobs=args.jobs, engine=args.engine, report=report, chunk_rows=args.chunk_rows)
+		errors = ErrorCounter()
+		logging.getLogger().addHandler(errors)
+		try:
+			with report.stage("filegdb.process"):
+				filegdb.process()
+		finally:
+			logging.getLogger().removeHandler(errors)
+		check_scripts(args, filegdb, errors.count)
+		postgis.process(filegdb)
+		with report.stage("filegdb.cleanup"):
+			filegdb.cleanup()
+	finally:
+		os.chdir(cwd)
+
+	report.finished = time.time()
+	return report
+
+#-------------------------------------------------------------------------------
+# A pipeline that skipped domains, constraints or views is not comparable
+# with earlier runs, stop before timing it
+#
+class ErrorCounter(logging.Handler):
+	def __init__(self):
+		logging.Handler.__init__(self, logging.ERROR)
+		self.count = 0
+
+	def emit(self, record):
+		self.count += 1
+
+def check_scripts(args, filegdb, errors):
+	if errors:
+		logging.error( "FileGDB.process logged %d errors, the benchmark is not valid" % errors )
+		sys.exit(1)
+	constraints = [s for s in filegdb.get_statements("create_constraints") if not is_session_statement(s)]
+	if args.domains and not constraints:
+		logging.error( "No foreign key constraints generated for %d domains, the benchmark is not valid" % args.domains )
+		sys.exit(1)
+
+def save_result(args, report):
+	if not path.exists(RESULTS_DIR):
+		os.makedirs(RESULTS_DIR)
+
+	result = {
+		"version": get_version(),
+		"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+		"params": dict((p, getattr(args, p)) for p in PARAMS),
+		"report": report.to_dict()
+	}
+	result_path = path.join(RESULTS_DIR, "%s_%s.json" % (result["version"], time.strftime("%Y%m%d%H%M%S")))
+	with open(result_path, "w") as f:
+		json.dump(result, f, indent=2)
+	logging.info( "Saved %s" % result_path )
+	return result
+
+#-------------------------------------------------------------------------------
+# Compare stage timings with the latest earlier result of the same parameters
+#
+def compare(result):
+	previous = None
+	for result_path in sorted(glob.glob(path.join(RESULTS_DIR, "*.json")), key=path.getmtime):
+		with open(result_path) as f:
+			data = json.load(f)
+		if data["params"] == result["params"] and data["timestamp"] != result["timestamp"]:
+			previous = data
+
+	if previous is None:
+		logging.info( "No previous result with the same parameters" )
+		return
+
+	logging.info( "Compared with %s (%s):" % (previous["version"], previous["timestamp"]) )
+	before = dict((s["name"], s) for s in previous["report"]["stages"])
+	for stage in result["report"]["stages"]:
+		if stage["name"] not in before:
+			continue
+		old = before[stage["name"]]["seconds"]
+		change = (stage["seconds"] - old) / old * 100 if old else 0
+		logging.info( "%-28s %10.2fs %10.2fs %+8.1f%%" % (stage["name"], old, stage["seconds"], change) )
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Benchmark fgdb2postgis on a synthetic file geodatabase.')
+	parser.add_argument('--layers', type=int, default=10, help='Number of feature classes. Default 10')
+	parser.add_argument('--rows', type=int, default=1000, help='Rows per feature class and table. Default 1000')
+	parser.add_argument('--vertices', type=int, default=32, help='Vertices per polygon/polyline. Default 32')
+	parser.add_argument('--domains', type=int, default=3, help='Number of coded value domains. Default 3')
+	parser.add_argument('--datasets', type=int, default=2, help='Number of feature datasets. Default 2')
+	parser.add_argument('--tables', type=int, default=2, help='Number of non-spatial tables. Default 2')
+	parser.add_argument('--engine', choices=['ogr2ogr', 'gdal', 'copy'], default='ogr2ogr', help='Layer loader. Default ogr2ogr')
+	parser.add_argument('--backend', choices=['arcpy', 'gdal'], default='gdal', help='Metadata backend. Default gdal')
+	parser.add_argument('--inventory', choices=['arcpy', 'ogr'], default='ogr', help='Inventory backend. Default ogr')
+	parser.add_argument('--jobs', type=int, default=1, help='Number of concurrent workers. Default 1')
+	parser.add_argument('--chunk_rows', type=int, help='Load layers with at least twice this many rows in FID ranges')
+	parser.add_argument('--host', default='localhost', help='Database host. Default localhost')
+	parser.add_argument('--port', type=int, default=5432, help='Postgresql port. Default 5432')
+	parser.add_argument('--user', default='postgres', help='Database user. Default postgres')
+	parser.add_argument('--password', default='', help='Database password')
+	parser.add_argument('--database', default='fgdb2postgis_bench', help='Throwaway database. Default fgdb2postgis_bench')
+	parser.add_argument('--keep', action='store_true', help='Keep the database and the geodatabase')
+	args = parser.parse_args()
+
+	logging.basicConfig(level=logging.INFO, format='%(message)s')
+
+	workdir = tempfile.mkdtemp(prefix="fgdb2postgis_bench_")
+	try:
+		report = run(args, workdir)
+		report.summary()
+		compare(save_result(args, report))
+	finally:
+		if not args.keep:
+			shutil.rmtree(workdir, ignore_errors=True)
+			drop_database(args)
+		else:
+			logging.info( "Kept %s and database %s" % (workdir, args.database) )
+
+
+if __name__ == '__main__':
+	main()
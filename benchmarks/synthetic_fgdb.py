@@ -0,0 +1,125 @@
+#-*- coding: UTF-8 -*-
+##
+ # synthetic_fgdb.py
+ #
+ # Description: Generate synthetic file geodatabases of configurable size with
+ #              the GDAL OpenFileGDB driver (write support requires GDAL >= 3.6)
+ #
+ # Subtypes cannot be authored through GDAL, synthetic geodatabases have
+ # coded value domains but no subtypes.
+ #
+ ##
+import math, random, argparse, logging
+from osgeo import gdal, ogr, osr
+
+SHAPES = ["Polygon", "Polyline", "Point"]
+
+
+def create_domains(ds, count, values):
+	names = []
+	for d in range(count):
+		name = "dom_bench_%d" % d
+		coded_values = dict((code, "value %d" % code) for code in range(1, values + 1))
+		domain = ogr.CreateCodedFieldDomain(name, "synthetic domain %d" % d, ogr.OFTInteger, ogr.OFSTNone, coded_values)
+		ds.AddFieldDomain(domain)
+		names.append(name)
+	return names
+
+def make_geometry(shape, vertices, rnd):
+	cx, cy = rnd.uniform(-170, 170), rnd.uniform(-80, 80)
+	if shape == "Point":
+		geom = ogr.Geometry(ogr.wkbPoint)
+		geom.AddPoint_2D(cx, cy)
+		return geom
+
+	radius = rnd.uniform(0.001, 0.05)
+	ring = ogr.Geometry(ogr.wkbLinearRing if shape == "Polygon" else ogr.wkbLineString)
+	for i in range(vertices):
+		angle = 2 * math.pi * i / vertices
+		ring.AddPoint_2D(cx + radius * math.cos(angle), cy + radius * math.sin(angle))
+
+	if shape == "Polyline":
+		multi = ogr.Geometry(ogr.wkbMultiLineString)
+		multi.AddGeometry(ring)
+		return multi
+
+	ring.CloseRings()
+	polygon = ogr.Geometry(ogr.wkbPolygon)
+	polygon.AddGeometry(ring)
+	multi = ogr.Geometry(ogr.wkbMultiPolygon)
+	multi.AddGeometry(polygon)
+	return multi
+
+def create_layer(ds, name, shape, srs, rows, vertices, domains, dataset, rnd):
+	geom_types = { "Polygon": ogr.wkbMultiPolygon, "Polyline": ogr.wkbMultiLineString, "Point": ogr.wkbPoint, None: ogr.wkbNone }
+	options = ["FEATURE_DATASET=%s" % dataset] if dataset else []
+	layer = ds.CreateLayer(name, srs if shape else None, geom_types[shape], options=options)
+
+	layer.CreateField(ogr.FieldDefn("name", ogr.OFTString))
+	layer.CreateField(ogr.FieldDefn("value", ogr.OFTReal))
+	layer.CreateField(ogr.FieldDefn("created", ogr.OFTDateTime))
+	for d in domains:
+		field = ogr.FieldDefn(d.replace("dom_", "f_"), ogr.OFTInteger)
+		field.SetDomainName(d)
+		layer.CreateField(field)
+
+	defn = layer.GetLayerDefn()
+	layer.StartTransaction()
+	for i in range(rows):
+		feature = ogr.Feature(defn)
+		feature.SetField("name", "%s %d" % (name, i))
+		feature.SetField("value", rnd.random() * 1000)
+		feature.SetField("created", 2020, 1 + i % 12, 1 + i % 28, i % 24, i % 60, i % 60, 0)
+		for d in domains:
+			feature.SetField(d.replace("dom_", "f_"), 1 + i % 5)
+		if shape:
+			feature.SetGeometry(make_geometry(shape, vertices, rnd))
+		layer.CreateFeature(feature)
+	layer.CommitTransaction()
+
+#-------------------------------------------------------------------------------
+# Create a geodatabase with `layers` feature classes spread over `datasets`
+# feature datasets (plus standalone ones) and `tables` non-spatial tables
+#
+def create_fgdb(path, layers=10, rows=1000, vertices=32, domains=3, domain_values=5, datasets=2, tables=2, seed=1):
+	gdal.UseExceptions()
+	rnd = random.Random(seed)
+	driver = ogr.GetDriverByName("OpenFileGDB")
+	ds = driver.CreateDataSource(path)
+
+	srs = osr.SpatialReference()
+	srs.ImportFromEPSG(4326)
+
+	domain_names = create_domains(ds, domains, domain_values)
+
+	for i in range(layers):
+		dataset = "fds_bench_%d" % (i % (datasets + 1)) if datasets and i % (datasets + 1) < datasets else None
+		shape = SHAPES[i % len(SHAPES)]
+		create_layer(ds, "fc_bench_%d" % i, shape, srs, rows, vertices, domain_names, dataset, rnd)
+
+	for i in range(tables):
+		create_layer(ds, "tbl_bench_%d" % i, None, None, rows, vertices, domain_names, None, rnd)
+
+	ds = None
+	logging.debug( "Created %s: %d layers, %d tables, %d rows each" % (path, layers, tables, rows) )
+	return path
+
+
+def main():
+	parser = argparse.ArgumentParser(description='Create a synthetic file geodatabase.')
+	parser.add_argument('path', help='Output .gdb path')
+	parser.add_argument('--layers', type=int, default=10, help='Number of feature classes. Default 10')
+	parser.add_argument('--rows', type=int, default=1000, help='Rows per feature class and table. Default 1000')
+	parser.add_argument('--vertices', type=int, default=32, help='Vertices per polygon/polyline. Default 32')
+	parser.add_argument('--domains', type=int, default=3, help='Number of coded value domains. Default 3')
+	parser.add_argument('--domain_values', type=int, default=5, help='Coded values per domain. Default 5')
+	parser.add_argument('--datasets', type=int, default=2, help='Number of feature datasets. Default 2')
+	parser.add_argument('--tables', type=int, default=2, help='Number of non-spatial tables. Default 2')
+	args = parser.parse_args()
+
+	create_fgdb(args.path, args.layers, args.rows, args.vertices, args.domains, args.domain_values,
+		args.datasets, args.tables)
+
+
+if __name__ == '__main__':
+	main()
@@ -8,10 +8,9 @@
  # Copyright: Cartologic 2017
  #
  ##
-import getopt, sys, logging , traceback, argparse
-from .filegdb import FileGDB
-from .postgis import PostGIS
+import getopt, sys, logging , traceback, argparse, time
 from .version import get_version
+from .report import RunReport
 
 def show_version():
 	print ( "Version: {}".format(get_version())  )
@@ -26,6 +25,12 @@ def printError(e):
     logging.error("****************************************************************************************************************")
     
 
+def str2floats(v):
+    try:
+        return [float(x) for x in v.split(',') if x.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError('Comma separated numbers expected.')
+
 def str2bool(v):
     if isinstance(v, bool):
        return v
@@ -40,7 +45,7 @@ def str2bool(v):
 #-------------------------------------------------------------------------------
 # Main - Instantiate the required database objects and perform the conversion
 #
-def main():
+def get_parser():
 	parser = argparse.ArgumentParser(description='Convert a Filegeodatabase to Postgis.')
 	parser.add_argument('-v', '--version', action='store_true',help='Program version' )
 	parser.add_argument('-yml', '--yml', action='store_true',help='Create .yml and exit' )
@@ -51,9 +56,36 @@ def main():
 	parser.add_argument('--user',  nargs='?',  help='database user ')
 	parser.add_argument('--password',  nargs='?',  help='database password')
 	parser.add_argument('--include_empty', type=str2bool,  nargs='?', default=False , help='Include empty tables and features. Default False')
+	parser.add_argument('--schema', nargs='?', default='public', help='Schema of the tables and feature classes the yaml file does not map. Default public')
 	parser.add_argument('--lookup_tables_schema',  nargs='?', default='lookup_tables',   help='Name of the schema for lookup tables. Default:lookup_tables')
 	parser.add_argument('--a_srs',  nargs='?',  help='Assign an output SRS.')
 	parser.add_argument('--t_srs',  nargs='?',  help='Reproject/transform to this SRS on output.')
+	parser.add_argument('--backend', choices=['arcpy', 'gdal'], default='arcpy', help='Metadata backend: arcpy or the GDAL OpenFileGDB driver (no ArcGIS required). Default arcpy')
+	parser.add_argument('--inventory', choices=['arcpy', 'ogr'], default='arcpy', help='Inventory of feature classes and tables: arcpy Describe/GetCount or OGR OpenFileGDB metadata. Default arcpy')
+	parser.add_argument('--catalog_cache', type=str2bool, nargs='?', default=True, help='Reuse the geodatabase catalog saved by a previous run when the geodatabase is unchanged. Default True')
+	parser.add_argument('--incremental', type=str2bool, nargs='?', const=True, default=False, help='Keep the target database and reload only the layers changed since the last load. Default False')
+	parser.add_argument('--maintenance_work_mem', nargs='?', help='maintenance_work_mem of the index/constraint build sessions, e.g. 1GB')
+	parser.add_argument('--parallel_maintenance_workers', type=int, nargs='?', help='max_parallel_maintenance_workers of the index/constraint build sessions')
+	parser.add_argument('--validate_constraints', type=str2bool, nargs='?', const=True, default=False, help='Validate the generated NOT VALID foreign key constraints after loading. Default False')
+	parser.add_argument('--mv_unique_index', type=str2bool, nargs='?', const=True, default=False, help='Add a unique index on id to each materialized view so it can be refreshed concurrently. Default False')
+	parser.add_argument('--staging', type=str2bool, nargs='?', const=True, default=False, help='Load into UNLOGGED staging tables and switch them into their schemas at the end. Default False')
+	parser.add_argument('--cluster_rows', type=int, nargs='?', help='CLUSTER layers with at least this many rows on their spatial index after loading')
+	parser.add_argument('--analyze', type=str2bool, nargs='?', const=True, default=True, help='ANALYZE every loaded layer. Default True')
+	parser.add_argument('--simplify', type=str2floats, nargs='?', default=[], help='Comma separated tolerances, add a simplified geometry column per tolerance to line and polygon layers, e.g. 1,10,100')
+	parser.add_argument('--precision', type=float, nargs='?', help='Grid size the generalized geometries are snapped to (ST_ReducePrecision, PostGIS >= 3.1)')
+	parser.add_argument('--resume', type=str2bool, nargs='?', const=True, default=False, help='Keep the target database and skip the loads and sql tasks completed by the previous run. Default False')
+	parser.add_argument('--write_sql', type=str2bool, nargs='?', const=True, default=True, help='Save the generated sql scripts in the <fgdb>.sql folder. Default True')
+	parser.add_argument('--jobs', type=int, nargs='?', default=1, help='Number of concurrent workers (inventory scan, layer loads, index and constraint builds). Default 1')
+	parser.add_argument('--engine', choices=['ogr2ogr', 'gdal', 'copy'], default='ogr2ogr', help='Layer loader: one ogr2ogr process per layer, in-process GDAL bindings or binary COPY. Default ogr2ogr')
+	parser.add_argument('--batch_size', type=int, nargs='?', default=20000, help='Features per transaction (gdal) or per COPY batch (copy). Default 20000')
+	parser.add_argument('--chunk_rows', type=int, nargs='?', help='Split layers with at least twice this many rows into FID ranges of about this many rows, loaded concurrently')
+	parser.add_argument('--manifest', nargs='?', help='Yaml manifest of file geodatabases and target databases/schemas to convert in one run')
+	parser.add_argument('--plan', type=str2bool, nargs='?', const=True, default=False, help='Print the ordered load plan and its estimated duration without touching the database. Default False')
+	parser.add_argument('--profile', nargs='?', help='Run report (or benchmark result) the --plan estimates are based on. Default <fgdb>.report.json')
+	return parser
+
+def main():
+	parser = get_parser()
 	args = parser.parse_args()
 	#print(args)
 
@@ -71,20 +103,111 @@ def main():
 	try: 
 		logging.debug(args)
 		logging.debug("Begin Program....")
-		filegdb = FileGDB(args.fgdb, args.include_empty, args.lookup_tables_schema)
-		
-		if(args.yml):
-			filegdb.create_yaml()
-			return
-
-		postgis = PostGIS(args.host, args.port, args.user, args.password, args.database, args.a_srs,  args.t_srs)
-		filegdb.process()
-		postgis.process(filegdb)
-		
-		filegdb.cleanup()
+		if args.manifest:
+			convert_batch(parser, args)
+		else:
+			convert(args)
 	except Exception as e:
 		printError(e)
 
 	logging.debug("***********************************")
 	logging.debug("End Program....")
 	logging.debug("***********************************")
+
+
+#-------------------------------------------------------------------------------
+# Convert one file geodatabase, returns the run report. With --plan the
+# geodatabase is processed and the load plan printed, nothing is converted.
+# FileGDB and PostGIS pull in arcpy/GDAL, psycopg2 and ruamel.yaml, they
+# are imported here so that --version and --help start fast
+#
+def convert(args, connections=None):
+	from .filegdb import FileGDB
+	from .postgis import PostGIS
+
+	filegdb = FileGDB(args.fgdb, args.include_empty, args.lookup_tables_schema,
+		inventory=args.inventory, jobs=args.jobs, catalog_cache=args.catalog_cache, backend=args.backend,
+		write_sql=args.write_sql, default_schema=args.schema)
+	
+	if(args.yml):
+		filegdb.create_yaml()
+		filegdb.save_catalog()
+		return None
+
+	if(args.plan):
+		return plan(args, filegdb)
+
+	report = RunReport(args.fgdb)
+	postgis = PostGIS(args.host, args.port, args.user, args.password, args.database, args.a_srs,  args.t_srs,
+		jobs=args.jobs, engine=args.engine, batch_size=args.batch_size,
+		incremental=args.incremental, maintenance_work_mem=args.maintenance_work_mem,
+		parallel_maintenance_workers=args.parallel_maintenance_workers,
+		validate_constraints=args.validate_constraints, mv_unique_index=args.mv_unique_index,
+		staging=args.staging, report=report, resume=args.resume, cluster_rows=args.cluster_rows,
+		analyze=args.analyze, simplify=args.simplify, precision=args.precision, connections=connections,
+		chunk_rows=args.chunk_rows)
+	with report.stage("filegdb.process"):
+		filegdb.process()
+	postgis.process(filegdb)
+	
+	with report.stage("filegdb.cleanup"):
+		filegdb.cleanup()
+
+	report.save(filegdb.reportfile_path)
+	report.summary()
+	return report
+
+def plan(args, filegdb):
+	from .postgis import PostGIS
+	from .plan import ThroughputProfile, log_plan
+
+	profile = ThroughputProfile()
+	if not profile.load(args.profile or filegdb.reportfile_path) and args.profile:
+		logging.error( "Unable to read the throughput profile %s ..." % args.profile )
+		sys.exit(1)
+
+	postgis = PostGIS(args.host, args.port, args.user, args.password, args.database, args.a_srs,  args.t_srs,
+		jobs=args.jobs, engine=args.engine, batch_size=args.batch_size,
+		incremental=args.incremental, validate_constraints=args.validate_constraints,
+		mv_unique_index=args.mv_unique_index, staging=args.staging, resume=args.resume,
+		cluster_rows=args.cluster_rows, analyze=args.analyze, simplify=args.simplify,
+		precision=args.precision, dry_run=True, chunk_rows=args.chunk_rows)
+	filegdb.process()
+	log_plan(postgis, filegdb, profile)
+	filegdb.cleanup()
+	return None
+
+#-------------------------------------------------------------------------------
+# Convert the file geodatabases of a manifest one after the other in this
+# process, sharing the database connections. A failed conversion does not
+# stop the batch, the batch report is saved as <manifest>.report.json
+#
+def convert_batch(parser, args):
+	from . import batch
+
+	conversions = [parser.parse_args(sys.argv[1:] + argv) for argv in batch.read_manifest(args.manifest)]
+	if not batch.check_conversions(conversions):
+		sys.exit(1)
+
+	connections = batch.SharedConnections()
+	batch_report = RunReport(args.manifest)
+	try:
+		for i, conversion in enumerate(conversions):
+			name = "{} -> {}".format(conversion.fgdb, conversion.database)
+			logging.info( "Converting %s (%d/%d) ..." % (name, i + 1, len(conversions)) )
+			report = None
+			start = time.time()
+			try:
+				with batch_report.stage(name):
+					report = convert(conversion, connections)
+			except (Exception, SystemExit) as e:
+				printError(e)
+			batch.record_conversion(batch_report, name, report, time.time() - start)
+	finally:
+		connections.close()
+
+	if args.plan:
+		return
+	batch_report.save("%s.report.json" % args.manifest)
+	batch_report.summary()
+	batch.log_throughput(batch_report)
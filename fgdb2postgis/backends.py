@@ -0,0 +1,325 @@
+#-*- coding: UTF-8 -*-
+##
+ # backends.py
+ #
+ # Description: Geodatabase metadata backends used by FileGDB
+ #              ArcpyBackend reads the geodatabase through arcpy (Windows)
+ #              GdalBackend reads the geodatabase system catalog (GDB_Items)
+ #              with the GDAL OpenFileGDB driver, no ArcGIS required
+ # Copyright: Cartologic 2017
+ #
+ ##
+import sys, logging, fnmatch
+import xml.etree.ElementTree as ET
+from .inventory import FEATURE_TYPES, SHAPE_TYPES
+from .gdalimport import require_gdal
+
+# properties copied from arcpy.Describe objects, missing ones are left as None
+DESCRIBE_PROPERTIES = (
+	"name",
+	"dataType",
+	"featureType",
+	"shapeType",
+	"relationshipClassNames",
+	"isAttachmentRelationship",
+	"originClassNames",
+	"destinationClassNames",
+	"originClassKeys"
+)
+
+INTEGER_TYPES = ("SmallInteger", "Integer", "OID")
+FLOAT_TYPES = ("Single", "Double")
+
+# arcpy Domain.type names to the field type names of ListFields
+DOMAIN_TYPES = {
+	"Short": "SmallInteger",
+	"Long": "Integer",
+	"Float": "Single",
+	"Text": "String"
+}
+
+
+def to_plain(value):
+	if isinstance(value, (list, tuple)):
+		return [to_plain(v) for v in value]
+	return value
+
+def get_backend(name, workspace):
+	if name == "gdal":
+		return GdalBackend(workspace)
+	return ArcpyBackend(workspace)
+
+
+#-------------------------------------------------------------------------------
+# Backend interface
+#
+# describe(name)            arcpy.Describe as a dict of DESCRIBE_PROPERTIES
+# list_subtypes(name)       arcpy.da.ListSubtypes, FieldValues map each field to
+#                           its domain name (or None)
+# list_fields(name)         [{name, type}], arcpy field type names
+# list_domains()            [{name, domainType, fieldType, codedValues, range}]
+#                           fieldType is a field type name (Integer, String ...),
+#                           codedValues is a list of [code, description]
+# list_datasets()           feature dataset names
+# list_feature_classes(fds) feature class names within fds (None for root)
+# list_tables(wildcard)     table names
+# get_count(name)           row count
+#
+class ArcpyBackend:
+	def __init__(self, workspace):
+		# locate and import arcpy
+		try:
+			import archook
+			archook.get_arcpy()
+			import arcpy
+		except ImportError:
+			logging.error( "Unable to locate arcpy module...")
+			sys.exit(1)
+
+		self.arcpy = arcpy
+		self.workspace = workspace
+
+	def setenv(self):
+		logging.debug( "Setting arcpy environment ..." )
+		self.arcpy.env.workspace = self.workspace
+		self.arcpy.env.overwriteOutput = True
+
+	def describe(self, name):
+		desc = self.arcpy.Describe(name)
+		return dict((prop, to_plain(getattr(desc, prop, None))) for prop in DESCRIBE_PROPERTIES)
+
+	def list_subtypes(self, name):
+		subtypes = {}
+		for code, subtype in self.arcpy.da.ListSubtypes(name).items():
+			field_values = {}
+			for field, values in subtype['FieldValues'].items():
+				field_values[field] = values[1].name if values[1] is not None else None
+
+			subtypes[code] = {
+				'Name': subtype['Name'],
+				'Default': subtype['Default'],
+				'SubtypeField': subtype['SubtypeField'],
+				'FieldValues': field_values
+			}
+		return subtypes
+
+	def list_fields(self, name):
+		return [ { "name": f.name, "type": f.type } for f in self.arcpy.ListFields(name) ]
+
+	def list_domains(self):
+		domains = []
+		for d in self.arcpy.da.ListDomains(self.workspace):
+			domains.append( { "name": d.name, "domainType": d.domainType, "fieldType": DOMAIN_TYPES.get(d.type, d.type),
+				"codedValues": [[code, desc] for code, desc in (d.codedValues or {}).items()],
+				"range": to_plain(d.range) if d.domainType == 'Range' else None } )
+		return domains
+
+	def list_datasets(self):
+		return self.arcpy.ListDatasets("*", "Feature") or []
+
+	def list_feature_classes(self, fds):
+		return self.arcpy.ListFeatureClasses("*", "", fds) or []
+
+	def list_tables(self, wildcard="*"):
+		return self.arcpy.ListTables(wildcard) or []
+
+	def get_count(self, name):
+		return int(self.arcpy.GetCount_management(name).getOutput(0))
+
+
+
+#-------------------------------------------------------------------------------
+# GDB_Items item types
+#
+ITEM_TYPES = {
+	"{74737149-DCB5-4257-8904-B9724E32A530}": "FeatureDataset",
+	"{70737809-852C-4A03-9E22-2CECEA5B9BFA}": "FeatureClass",
+	"{CD06BC3B-789D-4C51-AAFA-A467912B8965}": "Table",
+	"{B606A7E1-FA5B-439C-849C-6E9C2481537B}": "RelationshipClass",
+	"{8C368B12-A12E-4C7E-9638-C9C64E69E98F}": "CodedValueDomain",
+	"{C29DA988-8C3E-45F7-8B5C-18E51EE7BEB4}": "RangeDomain"
+}
+
+def get_field_type(esri_type):
+	field_type = (esri_type or "").replace("esriFieldType", "")
+	return "Guid" if field_type == "GUID" else field_type
+
+def cast_value(value, field_type):
+	if value is None:
+		return None
+	if field_type in INTEGER_TYPES:
+		return int(value)
+	if field_type in FLOAT_TYPES:
+		return float(value)
+	return value
+
+
+class GdalBackend:
+	def __init__(self, workspace):
+		self.gdal, self.ogr = require_gdal()[:2]
+		self.workspace = workspace
+		self.ds = None
+		self.items = None
+
+	def setenv(self):
+		pass
+
+	def open(self):
+		if self.ds is None:
+			self.ds = self.gdal.OpenEx(self.workspace, self.gdal.OF_VECTOR | self.gdal.OF_READONLY,
+				allowed_drivers=["OpenFileGDB"], open_options=["LIST_ALL_TABLES=YES"])
+		return self.ds
+
+	#-------------------------------------------------------------------------------
+	# Read the system catalog once: name -> {type, path, definition}
+	#
+	def get_items(self):
+		if self.items is None:
+			self.items = {}
+			for row in self.open().GetLayerByName("GDB_Items"):
+				item_type = ITEM_TYPES.get((row.GetField("Type") or "").upper())
+				definition = row.GetField("Definition")
+				if item_type is None or not definition:
+					continue
+				self.items[row.GetField("Name")] = { "type": item_type, "path": row.GetField("Path") or "",
+					"definition": ET.fromstring(definition) }
+			logging.debug( "GDB_Items: {} items".format(len(self.items)) )
+		return self.items
+
+	def get_item(self, name):
+		item = self.get_items().get(name)
+		if item is None:
+			# arcpy names are case insensitive
+			for key, value in self.get_items().items():
+				if key.lower() == name.lower():
+					return value
+		return item
+
+	def get_names(self, node, tag):
+		parent = node.find(tag)
+		if parent is None:
+			return []
+		return [n.text for n in parent.findall("Name")]
+
+	def describe(self, name):
+		desc = dict((prop, None) for prop in DESCRIBE_PROPERTIES)
+		desc["name"] = name
+		item = self.get_item(name)
+		if item is None:
+			return desc
+
+		root = item["definition"]
+		desc["dataType"] = item["type"]
+		if item["type"] in ("FeatureClass", "Table"):
+			desc["relationshipClassNames"] = self.get_names(root, "RelationshipClassNames")
+		if item["type"] == "FeatureClass":
+			desc["featureType"] = FEATURE_TYPES.get(root.findtext("FeatureType"))
+			desc["shapeType"] = SHAPE_TYPES.get(root.findtext("ShapeType"))
+		if item["type"] == "RelationshipClass":
+			desc["isAttachmentRelationship"] = root.findtext("IsAttachmentRelationship") == "true"
+			desc["originClassNames"] = self.get_names(root, "OriginClassNames")
+			desc["destinationClassNames"] = self.get_names(root, "DestinationClassNames")
+			desc["originClassKeys"] = self.get_class_keys(root)
+		return desc
+
+	#-------------------------------------------------------------------------------
+	# [[key name, role, class key name]] origin primary key first, then the
+	# origin foreign key, as arcpy reports them
+	#
+	def get_class_keys(self, root):
+		keys = []
+		parent = root.find("OriginClassKeys")
+		if parent is None:
+			return keys
+		for key in parent.findall("RelationshipClassKey"):
+			role = (key.findtext("KeyRole") or "").replace("esriRelKeyRole", "")
+			keys.append([key.findtext("ObjectKeyName"), role, key.findtext("ClassKeyName") or ""])
+		keys.sort(key=lambda k: 0 if k[1] == "OriginPrimary" else 1)
+		return keys
+
+	def list_subtypes(self, name):
+		item = self.get_item(name)
+		if item is None:
+			return {}
+		root = item["definition"]
+
+		# field level domains
+		domains = {}
+		infos = root.find("GPFieldInfoExs")
+		if infos is not None:
+			for info in infos.findall("GPFieldInfoEx"):
+				domains[info.findtext("Name")] = info.findtext("DomainName") or None
+
+		subtype_field = root.findtext("SubtypeFieldName") or ""
+		subtypes_node = root.find("Subtypes")
+		if not subtype_field or subtypes_node is None:
+			return { 0: { 'Name': name, 'Default': True, 'SubtypeField': '', 'FieldValues': domains } }
+
+		default_code = root.findtext("DefaultSubtypeCode")
+		subtypes = {}
+		for subtype in subtypes_node.findall("Subtype"):
+			code = int(subtype.findtext("SubtypeCode"))
+			field_values = dict(domains)
+			field_infos = subtype.find("FieldInfos")
+			if field_infos is not None:
+				for info in field_infos.findall("SubtypeFieldInfo"):
+					field_values[info.findtext("FieldName")] = info.findtext("DomainName") or None
+
+			subtypes[code] = {
+				'Name': subtype.findtext("SubtypeName"),
+				'Default': str(code) == default_code,
+				'SubtypeField': subtype_field,
+				'FieldValues': field_values
+			}
+		return subtypes
+
+	def list_fields(self, name):
+		item = self.get_item(name)
+		if item is None:
+			return []
+		fields = []
+		for field in item["definition"].iter("Field"):
+			fields.append( { "name": field.findtext("Name"), "type": get_field_type(field.findtext("Type")) } )
+		return fields
+
+	def list_domains(self):
+		domains = []
+		for name, item in sorted(self.get_items().items()):
+			if item["type"] not in ("CodedValueDomain", "RangeDomain"):
+				continue
+			root = item["definition"]
+			field_type = get_field_type(root.findtext("FieldType"))
+			domain = { "name": root.findtext("DomainName") or name, "fieldType": field_type,
+				"codedValues": [], "range": None }
+			if item["type"] == "CodedValueDomain":
+				domain["domainType"] = "CodedValue"
+				for coded_value in root.iter("CodedValue"):
+					domain["codedValues"].append([cast_value(coded_value.findtext("Code"), field_type),
+						coded_value.findtext("Name")])
+			else:
+				domain["domainType"] = "Range"
+				domain["range"] = [cast_value(root.findtext("MinValue"), field_type),
+					cast_value(root.findtext("MaxValue"), field_type)]
+			domains.append(domain)
+		return domains
+
+	def get_dataset(self, item):
+		parts = [p for p in item["path"].split("\\") if p]
+		return parts[0] if len(parts) > 1 else None
+
+	def list_datasets(self):
+		return sorted([name for name, item in self.get_items().items() if item["type"] == "FeatureDataset"])
+
+	def list_feature_classes(self, fds):
+		return sorted([name for name, item in self.get_items().items()
+			if item["type"] == "FeatureClass" and self.get_dataset(item) == fds])
+
+	def list_tables(self, wildcard="*"):
+		ds = self.open()
+		names = [ds.GetLayer(i).GetName() for i in range(ds.GetLayerCount())]
+		tables = [name for name in names if ds.GetLayerByName(name).GetGeomType() == self.ogr.wkbNone
+			and not name.startswith("GDB_")]
+		return sorted([t for t in tables if fnmatch.fnmatch(t.lower(), wildcard.lower())])
+
+	def get_count(self, name):
+		return self.open().GetLayerByName(name).GetFeatureCount()
@@ -0,0 +1,168 @@
+#-*- coding: UTF-8 -*-
+##
+ # batch.py
+ #
+ # Description: Convert the file geodatabases of a manifest in one process,
+ #              the conversions share their database connections and the
+ #              one-off database setup
+ # Copyright: Cartologic 2017
+ #
+ ##
+import logging, threading
+import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
+
+
+#-------------------------------------------------------------------------------
+# Manifest
+#
+#   defaults:                  options of every conversion
+#     host: localhost
+#     jobs: 4
+#   conversions:               one entry per file geodatabase
+#     - fgdb: north.gdb
+#       database: regions
+#       schema: north
+#       lookup_tables_schema: north_lookup_tables
+#     - fgdb: south.gdb
+#       database: south
+#
+# Keys are the long command line options. An entry overrides the defaults,
+# which override the command line. Returns one argument list per conversion.
+#
+def read_manifest(manifest_path):
+	from ruamel.yaml import YAML
+	with open(manifest_path, 'r') as f:
+		data = YAML().load(f) or {}
+
+	defaults = to_argv(data.get("defaults") or {})
+	conversions = []
+	for entry in data.get("conversions") or []:
+		conversions.append( defaults + to_argv(entry) )
+	return conversions
+
+def to_argv(options):
+	argv = []
+	for key, value in options.items():
+		if isinstance(value, bool):
+			value = "true" if value else "false"
+		elif isinstance(value, (list, tuple)):
+			value = ",".join([str(v) for v in value])
+		argv += [ "--%s" % key, str(value) ]
+	return argv
+
+#-------------------------------------------------------------------------------
+# Check that conversions into the same database do not share a schema (other
+# than public), create_schemas would drop the tables of the previous conversion
+# The schemas of the feature datasets are only known once a geodatabase is
+# processed, they are checked by SharedConnections.claim_schemas.
+#
+def check_conversions(conversions):
+	targets = {}
+	for args in conversions:
+		for schema in set([args.schema, args.lookup_tables_schema]):
+			if schema.lower() == "public":
+				continue
+			target = (args.host, args.port, args.database, schema.lower())
+			if target in targets:
+				logging.error( "%s and %s are both converted into %s.%s ..." % (targets[target], args.fgdb,
+					args.database, schema) )
+				return False
+			targets[target] = args.fgdb
+	return True
+
+
+#-------------------------------------------------------------------------------
+# Connections shared by the PostGIS instances of a batch: the main
+# connection and the pool of each database stay open from one conversion to
+# the next, and the database setup (create_database, update_views) runs once
+# per database
+#
+class SharedConnections:
+	def __init__(self):
+		self.conns = {}
+		self.pools = {}
+		self.done = set()
+		self.schemas = {}
+		self.lock = threading.Lock()
+
+	def is_done(self, step, dbname):
+		return (step, dbname) in self.done
+
+	def set_done(self, step, dbname):
+		with self.lock:
+			self.done.add( (step, dbname) )
+
+	#-------------------------------------------------------------------------------
+	# Claim the schemas of a conversion in a database, returns the schemas
+	# already claimed by an earlier conversion (with its name)
+	#
+	def claim_schemas(self, database, owner, schemas):
+		with self.lock:
+			claimed = self.schemas.setdefault(database, {})
+			taken = [(schema, claimed[schema]) for schema in sorted(set([s.lower() for s in schemas]))
+				if schema != "public" and claimed.get(schema, owner) != owner]
+			if not taken:
+				for schema in schemas:
+					if schema.lower() != "public":
+						claimed[schema.lower()] = owner
+			return taken
+
+	#-------------------------------------------------------------------------------
+	# A failed conversion may leave its connection in a transaction, aborted
+	# or not, it is rolled back before the next conversion uses it
+	#
+	def get_connection(self, conn_string):
+		with self.lock:
+			conn = self.conns.get(conn_string)
+			if conn is None or conn.closed:
+				conn = psycopg2.connect(conn_string)
+				self.conns[conn_string] = conn
+			elif conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+				logging.debug( "Rolling back the transaction left by the previous conversion" )
+				conn.rollback()
+			return conn
+
+	def get_pool(self, conn_string, size):
+		with self.lock:
+			pool = self.pools.get(conn_string)
+			if pool is not None and pool.maxconn < size:
+				pool.closeall()
+				pool = None
+			if pool is None:
+				pool = ThreadedConnectionPool(1, size, conn_string)
+				self.pools[conn_string] = pool
+			return pool
+
+	def close(self):
+		with self.lock:
+			for pool in self.pools.values():
+				pool.closeall()
+			for conn in self.conns.values():
+				if not conn.closed:
+					conn.close()
+			self.pools = {}
+			self.conns = {}
+
+
+#-------------------------------------------------------------------------------
+# Record a conversion in the batch report, its rows and bytes are those of
+# the layer loads
+#
+def record_conversion(batch, name, report, seconds):
+	items = [i for i in report.items if i["stage"] == "load_database"] if report is not None else []
+	rows = sum([i["rows"] for i in items if i["rows"] is not None])
+	size = sum([i["bytes"] for i in items if i["bytes"] is not None])
+	ok = report is not None and all([i["ok"] for i in report.items])
+	return batch.record(name, name, seconds, rows=rows, bytes=size, ok=ok)
+
+def log_throughput(batch):
+	data = batch.to_dict()
+	rows = sum([i["rows"] for i in data["items"]])
+	size = sum([i["bytes"] for i in data["items"]])
+	failed = [i["name"] for i in data["items"] if not i["ok"]]
+	logging.info( "batch: %d conversions, %d rows, %d bytes in %.2fs, %s rows/sec, %s bytes/sec" % (len(data["items"]),
+		rows, size, data["seconds"], batch.format_value(batch.rate(rows, data["seconds"])),
+		batch.format_value(batch.rate(size, data["seconds"]))) )
+	if failed:
+		logging.error( "batch: failed or incomplete conversions: %s" % ", ".join(failed) )
@@ -0,0 +1,83 @@
+#-*- coding: UTF-8 -*-
+##
+ # catalog.py
+ #
+ # Description: Memoized geodatabase catalog (Describe, ListSubtypes,
+ #              ListFields, ListDomains) so that the metadata phase queries
+ #              the metadata backend at most once per object
+ # Copyright: Cartologic 2017
+ #
+ ##
+import logging
+
+CATALOG_VERSION = 4
+
+
+#-------------------------------------------------------------------------------
+# get_backend returns the metadata backend, it is only called on a cache miss
+#
+class Catalog:
+	def __init__(self, get_backend):
+		self.get_backend = get_backend
+		self.descriptions = {}
+		self.subtypes = {}
+		self.fields = {}
+		self.domains = None
+
+	#-------------------------------------------------------------------------------
+	# Describe as a plain dict, see backends.DESCRIBE_PROPERTIES
+	#
+	def describe(self, name):
+		if name not in self.descriptions:
+			self.descriptions[name] = self.get_backend().describe(name)
+		return self.descriptions[name]
+
+	#-------------------------------------------------------------------------------
+	# ListSubtypes, FieldValues map each field to its domain name (or None)
+	# instead of a (default value, domain object) tuple
+	#
+	def list_subtypes(self, name):
+		if name not in self.subtypes:
+			self.subtypes[name] = self.get_backend().list_subtypes(name)
+		return self.subtypes[name]
+
+	#-------------------------------------------------------------------------------
+	# ListFields as a list of {name, type}
+	#
+	def list_fields(self, name):
+		if name not in self.fields:
+			self.fields[name] = self.get_backend().list_fields(name)
+		return self.fields[name]
+
+	#-------------------------------------------------------------------------------
+	# ListDomains as a list of {name, domainType, fieldType, codedValues, range}
+	#
+	def list_domains(self):
+		if self.domains is None:
+			self.domains = self.get_backend().list_domains()
+			logging.debug( "list_domains: {} ".format(len(self.domains)) )
+		return self.domains
+
+	#-------------------------------------------------------------------------------
+	# Serializable copy of the cached metadata
+	# subtype codes are kept as [code, subtype] pairs since json object keys
+	# are always strings
+	#
+	def dump(self):
+		return {
+			"version": CATALOG_VERSION,
+			"descriptions": self.descriptions,
+			"subtypes": dict((name, [[code, st] for code, st in subtypes.items()]) for name, subtypes in self.subtypes.items()),
+			"fields": self.fields,
+			"domains": self.domains
+		}
+
+	def load(self, data):
+		if data.get("version") != CATALOG_VERSION:
+			return False
+
+		self.descriptions = data["descriptions"]
+		self.subtypes = dict((name, dict((code, st) for code, st in pairs)) for name, pairs in data["subtypes"].items())
+		self.fields = data["fields"]
+		self.domains = data["domains"]
+		return True
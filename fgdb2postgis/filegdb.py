@@ -10,42 +10,57 @@
  # Copyright: Cartologic 2017
  #
  ##
-import os, logging, sys, traceback, copy
-# import yaml
-from ruamel.yaml import YAML
+import os, logging, sys, traceback, copy, json
 
 from os import path
-
-# locate and import arcpy
-try:
-	import archook
-	archook.get_arcpy()
-	import arcpy
-except ImportError:
-	logging.debug( "Unable to locate arcpy module...")
-	exit(1)
-
-yaml = YAML()
+from .inventory import Inventory
+from .gdalimport import gdal_available
+from .catalog import Catalog
+from .backends import get_backend, cast_value
+from .sqlunits import SqlScript
+
+#-------------------------------------------------------------------------------
+# ruamel.yaml is imported when the yaml file is read or written
+#
+def get_yaml():
+	from ruamel.yaml import YAML
+	return YAML()
 
 class FileGDB:
-	def __init__(self, workspace, include_empty, lookup_tables_schema):
+	def __init__(self, workspace, include_empty, lookup_tables_schema, inventory="arcpy", jobs=1, catalog_cache=True,
+			backend="arcpy", write_sql=True, default_schema="public"):
 		self.workspace = workspace
 		self.include_empty = include_empty
 		self.lookup_tables_schema = lookup_tables_schema
+		self.inventory = inventory
+		self.jobs = jobs
+		self.catalog_cache = catalog_cache
+		self.write_sql = write_sql
+		self.default_schema = default_schema.lower()
+		self.inventory_snapshot = None
+		self.inventory_items = None
+		self.backend_name = backend
+		self.backend = None
+		self.catalog = Catalog(self.open_backend)
 		self.workspace_path = ""
 		self.sqlfolder_path = ""
 		self.yamlfile_path = ""
+		self.catalogfile_path = ""
+		self.reportfile_path = ""
+		self.journalfile_path = ""
 		self.schemas = []
 		self.feature_datasets = {}
 		self.feature_classes = {}
 		self.tables = {}
 		self.indexes = []
 		self.constraints = []
+		self.foreign_key_constraints = []
+		self.materialized_views = []
 		self.datasets = []
+		self.scripts = {}
 		self.lookup_prefix = "lut_"
 		self.info()
 		self.init_paths()
-		self.setenv()
 		
 		
 	#-------------------------------------------------------------------------------
@@ -60,13 +75,22 @@ class FileGDB:
 		# sqlfolder, yamlfile path
 		sqlfolder_base = "%s.sql" % workspace_base
 		yamlfile_base = "%s.yml" % workspace_base
+		catalogfile_base = "%s.catalog.json" % workspace_base
+		reportfile_base = "%s.report.json" % workspace_base
+		journalfile_base = "%s.journal" % workspace_base
 		sqlfolder_path = path.join(workspace_dir, sqlfolder_base)
 		yamlfile_path = path.join(workspace_dir, yamlfile_base)
+		catalogfile_path = path.join(workspace_dir, catalogfile_base)
+		reportfile_path = path.join(workspace_dir, reportfile_base)
+		journalfile_path = path.join(workspace_dir, journalfile_base)
 
 		# set current object instance props
 		self.workspace_path = workspace_path
 		self.sqlfolder_path = sqlfolder_path
 		self.yamlfile_path = yamlfile_path
+		self.catalogfile_path = catalogfile_path
+		self.reportfile_path = reportfile_path
+		self.journalfile_path = journalfile_path
 
 
 	def info(self):
@@ -75,37 +99,50 @@ class FileGDB:
 		logging.debug( " Sqlfolder: %s" % self.sqlfolder_path )
 		logging.debug( " Yamlfile: %s" % self.yamlfile_path )
 
-	def setenv(self):
-		logging.debug( "Setting arcpy environment ..." )
-		arcpy.env.workspace = self.workspace
-		arcpy.env.overwriteOutput = True
+	#-------------------------------------------------------------------------------
+	# The metadata backend (arcpy or GDAL) is created on the first catalog miss,
+	# a valid cached catalog is reused without importing arcpy
+	#
+	def open_backend(self):
+		if self.backend is None:
+			self.backend = get_backend(self.backend_name, self.workspace)
+			self.backend.setenv()
+		return self.backend
 
 	def process(self):
 		try:
 			self.init()
 			self.parse_yaml()
-			self.open_files()
+			self.create_scripts()
 			self.process_schemas()
 			self.process_domains()
 			self.process_subtypes()
 			self.process_relations()
 			self.process_materialized_views()
-			self.close_files()
+			self.save_scripts()
 		except Exception as e:
 			logging.error(e)
 			tb = sys.exc_info()[2]
 			tbinfo = traceback.format_tb(tb)[0]
 			logging.error( tbinfo )
+			# half built scripts would load the data without its constraints and views
+			raise
 
 	def init(self):
 		logging.debug("init..." )
-		self.datasets = {} 
-		ds = self.get_feature_datasets()
-		for d in ds:
-			self.datasets[d] = self.get_feature_classes(d) 
+		if not self.load_catalog():
+			self.datasets = {} 
+			ds = self.get_feature_datasets()
+			for d in ds:
+				self.datasets[d] = self.get_feature_classes(d) 
+
+			self.tables_list = self.get_tables()
+			self.standalone_features = self.get_feature_classes(None) 
+
+			# keep a pristine copy, feat dicts get schemas and foreign keys later on
+			self.inventory_snapshot = copy.deepcopy( { "datasets": self.datasets,
+				"tables_list": self.tables_list, "standalone_features": self.standalone_features } )
 
-		self.tables_list = self.get_tables()
-		self.standalone_features = self.get_feature_classes(None) 
 		self.domain_tables = []
 
 		logging.debug("tables_list: {} ".format(  self.tables_list ) )
@@ -123,7 +160,7 @@ class FileGDB:
 			self.create_yaml()
 
 		with open(self.yamlfile_path, 'r') as ymlfile:
-			data_map = yaml.load(ymlfile)
+			data_map = get_yaml().load(ymlfile)
 
 			for key_type, value_items in data_map.items():
 				if (key_type == "Schemas"):
@@ -139,37 +176,48 @@ class FileGDB:
 		if self.lookup_tables_schema not in self.schemas:
 			self.schemas.append(self.lookup_tables_schema)
 
+		# schema of the tables and feature classes the yaml file leaves in public
+		if self.default_schema != "public" and self.default_schema not in [s.lower() for s in self.schemas]:
+			self.schemas.append(self.default_schema)
+
 	#-------------------------------------------------------------------------------
-	# Open sql files
+	# Create the sql scripts, they are kept in memory for PostGIS
 	#
-	def open_files(self):
-		logging.debug( "Initializing sql files ..." )
-
-		if not path.exists(self.sqlfolder_path):
-			os.mkdir(self.sqlfolder_path)
+	def create_scripts(self):
+		logging.debug( "Initializing sql scripts ..." )
 
-		self.f_create_schemas = open(path.join(self.sqlfolder_path, "create_schemas.sql"), "w")
-		self.f_split_schemas = open(path.join(self.sqlfolder_path, "split_schemas.sql"), "w")
-		self.f_create_indexes = open(path.join(self.sqlfolder_path, "create_indexes.sql"), "w")
-		self.f_create_constraints = open(path.join(self.sqlfolder_path, "create_constraints.sql"), "w")
-		self.f_find_data_errors = open(path.join(self.sqlfolder_path, "find_data_errors.sql"), "w")
-		self.f_fix_data_errors = open(path.join(self.sqlfolder_path, "fix_data_errors.sql"), "w")
-		self.f_views = open(path.join(self.sqlfolder_path, "views.sql"), "w")
+		self.f_create_schemas = self.create_script("create_schemas")
+		self.f_split_schemas = self.create_script("split_schemas")
+		self.f_create_indexes = self.create_script("create_indexes")
+		self.f_create_constraints = self.create_script("create_constraints")
+		self.f_find_data_errors = self.create_script("find_data_errors")
+		self.f_fix_data_errors = self.create_script("fix_data_errors")
+		self.f_views = self.create_script("views")
 
 		self.write_headers()
 
+	def create_script(self, name):
+		self.scripts[name] = SqlScript(name)
+		return self.scripts[name]
+
+	def get_statements(self, name):
+		if name not in self.scripts:
+			return []
+		return self.scripts[name].get_statements()
+
 	#-------------------------------------------------------------------------------
-	# close sql files
+	# Save the sql scripts to the sql folder, unless --write_sql is off
 	#
-	def close_files(self):
-		logging.debug( "Closing sql files ...")
-		self.f_create_schemas.close()
-		self.f_split_schemas.close()
-		self.f_create_indexes.close()
-		self.f_create_constraints.close()
-		self.f_find_data_errors.close()
-		self.f_fix_data_errors.close()
-		self.f_views.close()
+	def save_scripts(self):
+		if not self.write_sql:
+			return
+
+		logging.debug( "Saving sql files ...")
+		if not path.exists(self.sqlfolder_path):
+			os.mkdir(self.sqlfolder_path)
+
+		for name, script in self.scripts.items():
+			script.save(path.join(self.sqlfolder_path, "%s.sql" % name))
 
 	#-------------------------------------------------------------------------------
 	# Process domains
@@ -184,7 +232,7 @@ class FileGDB:
 		self.write_it(self.f_split_schemas, "\n-- Domains")
 
 		## create table for each domain
-		domains_list = arcpy.da.ListDomains(self.workspace)
+		domains_list = self.catalog.list_domains()
 		for domain in domains_list:
 			self.create_domain_table(domain)
 
@@ -209,9 +257,10 @@ class FileGDB:
 
 	#-------------------------------------------------------------------------------
 	# Create domain table (list of values)
+	# The rows are kept in memory, PostGIS writes them with COPY
 	#
 	def create_domain_table(self, domain):
-		domain_name = domain.name.replace(" ", "")
+		domain_name = domain["name"].replace(" ", "")
 		logging.debug( "create_domain_table: {} ".format(domain_name))
 		domain_table = "{}{}".format(self.lookup_prefix , domain_name.lower() ) 
 
@@ -220,11 +269,12 @@ class FileGDB:
 
 		logging.debug( " %s" % domain_table )
 
-		if not arcpy.Exists(domain_table):
-			arcpy.DomainToTable_management(self.workspace, domain.name, domain_table, domain_field, domain_field_desc)
+		rows = [[cast_value(code, domain["fieldType"]), desc] for code, desc in domain["codedValues"]]
 
 		# create index
-		dom = { "feature":domain_table,  "type": "table" , "schema" : self.lookup_tables_schema   }
+		dom = { "feature":domain_table,  "type": "table" , "schema" : self.lookup_tables_schema,
+			"columns": [(domain_field, domain["fieldType"]), (domain_field_desc, "String")],
+			"rows": rows, "count": len(rows) }
 		self.domain_tables.append( dom ) 
 		self.create_index(domain_table, domain_field, self.lookup_tables_schema )
 		#self.split_schemas(dom, self.lookup_tables_schema)
@@ -238,10 +288,10 @@ class FileGDB:
 		dmcode = "Code"
 		dmcode_desc = "Description"
 
-		subtypes = arcpy.da.ListSubtypes(layer)
+		subtypes = self.catalog.list_subtypes(layer)
 
-		for stcode, v1 in subtypes.iteritems():
-			for k2, v2 in v1.iteritems():
+		for stcode, v1 in subtypes.items():
+			for k2, v2 in v1.items():
 				if k2 == 'Default':
 					stdefault = v2
 
@@ -257,9 +307,9 @@ class FileGDB:
 						sttable = '--'
 
 				elif k2 == 'FieldValues':
-					for dmfield, v3 in v2.iteritems():
-						if v3[1] is not None:
-							dmtable = self.lookup_prefix + v3[1].name
+					for dmfield, v3 in v2.items():
+						if v3 is not None:
+							dmtable = self.lookup_prefix + v3
 							self.create_foreign_key_constraint(fc, dmfield, dmtable, dmcode)
 
 
@@ -276,7 +326,7 @@ class FileGDB:
 
 		# create subtypes table for tables
 		for table in self.tables_list:
-			self.create_subtypes_table(  { "feature":table,  "type": "table"   }   )
+			self.create_subtypes_table(table)
 
 		# create subtypes table for stand-alone featureclasses
 		for fc in self.standalone_features:
@@ -289,53 +339,43 @@ class FileGDB:
 				self.create_subtypes_table(f)
 
 	#-------------------------------------------------------------------------------
-	# Create subtypes table for layer/field and insert records (list of values)
+	# Create subtypes table for layer/field and its records (list of values)
+	# The rows are kept in memory, PostGIS writes them with COPY
 	#
 	def create_subtypes_table(self, fc):
 		logging.debug("create_subtypes_table : {}".format(fc) )
 		layer = fc["feature"]
-		subtypes_dict = arcpy.da.ListSubtypes(layer)
+		subtypes_dict = self.catalog.list_subtypes(layer)
 
-		subtype_fields = {key: value['SubtypeField'] for key, value in subtypes_dict.iteritems()}
-		subtype_values = {key: value['Name'] for key, value in subtypes_dict.iteritems()}
+		subtype_fields = {key: value['SubtypeField'] for key, value in subtypes_dict.items()}
+		subtype_values = {key: value['Name'] for key, value in subtypes_dict.items()}
 
-		key, field = subtype_fields.items()[0]
+		key, field = list(subtype_fields.items())[0]
 
 		if len(field) > 0:
 
 			# find subtype field type
 			field_type = None
-			for f in arcpy.ListFields(layer):
-				if f.name == field:
-					field_type = f.type
+			for f in self.catalog.list_fields(layer):
+				if f["name"] == field:
+					field_type = f["type"]
 
 			# convert field to upper case and try again if not found
 			if field_type == None:	
 				field = field.upper()
-				for f in arcpy.ListFields(layer):
-					if f.name.upper() == field:
-						field_type = f.type
+				for f in self.catalog.list_fields(layer):
+					if f["name"].upper() == field:
+						field_type = f["type"]
 
 			subtypes_table = "{}{}_{}".format(self.lookup_prefix, layer, field).lower()
 			logging.debug( " %s" % subtypes_table) 
 
-			if not arcpy.Exists(subtypes_table):
-				# create subtypes table
-				arcpy.CreateTable_management(self.workspace, subtypes_table)
-				arcpy.AddField_management(subtypes_table, field, field_type)
-				arcpy.AddField_management(subtypes_table, "Description", "String")
-
-				# insert records (list of values)
-				cur = arcpy.da.InsertCursor(subtypes_table, "*")
-				oid = 1
-				for code, desc in subtype_values.iteritems():
-					# print "  %s %s" % (code, desc)
-					cur.insertRow([oid, code, desc])
-					oid += 1
-
-				del cur
+			# subtype codes are integers, cached catalogs turn them into strings
+			field_type = field_type or "Integer"
+			rows = [[cast_value(code, field_type), desc] for code, desc in subtype_values.items()]
 
-			subt = { "feature":subtypes_table,  "type": "table" , "schema" : self.lookup_tables_schema   }
+			subt = { "feature":subtypes_table,  "type": "table" , "schema" : self.lookup_tables_schema,
+				"columns": [(field, field_type), ("Description", "String")], "rows": rows, "count": len(rows) }
 			self.domain_tables.append(subt)
 			
 			self.create_index(subtypes_table, field, self.lookup_tables_schema )
@@ -374,11 +414,17 @@ class FileGDB:
 			counter += 1
 
 		query = sql_select + sql_from
-		sql = 'CREATE MATERIALIZED VIEW {}.{}_mv AS \n {} \n WITH  DATA;\n'.format(fc["schema"], fc["feature"].lower(), query)
+		# created empty, populated in parallel by the refresh tasks of PostGIS.add_view_tasks
+		sql = 'DROP MATERIALIZED VIEW IF EXISTS {}.{}_mv;\n'.format(fc["schema"], fc["feature"].lower())
+		sql += 'CREATE MATERIALIZED VIEW {}.{}_mv AS \n {} \n WITH NO DATA;\n'.format(fc["schema"], fc["feature"].lower(), query)
 		#logging.debug( "sql: {} ".format(sql)  )
 		self.write_it(self.f_views, "\n-- Feature")
 		self.write_it(self.f_views, sql)
 
+		table = "{}.{}".format(fc["schema"], fc["feature"].lower())
+		self.materialized_views.append( { "name": table + "_mv", "table": table, "count": fc["count"],
+			"depends": [table] + [fk["parent_table"] for fk in fc["foreign_keys"]] } )
+
 
 
 	#-------------------------------------------------------------------------------
@@ -396,17 +442,24 @@ class FileGDB:
 		logging.debug( "relClassSet: {} ".format(relClassSet) )
 
 		for relClass in relClassSet:
-			rel = arcpy.Describe(relClass)
-			if rel.isAttachmentRelationship:
+			rel = self.catalog.describe(relClass)
+			if rel["isAttachmentRelationship"]:
 				continue
 			
-			rel_origin_table = rel.originClassNames[0]
-			rel_destination_table = rel.destinationClassNames[0]
+			rel_origin_table = rel["originClassNames"][0]
+			rel_destination_table = rel["destinationClassNames"][0]
 
 			logging.debug( " rel_origin_table : {} , rel_destination_table : {}".format(rel_origin_table, rel_destination_table) )
+
+			# both ends must be converted, empty tables are left out unless --include_empty
+			origin = self.get_item(rel_origin_table)
+			fc = self.get_item(rel_destination_table)
+			if origin is None or fc is None:
+				logging.debug( " skipping %s, %s or %s is not converted" % (rel["name"], rel_origin_table, rel_destination_table) )
+				continue
 			
 			rel_primary_key = "id"
-			rel_foreign_key = rel.originClassKeys[1][0]
+			rel_foreign_key = rel["originClassKeys"][1][0]
 
 			# convert primary/foreign key to uppercase if not found
 			# if rel_primary_key not in [field.name for field in arcpy.ListFields(rel_origin_table)]:
@@ -415,30 +468,28 @@ class FileGDB:
 			# if rel_foreign_key not in [field.name for field in arcpy.ListFields(rel_destination_table)]:
 			# 	rel_foreign_key = rel.originClassKeys[1][0].upper()
 
-			logging.debug(  rel.name )
-			logging.error( "TODO " )
+			logging.debug(  rel["name"] )
 			# print " %s -> %s" % (rel_origin_table, rel_destination_table)
-			# TODO TEST
-			fc = {}
-			fc["schema"] = ""
-			fc["feature"] = rel_destination_table
 
-			self.create_index(rel_origin_table, rel_primary_key, self.lookup_tables_schema )
-			self.create_foreign_key_constraint(fc, rel_foreign_key, rel_origin_table, rel_primary_key)
+			self.create_index(rel_origin_table, rel_primary_key, origin["schema"] )
+			self.create_foreign_key_constraint(fc, rel_foreign_key, rel_origin_table, rel_primary_key, origin["schema"])
+
+			rel_origin_table = "%s.%s" % (origin["schema"], origin["feature"])
+			rel_destination_table = "%s.%s" % (fc["schema"], fc["feature"])
 
 			# prcess data errors (fk)
 			str_data_errors_fk = '\\echo %s (%s) -> %s (%s);' % (rel_destination_table, rel_foreign_key, rel_origin_table, rel_primary_key)
 			self.write_it(self.f_find_data_errors, str_data_errors_fk)
 
-			str_data_errors = 'SELECT COUNT(*) FROM "%s" dest WHERE NOT EXISTS (SELECT 1 FROM "%s" orig WHERE dest."%s" = orig."%s");'
+			str_data_errors = 'SELECT COUNT(*) FROM %s dest WHERE NOT EXISTS (SELECT 1 FROM %s orig WHERE dest."%s" = orig."%s");'
 			str_data_errors = str_data_errors % (rel_destination_table, rel_origin_table, rel_foreign_key, rel_primary_key)
 			str_data_errors = str_data_errors.lower()
 
 			self.write_it(self.f_find_data_errors, str_data_errors)
 
-			str_fix_errors_1 = 'INSERT INTO "%s" ("%s")' % (rel_origin_table, rel_primary_key)
+			str_fix_errors_1 = 'INSERT INTO %s ("%s")' % (rel_origin_table, rel_primary_key)
 			str_fix_errors_1 = str_fix_errors_1.lower()
-			str_fix_errors_2 = 'SELECT DISTINCT detail."%s" \n  FROM "%s" AS detail \n LEFT JOIN "%s" AS master ON detail."%s" = master."%s" \n WHERE master.id IS NULL;\n'
+			str_fix_errors_2 = 'SELECT DISTINCT detail."%s" \n  FROM %s AS detail \n LEFT JOIN %s AS master ON detail."%s" = master."%s" \n WHERE master.id IS NULL;\n'
 			str_fix_errors_2 = str_fix_errors_2 % (rel_foreign_key, rel_destination_table, rel_origin_table, rel_foreign_key, rel_primary_key)
 			str_fix_errors_2 = str_fix_errors_2.lower()
 
@@ -467,20 +518,20 @@ class FileGDB:
 		relClasses = set()
 		for i, fc in enumerate(fc_list):
 			#logging.debug(fc)
-			desc = arcpy.Describe(fc["feature"])
-			#logging.debug(desc.dataType)
+			desc = self.catalog.describe(fc["feature"])
+			#logging.debug(desc["dataType"])
 			# ignore annotations
-			if desc.dataType in ('FeatureClass', 'Table'):
-				for j,rel in enumerate(desc.relationshipClassNames):
-					r = arcpy.Describe(rel)
-					rel_origin_table = r.originClassNames[0]
-					rel_destination_table = r.destinationClassNames[0]
+			if desc["dataType"] in ('FeatureClass', 'Table'):
+				for j,rel in enumerate(desc["relationshipClassNames"] or []):
+					r = self.catalog.describe(rel)
+					rel_origin_table = r["originClassNames"][0]
+					rel_destination_table = r["destinationClassNames"][0]
 					logging.debug( "origin_table : {} , destination_table : {}".format(rel_origin_table,
 						 rel_destination_table) )
 
-					desc_destination = arcpy.Describe(rel_destination_table)
-					logging.debug("desc_destination.featureType: {} ".format( desc_destination.featureType) )
-					if desc_destination.featureType not in ('Simple'):
+					desc_destination = self.catalog.describe(rel_destination_table)
+					logging.debug("desc_destination.featureType: {} ".format( desc_destination["featureType"]) )
+					if desc_destination["featureType"] != 'Simple':
 						continue
 					relClasses.add(rel)
 
@@ -510,6 +561,10 @@ class FileGDB:
 			self.write_it(self.f_create_schemas, str_drop_schema)
 			self.write_it(self.f_create_schemas, str_create_schema)
 
+		# tables and feature classes not mapped by the yaml file go to the default schema
+		for item in self.get_items():
+			item["schema"] = self.default_schema
+
 		# split feature classes within feature datasets to schemas
 		self.write_it(self.f_split_schemas, "\n-- FeatureDatasets:")
 		logging.debug( " FeatureDatasets" )
@@ -533,22 +588,22 @@ class FileGDB:
 			if schema == 'public':
 				continue
 
-			for fc in fcs:
-				if arcpy.Exists(fc):
-					feat = [x for x in self.standalone_features if x["feature"] == fc][0]
-					feat["schema"] = schema
+			for fc in fcs or []:
+				feats = [x for x in self.standalone_features if x["feature"] == fc]
+				if feats:
+					feats[0]["schema"] = schema.lower()
 					#self.split_schemas(fc, schema)
 
 		# split tables to schemas
-		# self.write_it(self.f_split_schemas, "\n-- Tables:")
-		# logging.debug( " Tables" )
-		# for schema, tables in self.tables.items():
-		# 	if schema == 'public':
-		# 		continue
+		logging.debug( " Tables" )
+		for schema, tables in self.tables.items():
+			if schema == 'public':
+				continue
 
-		# 	for table in tables:
-		# 		if arcpy.Exists(table):
-		# 			self.split_schemas(table, schema)
+			for table in tables or []:
+				items = [x for x in self.tables_list if x["feature"] == table]
+				if items:
+					items[0]["schema"] = schema.lower()
 
 	#-------------------------------------------------------------------------------
 	# Compose and write sql to alter the schema of a table
@@ -567,13 +622,15 @@ class FileGDB:
 
 		if idx_name not in self.indexes:
 			self.indexes.append(idx_name)
-			str_index = "CREATE UNIQUE INDEX {} ON {}.{}  ({}); \n".format (idx_name,schema,table.lower(), field.lower())
+			str_index = "CREATE UNIQUE INDEX IF NOT EXISTS {} ON {}.{}  ({}); \n".format (idx_name,schema,table.lower(), field.lower())
 			self.write_it(self.f_create_indexes, str_index)
 
 	#-------------------------------------------------------------------------------
 	# Create foreign key constraints
+	# table_master is a lookup table unless schema_master is given, only
+	# lookup tables are labelled by the materialized views
 	#
-	def create_foreign_key_constraint(self, fc, fkey, table_master, pkey):
+	def create_foreign_key_constraint(self, fc, fkey, table_master, pkey, schema_master=None):
 		logging.debug( "**Feature:{}**".format(fc["feature"]))
 		schema = fc["schema"]
 		table_details =  fc["feature"].lower()
@@ -587,13 +644,19 @@ class FileGDB:
 
 		if fkey_name not in self.constraints:
 			self.constraints.append(fkey_name)
-			str_constraint = 'ALTER TABLE {}.{} ADD CONSTRAINT {} FOREIGN KEY ({}) REFERENCES {}.{} ({}) NOT VALID; \n'
-			str_constraint = str_constraint.format(schema, table_details.lower(), fkey_name, fkey,
-					self.lookup_tables_schema,  table_master, pkey)
+			# drop first so that the script can be re-applied on incremental loads
+			str_constraint = 'ALTER TABLE {}.{} DROP CONSTRAINT IF EXISTS {}; \n'
+			str_constraint += 'ALTER TABLE {}.{} ADD CONSTRAINT {} FOREIGN KEY ({}) REFERENCES {}.{} ({}) NOT VALID; \n'
+			str_constraint = str_constraint.format(schema, table_details.lower(), fkey_name,
+					schema, table_details.lower(), fkey_name, fkey,
+					schema_master or self.lookup_tables_schema,  table_master, pkey)
 			self.write_it(self.f_create_constraints, str_constraint)
+			self.foreign_key_constraints.append( { "name": fkey_name, "table": "{}.{}".format(schema, table_details),
+				"parent": "{}.{}".format(schema_master or self.lookup_tables_schema, table_master) } )
 
-			fc["foreign_keys"].append( { "field": fkey, 
-				"parent_table" :  self.lookup_tables_schema+"."+table_master,	"pkey" : pkey  }  )
+			if schema_master is None:
+					fc["foreign_keys"].append( { "field": fkey, 
+					"parent_table" :  self.lookup_tables_schema+"."+table_master,	"pkey" : pkey  }  )
 			
 
 	#-------------------------------------------------------------------------------
@@ -609,7 +672,7 @@ class FileGDB:
 		self.write_it(self.f_fix_data_errors, str_message)
 
 	#-------------------------------------------------------------------------------
-	# Write string to given open file
+	# Write string to given sql script
 	#
 	def write_it(self, out_file, string):
 		out_file.write(string + "\n")
@@ -623,16 +686,16 @@ class FileGDB:
 			fcdict = {'FeatureClasses': {}}
 			tablesdict = {'Tables': {}}
 
+			# --yml runs before process(), the inventory is not loaded yet
+			if self.inventory_snapshot is None:
+				self.init()
+
 			# feature datasets
-			fdslist = self.get_feature_datasets()
-			if fdslist != None:
-				fdslist.sort()
-				for fds in fdslist:
-					fdsdict['FeatureDatasets'].update({fds: [fds]})
+			fdslist = sorted(self.datasets.keys())
+			for fds in fdslist:
+				fdsdict['FeatureDatasets'].update({fds: [fds]})
 
 			# featureclasses in root
-			if not  hasattr(self, 'standalone_features'):
-				self.standalone_features = self.get_feature_classes(None) 
 			fclist =[]
 			if fdslist != self.standalone_features:
 				for f in self.standalone_features:
@@ -640,13 +703,12 @@ class FileGDB:
 			fcdict['FeatureClasses'].update({'public': fclist})
 
 			# tables
-			if not  hasattr(self, 'tables_list'):
-				self.tables_list = self.get_tables()
-			tablesdict['Tables'].update({'public': self.tables_list})
+			tablesdict['Tables'].update({'public': [t["feature"] for t in self.tables_list]})
 
 			# schemas
 			schemasdict.update({'Schemas': fdslist})
 
+			yaml = get_yaml()
 			with open(self.yamlfile_path, 'w') as outfile:
 				yaml.dump(schemasdict, outfile)
 
@@ -669,7 +731,10 @@ class FileGDB:
 	'''
 	def get_feature_datasets(self):
 		logging.debug("get_feature_datasets")
-		fdslist = arcpy.ListDatasets("*", "Feature")
+		if self.inventory == "ogr":
+			fdslist = list(set([x["dataset"] for x in self.get_inventory() if x["dataset"]]))
+		else:
+			fdslist = self.open_backend().list_datasets()
 		fdslist.sort()
 		logging.debug(fdslist )
 		return fdslist
@@ -679,14 +744,16 @@ class FileGDB:
 	'''
 	def get_feature_classes(self, fds):
 		logging.debug("get_feature_classes")
-		fclist = arcpy.ListFeatureClasses("*", "", fds)
+		if self.inventory == "ogr":
+			return self.get_inventory_feature_classes(fds)
+
+		fclist = self.open_backend().list_feature_classes(fds)
 		features = []
 		for f in fclist:
-			feature_desc = arcpy.Describe(f)	
-			feature_type = feature_desc.featureType
-			shapeType =  feature_desc.shapeType
-			result = arcpy.GetCount_management(f)
-			count = int(result.getOutput(0))
+			feature_desc = self.catalog.describe(f)
+			feature_type = feature_desc["featureType"]
+			shapeType =  feature_desc["shapeType"]
+			count = self.open_backend().get_count(f)
 			#logging.debug("Feature: {} , Count: {}, feature_type: {}, shapeType: {}  ".format(  f, count , feature_type , shapeType))
 
 			if count == 0 and not  self.include_empty:
@@ -709,18 +776,20 @@ class FileGDB:
 	'''
 	def get_tables(self):
 		logging.debug("get_tables")
-		tableslist = arcpy.ListTables("*")
+		if self.inventory == "ogr":
+			return self.get_inventory_tables()
+
+		tableslist = self.open_backend().list_tables("*")
 		tables = []
 		for t in tableslist:
-			result = arcpy.GetCount_management(t)
-			count = int(result.getOutput(0))
+			count = self.open_backend().get_count(t)
 			#logging.debug("Table: {} , Count: {} ".format( t, count  ))
 			if t.startswith(self.lookup_prefix):
 				continue
 			if count == 0 and not  self.include_empty:
 				continue
-			feat = { "feature":t, "count": count,  "type": "table"   }
-			tables.append(t)
+			feat = { "feature":t, "count": count,  "type": "table", "foreign_keys": []   }
+			tables.append(feat)
 
 		tables.sort(key=lambda x: x["feature"] )
 		logging.debug(tables )
@@ -728,10 +797,146 @@ class FileGDB:
 
 
 	'''
+	Tables, standalone feature classes and feature classes of the datasets
+	'''
+	def get_items(self):
+		items = list(self.tables_list) + list(self.standalone_features)
+		for fds in sorted(self.datasets):
+			items += self.datasets[fds]
+		return items
+
+	'''
+	Converted table or feature class of the given name, None if it is not
+	converted (arcpy names are case insensitive)
+	'''
+	def get_item(self, name):
+		for item in self.get_items():
+			if item["feature"].lower() == name.lower():
+				return item
+		return None
+
+	'''
+	Metadata-only inventory (OGR OpenFileGDB), scanned once and shared by
+	get_feature_datasets, get_feature_classes and get_tables
+	'''
+	def get_inventory(self):
+		if self.inventory_items is None:
+			self.inventory_items = Inventory(self.workspace, self.jobs).scan()
+		return self.inventory_items
+
+	'''
+	Per layer fingerprints used by incremental loads, see Inventory.fingerprints
+	'''
+	def get_fingerprints(self, names):
+		return Inventory(self.workspace, self.jobs).fingerprints(names)
+
+	'''
+	On-disk size of each table (.gdbtable file), empty without GDAL
+	'''
+	def get_table_sizes(self):
+		if not gdal_available():
+			return {}
+		sizes = {}
+		for name, table_file in Inventory(self.workspace, self.jobs).get_table_files().items():
+			if path.exists(table_file):
+				sizes[name] = path.getsize(table_file)
+		return sizes
+
+	def get_inventory_feature_classes(self, fds):
+		features = []
+		for item in self.get_inventory():
+			if item["type"] != "feature_class" or item["dataset"] != fds:
+				continue
+
+			if item["count"] == 0 and not  self.include_empty:
+				continue
+
+			if item["feature_type"] != 'Simple':
+				continue
+
+			feat = { "feature":item["feature"], "count": item["count"], "feature_type":item["feature_type"],
+					"shapeType" :item["shapeType"], "type": "feature_class", "dataset": fds, "foreign_keys": []     }
+			features.append(feat)
+
+		features.sort(key=lambda x: x["feature"] )
+		logging.debug(features )
+		return features
 
+	def get_inventory_tables(self):
+		tables = []
+		for item in self.get_inventory():
+			if item["type"] != "table":
+				continue
+			if item["feature"].startswith(self.lookup_prefix):
+				continue
+			if item["count"] == 0 and not  self.include_empty:
+				continue
+			tables.append( { "feature":item["feature"], "count": item["count"], "type": "table", "foreign_keys": [] } )
+
+		tables.sort(key=lambda x: x["feature"] )
+		logging.debug(tables )
+		return tables
+
+	#-------------------------------------------------------------------------------
+	# Persistent catalog
+	# The inventory and the cached backend metadata are stored next to the yml
+	# file and reused as long as the files of the geodatabase are unchanged
+	#
+	def get_workspace_fingerprint(self):
+		files = []
+		for name in sorted(os.listdir(self.workspace_path)):
+			if name.endswith(".lock"):
+				continue
+			st = os.stat(path.join(self.workspace_path, name))
+			files.append([name, st.st_size, int(st.st_mtime)])
+		return files
+
+	def load_catalog(self):
+		if not self.catalog_cache or not path.exists(self.catalogfile_path):
+			return False
+
+		try:
+			with open(self.catalogfile_path, 'r') as f:
+				data = json.load(f)
+		except ValueError as e:
+			logging.debug( "Ignoring unreadable catalog %s: %s" % (self.catalogfile_path, e) )
+			return False
+
+		if data.get("workspace") != self.workspace_path or \
+				data.get("fingerprint") != self.get_workspace_fingerprint() or \
+				data.get("include_empty") != self.include_empty:
+			logging.debug( "Catalog is out of date: %s" % self.catalogfile_path )
+			return False
+
+		if not self.catalog.load(data["catalog"]):
+			return False
+
+		logging.debug( "Loading catalog %s ..." % self.catalogfile_path )
+		self.inventory_snapshot = data["inventory"]
+		inventory = copy.deepcopy(self.inventory_snapshot)
+		self.datasets = inventory["datasets"]
+		self.tables_list = inventory["tables_list"]
+		self.standalone_features = inventory["standalone_features"]
+		return True
+
+	def save_catalog(self):
+		if not self.catalog_cache or self.inventory_snapshot is None:
+			return
+
+		logging.debug( "Saving catalog %s ..." % self.catalogfile_path )
+		data = {
+			"workspace": self.workspace_path,
+			"fingerprint": self.get_workspace_fingerprint(),
+			"include_empty": self.include_empty,
+			"inventory": self.inventory_snapshot,
+			"catalog": self.catalog.dump()
+		}
+		with open(self.catalogfile_path, 'w') as f:
+			json.dump(data, f)
+
+	'''
+	Lookup tables are no longer written to the geodatabase, only the catalog
+	is left to save
 	'''
 	def cleanup(self):
-		logging.debug("Cleanup temporary lookup tables...")
-		lutslist = arcpy.ListTables(self.lookup_prefix+"*")
-		for lut in lutslist:
-			arcpy.Delete_management(lut)
\ No newline at end of file
+		self.save_catalog()
\ No newline at end of file
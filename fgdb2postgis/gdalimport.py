@@ -0,0 +1,37 @@
+#-*- coding: UTF-8 -*-
+##
+ # gdalimport.py
+ #
+ # Description: Import the GDAL python bindings (osgeo) on first use, they
+ #              are slow to load and not needed by every run (arcpy
+ #              backend, ogr2ogr engine)
+ # Copyright: Cartologic 2017
+ #
+ ##
+import sys, logging
+
+# set by gdal_available
+gdal = ogr = osr = None
+
+
+#-------------------------------------------------------------------------------
+# Import gdal, ogr and osr once, False when the bindings are not installed
+#
+def gdal_available():
+	global gdal, ogr, osr
+	if gdal is None:
+		try:
+			from osgeo import gdal, ogr, osr
+		except ImportError:
+			return False
+		gdal.UseExceptions()
+	return True
+
+#-------------------------------------------------------------------------------
+# (gdal, ogr, osr) for the classes that cannot work without them
+#
+def require_gdal():
+	if not gdal_available():
+		logging.error( "Unable to locate the GDAL python bindings (osgeo) ..." )
+		sys.exit(1)
+	return gdal, ogr, osr
@@ -0,0 +1,149 @@
+#-*- coding: UTF-8 -*-
+##
+ # inventory.py
+ #
+ # Description: Fast inventory of the feature classes and tables of a file
+ #              geodatabase from metadata only (OGR OpenFileGDB driver), as
+ #              a replacement for arcpy Describe/GetCount_management
+ # Copyright: Cartologic 2017
+ #
+ ##
+import os, logging, threading
+import xml.etree.ElementTree as ET
+from .parallel import run_tasks
+from .gdalimport import require_gdal
+
+# esri shape types as reported by arcpy.Describe().shapeType
+SHAPE_TYPES = {
+	"esriGeometryPoint": "Point",
+	"esriGeometryMultipoint": "Multipoint",
+	"esriGeometryPolyline": "Polyline",
+	"esriGeometryPolygon": "Polygon",
+	"esriGeometryMultiPatch": "MultiPatch"
+}
+
+# esri feature types as reported by arcpy.Describe().featureType
+FEATURE_TYPES = {
+	"esriFTSimple": "Simple",
+	"esriFTSimpleJunction": "SimpleJunction",
+	"esriFTSimpleEdge": "SimpleEdge",
+	"esriFTComplexJunction": "ComplexJunction",
+	"esriFTComplexEdge": "ComplexEdge",
+	"esriFTAnnotation": "Annotation",
+	"esriFTDimension": "Dimension",
+	"esriFTRasterCatalogItem": "RasterCatalogItem"
+}
+
+
+class Inventory:
+	def __init__(self, workspace, jobs=1):
+		self.gdal, self.ogr = require_gdal()[:2]
+		self.workspace = workspace
+		self.jobs = jobs
+		self.local = threading.local()
+
+	def open(self):
+		return self.gdal.OpenEx(self.workspace, self.gdal.OF_VECTOR | self.gdal.OF_READONLY, allowed_drivers=["OpenFileGDB"])
+
+	#-------------------------------------------------------------------------------
+	# Each worker keeps its own datasource, GDAL datasets are not thread safe
+	#
+	def get_dataset(self):
+		if getattr(self.local, "ds", None) is None:
+			self.local.ds = self.open()
+		return self.local.ds
+
+	#-------------------------------------------------------------------------------
+	# Return one item per layer with the keys used by FileGDB feat dicts:
+	# feature, count, feature_type, shapeType, type, dataset
+	#
+	def scan(self):
+		logging.debug( "inventory scan: {} ({} workers)".format(self.workspace, self.jobs) )
+		ds = self.open()
+		names = [ds.GetLayer(i).GetName() for i in range(ds.GetLayerCount())]
+		ds = None
+
+		items = run_tasks(self.describe, names, self.jobs)
+		logging.debug( "inventory scan: {} layers".format(len(items)) )
+		return items
+
+	def describe(self, name):
+		layer = self.get_dataset().GetLayerByName(name)
+		# OpenFileGDB reads the row count from the .gdbtable header
+		count = layer.GetFeatureCount()
+
+		definition = layer.GetMetadata_List("xml:definition")
+		root = ET.fromstring(definition[0]) if definition else None
+
+		item = { "feature": name, "count": count, "dataset": self.get_dataset_name(root) }
+		if layer.GetGeomType() == self.ogr.wkbNone and (root is None or root.findtext("ShapeType") is None):
+			item["type"] = "table"
+		else:
+			item["type"] = "feature_class"
+			item["feature_type"] = FEATURE_TYPES.get(self.get_text(root, "FeatureType"), "Simple")
+			item["shapeType"] = SHAPE_TYPES.get(self.get_text(root, "ShapeType"), "")
+
+		return item
+
+	def get_text(self, root, tag):
+		if root is None:
+			return None
+		return root.findtext(tag)
+
+	#-------------------------------------------------------------------------------
+	# CatalogPath is \Dataset\FeatureClass for feature classes within a
+	# feature dataset and \FeatureClass otherwise
+	#
+	def get_dataset_name(self, root):
+		catalog_path = self.get_text(root, "CatalogPath")
+		if not catalog_path:
+			return None
+		parts = [p for p in catalog_path.split("\\") if p]
+		if len(parts) > 1:
+			return parts[0]
+		return None
+
+	#-------------------------------------------------------------------------------
+	# Map layer names to their .gdbtable file
+	# The table number of a layer is its row id in GDB_SystemCatalog
+	#
+	def get_table_files(self):
+		ds = self.gdal.OpenEx(self.workspace, self.gdal.OF_VECTOR | self.gdal.OF_READONLY,
+			allowed_drivers=["OpenFileGDB"], open_options=["LIST_ALL_TABLES=YES"])
+		catalog = ds.GetLayerByName("GDB_SystemCatalog")
+		files = {}
+		if catalog is None:
+			logging.debug( "GDB_SystemCatalog not available, table files are unknown" )
+			return files
+
+		for row in catalog:
+			files[row.GetField("Name")] = os.path.join(self.workspace, "a%08x.gdbtable" % row.GetFID())
+		return files
+
+	#-------------------------------------------------------------------------------
+	# Fingerprint of each layer: row count, extent, .gdbtable size and mtime
+	#
+	def fingerprints(self, names):
+		files = self.get_table_files()
+		ds = self.open()
+		result = {}
+		for name in names:
+			layer = ds.GetLayerByName(name)
+			if layer is None:
+				continue
+
+			fingerprint = { "count": layer.GetFeatureCount(), "extent": None, "size": None, "mtime": None }
+			if layer.GetGeomType() != self.ogr.wkbNone:
+				try:
+					fingerprint["extent"] = [round(v, 6) for v in layer.GetExtent(force=0)]
+				except RuntimeError:
+					pass
+
+			table_file = files.get(name)
+			if table_file is not None and os.path.exists(table_file):
+				st = os.stat(table_file)
+				fingerprint["size"] = st.st_size
+				fingerprint["mtime"] = int(st.st_mtime)
+
+			result[name] = fingerprint
+		return result
@@ -0,0 +1,75 @@
+#-*- coding: UTF-8 -*-
+##
+ # journal.py
+ #
+ # Description: Checkpoint journal of a conversion, one line per completed
+ #              pipeline task, used by --resume to skip finished work
+ # Copyright: Cartologic 2017
+ #
+ ##
+import os, logging, json, time, threading
+from os import path
+
+
+class Journal:
+	def __init__(self, journal_path, header):
+		self.journal_path = journal_path
+		self.header = header
+		self.file = None
+		self.partial = False
+		self.lock = threading.Lock()
+
+	#-------------------------------------------------------------------------------
+	# Open the journal and return the keys of the tasks completed by the
+	# previous run. Without resume, or when the journal belongs to another
+	# geodatabase, database or version of the geodatabase, it starts over.
+	#
+	def open(self, resume=False):
+		completed = self.read() if resume else set()
+		if resume and not completed:
+			logging.info( "Nothing to resume, starting over ..." )
+
+		self.file = open(self.journal_path, "a" if completed else "w")
+		if not completed:
+			self.write(self.header)
+		elif self.partial:
+			# the records of this run must not be appended to the broken line
+			self.file.write("\n")
+		return completed
+
+	def read(self):
+		if not path.exists(self.journal_path):
+			return set()
+
+		completed = set()
+		self.partial = False
+		with open(self.journal_path, "r") as f:
+			for i, line in enumerate(f):
+				self.partial = not line.endswith("\n")
+				try:
+					entry = json.loads(line)
+				except ValueError:
+					# last line of a run that died while writing it
+					continue
+				if i == 0 and entry != self.header:
+					logging.info( "Journal %s belongs to another run, ignoring it" % self.journal_path )
+					return set()
+				if i > 0:
+					completed.add(entry["task"])
+
+		logging.debug( "Journal %s: %d completed tasks" % (self.journal_path, len(completed)) )
+		return completed
+
+	def record(self, key):
+		self.write( { "task": key, "time": time.time() } )
+
+	def write(self, entry):
+		with self.lock:
+			self.file.write(json.dumps(entry) + "\n")
+			self.file.flush()
+			os.fsync(self.file.fileno())
+
+	def close(self):
+		if self.file is not None:
+			self.file.close()
+			self.file = None
@@ -0,0 +1,118 @@
+#-*- coding: UTF-8 -*-
+##
+ # ogrloader.py
+ #
+ # Description: Load file geodatabase layers into postgis in-process with the
+ #              GDAL python bindings instead of one ogr2ogr process per layer
+ # Copyright: Cartologic 2017
+ #
+ ##
+import logging, threading
+from .gdalimport import require_gdal
+
+
+class OGRLoader:
+	def __init__(self, postgis, workspace):
+		self.gdal = require_gdal()[0]
+		self.postgis = postgis
+		self.workspace = workspace
+		self.local = threading.local()
+		self.lock = threading.Lock()
+		self.opened = []
+
+		self.gdal.SetConfigOption("PG_USE_COPY", "YES")
+		self.gdal.SetConfigOption("OGR_TRUNCATE", "YES")
+
+	#-------------------------------------------------------------------------------
+	# Source and target datasets are opened once per worker thread and reused
+	# for every layer that worker loads. GDAL datasets must not be shared
+	# between threads.
+	#
+	def get_datasets(self):
+		if getattr(self.local, "src", None) is None:
+			logging.debug(  "Opening %s and PG:%s ..." % (self.workspace, self.postgis.dbname) )
+			self.local.src = self.gdal.OpenEx(self.workspace, self.gdal.OF_VECTOR | self.gdal.OF_READONLY)
+			self.local.dst = self.gdal.OpenEx("PG:%s" % self.postgis.conn_string, self.gdal.OF_VECTOR | self.gdal.OF_UPDATE)
+			with self.lock:
+				self.opened.append(self.local)
+
+		return self.local.src, self.local.dst
+
+	def get_options(self, job, layers=None):
+		layer_options = [
+			"LAUNDER=YES",
+			"FID=id",
+			"GEOMETRY_NAME=geom",
+			"OVERWRITE=YES",
+			"SPATIAL_INDEX=NONE",
+			"SCHEMA=%s" % job["schema"]
+		]
+		if job.get("unlogged"):
+			layer_options.append("UNLOGGED=ON")
+
+		options = ["-gt", str(self.postgis.batch_size)]
+		access_mode = "overwrite"
+		layer_name = None if layers else job["feature"].lower()
+		if "chunk" in job:
+			# FID range of a chunked layer, appended to the table of the first chunk
+			options += ["-preserve_fid", "-where", self.postgis.get_chunk_filter(job)]
+			if job["chunk"]["index"] > 0:
+				access_mode = "append"
+				layer_name = "{}.{}".format(job["schema"], job["feature"].lower())
+
+		return self.gdal.VectorTranslateOptions(
+			options=options,
+			accessMode=access_mode,
+			skipFailures=True,
+			layers=layers or [job["feature"]],
+			layerName=layer_name,
+			srcSRS=self.postgis.a_srs,
+			dstSRS=self.postgis.t_srs,
+			geometryType=job["gdal_type"] or None,
+			layerCreationOptions=layer_options
+		)
+
+	def load(self, job):
+		logging.debug(  "load: {}.{} ({} rows)".format(job["schema"], job["feature"].lower(), job["count"]) )
+		appending = job.get("chunk", {}).get("index", 0) > 0
+		try:
+			src, dst = self.get_datasets()
+			if appending:
+				# OGR_TRUNCATE would empty the table the other chunks load into
+				self.gdal.SetThreadLocalConfigOption("OGR_TRUNCATE", "NO")
+			self.gdal.VectorTranslate(dst, src, options=self.get_options(job))
+			dst.FlushCache()
+		except RuntimeError as err:
+			logging.error(  str(err) )
+			logging.error(  "Unable to load %s ..." % job["feature"] )
+			return 1
+		finally:
+			if appending:
+				self.gdal.SetThreadLocalConfigOption("OGR_TRUNCATE", None)
+
+		return 0
+
+	#-------------------------------------------------------------------------------
+	# Load a pack of small tables of the same schema with one VectorTranslate,
+	# they keep their (laundered) names
+	#
+	def load_pack(self, jobs):
+		names = [job["feature"] for job in jobs]
+		logging.debug(  "load pack: {} ({})".format(jobs[0]["schema"], ", ".join(names)) )
+		try:
+			src, dst = self.get_datasets()
+			self.gdal.VectorTranslate(dst, src, options=self.get_options(jobs[0], names))
+			dst.FlushCache()
+		except RuntimeError as err:
+			logging.error(  str(err) )
+			logging.error(  "Unable to load %s ..." % ", ".join(names) )
+			return [1] * len(jobs)
+
+		return [0] * len(jobs)
+
+	def close(self):
+		with self.lock:
+			for local in self.opened:
+				local.src = None
+				local.dst = None
+			self.opened = []
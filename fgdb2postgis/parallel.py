@@ -0,0 +1,31 @@
+#-*- coding: UTF-8 -*-
+##
+ # parallel.py
+ #
+ # Description: Bounded worker pool used to run independent load and sql tasks
+ #              concurrently
+ # Copyright: Cartologic 2017
+ #
+ ##
+import logging
+from multiprocessing.pool import ThreadPool
+
+
+#-------------------------------------------------------------------------------
+# Run func over tasks with at most `jobs` workers
+# Tasks are handed out one at a time in list order, so callers control the
+# scheduling order by sorting the list. Results are returned in task order.
+#
+def run_tasks(func, tasks, jobs=1):
+	tasks = list(tasks)
+	if jobs is None or jobs <= 1 or len(tasks) <= 1:
+		return [func(task) for task in tasks]
+
+	workers = min(jobs, len(tasks))
+	logging.debug( "run_tasks: {} tasks on {} workers".format(len(tasks), workers) )
+	pool = ThreadPool(workers)
+	try:
+		return pool.map(func, tasks, chunksize=1)
+	finally:
+		pool.close()
+		pool.join()
@@ -0,0 +1,416 @@
+#-*- coding: UTF-8 -*-
+##
+ # pgcopy.py
+ #
+ # Description: Load file geodatabase layers into postgis with binary COPY
+ #              (COPY ... FROM STDIN WITH (FORMAT binary)), geometries are
+ #              sent as raw EWKB instead of hex encoded text
+ # Copyright: Cartologic 2017
+ #
+ ##
+import logging, threading, struct, datetime
+from io import BytesIO
+import psycopg2
+from .gdalimport import require_gdal
+
+COPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+COPY_TRAILER = struct.pack('!h', -1)
+NULL_FIELD = struct.pack('!i', -1)
+
+PG_EPOCH_DATE = datetime.date(2000, 1, 1)
+PG_EPOCH = datetime.datetime(2000, 1, 1)
+
+EWKB_SRID_FLAG = 0x20000000
+
+# -nlt style geometry types (see PostGIS.get_gdal_type) to ogr constants
+OGR_TYPES = {
+	"MULTIPOLYGON": "wkbMultiPolygon",
+	"MULTILINESTRING": "wkbMultiLineString",
+	"POINT": "wkbPoint",
+	"MULTIPOINT": "wkbMultiPoint"
+}
+
+
+#-------------------------------------------------------------------------------
+# Binary encoders, one per postgres column type
+# Each encoder returns the field length prefix followed by the field bytes
+#
+def encode_int2(value):
+	return struct.pack('!ih', 2, value)
+
+def encode_int4(value):
+	return struct.pack('!ii', 4, value)
+
+def encode_int8(value):
+	return struct.pack('!iq', 8, value)
+
+def encode_float4(value):
+	return struct.pack('!if', 4, value)
+
+def encode_float8(value):
+	return struct.pack('!id', 8, value)
+
+def encode_bool(value):
+	return struct.pack('!i?', 1, bool(value))
+
+def encode_bytes(value):
+	if not isinstance(value, (bytes, bytearray)):
+		value = value.encode("utf-8")
+	return struct.pack('!i', len(value)) + bytes(value)
+
+def encode_date(value):
+	year, month, day = value[0], value[1], value[2]
+	days = (datetime.date(year, month, day) - PG_EPOCH_DATE).days
+	return struct.pack('!ii', 4, days)
+
+def encode_timestamp(value):
+	year, month, day, hour, minute, second = value[:6]
+	micro = int(round((second - int(second)) * 1000000))
+	delta = datetime.datetime(year, month, day, hour, minute, int(second)) - PG_EPOCH
+	usecs = (delta.days * 86400 + delta.seconds) * 1000000 + micro
+	return struct.pack('!iq', 8, usecs)
+
+def encode_time(value):
+	hour, minute, second = value[3], value[4], value[5]
+	usecs = int(round((hour * 3600 + minute * 60 + second) * 1000000))
+	return struct.pack('!iq', 8, usecs)
+
+
+#-------------------------------------------------------------------------------
+# Convert ogr wkb into postgis ewkb by embedding the srid
+# ogr's default (old OGC) wkb flags 2.5D geometries with 0x80000000, which
+# is also the ewkb Z flag, so only the srid needs to be added
+#
+def to_ewkb(wkb, srid):
+	if not srid:
+		return wkb
+	wkb = bytearray(wkb)
+	fmt = '<I' if wkb[0] == 1 else '>I'
+	geom_type = struct.unpack(fmt, bytes(wkb[1:5]))[0] | EWKB_SRID_FLAG
+	return wkb[0:1] + struct.pack(fmt, geom_type) + struct.pack(fmt, srid) + wkb[5:]
+
+
+#-------------------------------------------------------------------------------
+# SRID of an EPSG:<code> --a_srs/--t_srs, 0 for any other definition
+#
+def get_epsg_code(user_srs):
+	if user_srs and user_srs.upper().startswith("EPSG:") and user_srs[5:].isdigit():
+		return int(user_srs[5:])
+	return 0
+
+
+def launder(name):
+	return name.lower().replace("-", "_").replace("#", "_").replace(" ", "_")
+
+
+# arcpy field types of lookup table columns, anything else is stored as varchar
+LOOKUP_TYPES = {
+	"SmallInteger": ("smallint", encode_int2),
+	"Integer": ("integer", encode_int4),
+	"Single": ("real", encode_float4),
+	"Double": ("double precision", encode_float8)
+}
+
+#-------------------------------------------------------------------------------
+# Create a lookup table (list of values of a domain or a subtype field) and
+# fill it with one binary COPY. columns is a list of (name, arcpy type), rows
+# are built in memory by FileGDB.
+#
+def copy_lookup_table(cursor, table, columns, rows):
+	types = [LOOKUP_TYPES.get(field_type, ("varchar", encode_bytes)) for name, field_type in columns]
+	names = ['"{}"'.format(launder(name)) for name, field_type in columns]
+	cols = ["id serial PRIMARY KEY"] + ["{} {}".format(name, t[0]) for name, t in zip(names, types)]
+
+	cursor.execute("DROP TABLE IF EXISTS {} CASCADE;".format(table))
+	cursor.execute("CREATE TABLE {} ({});".format(table, ", ".join(cols)))
+
+	buffer = BytesIO()
+	buffer.write(COPY_HEADER)
+	for row in rows:
+		buffer.write(struct.pack('!h', len(columns)))
+		for value, (pg_type, encoder) in zip(row, types):
+			if value is None:
+				buffer.write(NULL_FIELD)
+			elif encoder is encode_bytes and not isinstance(value, (bytes, bytearray)):
+				buffer.write(encoder(u"{}".format(value)))
+			else:
+				buffer.write(encoder(value))
+	buffer.write(COPY_TRAILER)
+	buffer.seek(0)
+	cursor.copy_expert("COPY {} ({}) FROM STDIN WITH (FORMAT binary)".format(table, ", ".join(names)), buffer)
+
+
+#-------------------------------------------------------------------------------
+# Layer loader, it needs the GDAL python bindings, lookup tables
+# (copy_lookup_table) do not
+#
+class BinaryCopyLoader:
+	def __init__(self, postgis, workspace):
+		self.gdal, self.ogr, self.osr = require_gdal()
+		self.postgis = postgis
+		self.workspace = workspace
+		self.local = threading.local()
+		self.lock = threading.Lock()
+		self.opened = []
+
+	#-------------------------------------------------------------------------------
+	# One source dataset and one database connection per worker thread
+	#
+	def get_session(self):
+		if getattr(self.local, "src", None) is None:
+			self.local.src = self.gdal.OpenEx(self.workspace, self.gdal.OF_VECTOR | self.gdal.OF_READONLY)
+			self.local.conn = psycopg2.connect(self.postgis.conn_string)
+			with self.lock:
+				self.opened.append(self.local)
+
+		return self.local.src, self.local.conn
+
+	def close(self):
+		with self.lock:
+			for local in self.opened:
+				local.src = None
+				local.conn.close()
+				local.conn = None
+			self.opened = []
+
+	#-------------------------------------------------------------------------------
+	# Map ogr field definitions to postgres column types and binary encoders
+	#
+	def get_columns(self, defn):
+		columns = []
+		for i in range(defn.GetFieldCount()):
+			field = defn.GetFieldDefn(i)
+			field_type = field.GetType()
+			sub_type = field.GetSubType()
+
+			if field_type == self.ogr.OFTInteger and sub_type == self.ogr.OFSTBoolean:
+				pg_type, encoder, getter = "boolean", encode_bool, "int"
+			elif field_type == self.ogr.OFTInteger and sub_type == self.ogr.OFSTInt16:
+				pg_type, encoder, getter = "smallint", encode_int2, "int"
+			elif field_type == self.ogr.OFTInteger:
+				pg_type, encoder, getter = "integer", encode_int4, "int"
+			elif field_type == self.ogr.OFTInteger64:
+				pg_type, encoder, getter = "bigint", encode_int8, "int64"
+			elif field_type == self.ogr.OFTReal and sub_type == self.ogr.OFSTFloat32:
+				pg_type, encoder, getter = "real", encode_float4, "double"
+			elif field_type == self.ogr.OFTReal:
+				pg_type, encoder, getter = "double precision", encode_float8, "double"
+			elif field_type == self.ogr.OFTDate:
+				pg_type, encoder, getter = "date", encode_date, "datetime"
+			elif field_type == self.ogr.OFTDateTime:
+				pg_type, encoder, getter = "timestamp", encode_timestamp, "datetime"
+			elif field_type == self.ogr.OFTTime:
+				pg_type, encoder, getter = "time", encode_time, "datetime"
+			elif field_type == self.ogr.OFTBinary:
+				pg_type, encoder, getter = "bytea", encode_bytes, "binary"
+			else:
+				pg_type, encoder, getter = "varchar", encode_bytes, "string"
+
+			columns.append( { "name": launder(field.GetName()), "index": i,
+				"pg_type": pg_type, "encoder": encoder, "getter": getter } )
+
+		return columns
+
+	def get_srs(self, layer):
+		target = self.postgis.t_srs or self.postgis.a_srs
+		source = None
+		if self.postgis.a_srs:
+			source = self.osr.SpatialReference()
+			source.SetFromUserInput(self.postgis.a_srs)
+		elif layer.GetSpatialRef() is not None:
+			source = layer.GetSpatialRef().Clone()
+
+		transform = None
+		srs = source
+		if self.postgis.t_srs:
+			srs = self.osr.SpatialReference()
+			srs.SetFromUserInput(target)
+			if source is not None and not source.IsSame(srs):
+				if hasattr(self.osr, "OAMS_TRADITIONAL_GIS_ORDER"):
+					source.SetAxisMappingStrategy(self.osr.OAMS_TRADITIONAL_GIS_ORDER)
+					srs.SetAxisMappingStrategy(self.osr.OAMS_TRADITIONAL_GIS_ORDER)
+				transform = self.osr.CoordinateTransformation(source, srs)
+
+		srid = 0
+		if srs is not None:
+			try:
+				srs.AutoIdentifyEPSG()
+			except RuntimeError:
+				# many ESRI projected CRSs have no EPSG equivalent
+				pass
+			if srs.GetAuthorityName(None) == "EPSG" and srs.GetAuthorityCode(None):
+				srid = int(srs.GetAuthorityCode(None))
+			else:
+				srid = get_epsg_code(target)
+
+		return srid, transform
+
+	def get_geometry_type(self, job):
+		if job["gdal_type"] not in OGR_TYPES:
+			return "GEOMETRY", None
+		return job["gdal_type"], getattr(self.ogr, OGR_TYPES[job["gdal_type"]])
+
+	def create_table(self, cursor, table, columns, geometry, unlogged=False):
+		cols = ["id serial PRIMARY KEY"]
+		cols += ['"{}" {}'.format(c["name"], c["pg_type"]) for c in columns]
+		if geometry is not None:
+			cols.append("geom geometry({}, {})".format(geometry[0], geometry[1]))
+
+		cursor.execute("DROP TABLE IF EXISTS {} CASCADE;".format(table))
+		cursor.execute("CREATE {}TABLE {} ({});".format("UNLOGGED " if unlogged else "", table, ", ".join(cols)))
+
+	#-------------------------------------------------------------------------------
+	# Encode one ogr feature as a binary COPY tuple
+	#
+	def encode_feature(self, feature, columns, geometry, transform, srid):
+		fields = [struct.pack('!h', len(columns) + (2 if geometry is not None else 1))]
+		fields.append(encode_int4(feature.GetFID()))
+
+		for c in columns:
+			i = c["index"]
+			if not feature.IsFieldSetAndNotNull(i):
+				fields.append(NULL_FIELD)
+			elif c["getter"] == "int":
+				fields.append(c["encoder"](feature.GetFieldAsInteger(i)))
+			elif c["getter"] == "int64":
+				fields.append(c["encoder"](feature.GetFieldAsInteger64(i)))
+			elif c["getter"] == "double":
+				fields.append(c["encoder"](feature.GetFieldAsDouble(i)))
+			elif c["getter"] == "datetime":
+				fields.append(c["encoder"](feature.GetFieldAsDateTime(i)))
+			elif c["getter"] == "binary":
+				fields.append(c["encoder"](feature.GetFieldAsBinary(i)))
+			else:
+				fields.append(c["encoder"](feature.GetFieldAsString(i)))
+
+		if geometry is not None:
+			geom = feature.GetGeometryRef()
+			if geom is None:
+				fields.append(NULL_FIELD)
+			else:
+				geom = geom.Clone()
+				if transform is not None:
+					geom.Transform(transform)
+				if geometry[2] is not None:
+					geom = self.ogr.ForceTo(geom, geometry[2])
+					geom.FlattenTo2D()
+				fields.append(encode_bytes(to_ewkb(geom.ExportToWkb(self.ogr.wkbNDR), srid)))
+
+		return b''.join(fields)
+
+	#-------------------------------------------------------------------------------
+	# Send the rows accumulated in buffer as one binary COPY and reset it
+	#
+	def flush(self, cursor, buffer, sql):
+		buffer.write(COPY_TRAILER)
+		buffer.seek(0)
+		cursor.copy_expert(sql, buffer)
+		buffer.seek(0)
+		buffer.truncate()
+		buffer.write(COPY_HEADER)
+
+	def load(self, job):
+		try:
+			src, conn = self.get_session()
+			cursor = conn.cursor()
+			self.copy_layer(src, cursor, job)
+			cursor.close()
+			conn.commit()
+
+		except (RuntimeError, psycopg2.Error) as err:
+			logging.error(  str(err) )
+			logging.error(  "Unable to load %s ..." % job["feature"] )
+			if getattr(self.local, "conn", None) is not None:
+				self.local.conn.rollback()
+			return 1
+
+		return 0
+
+	#-------------------------------------------------------------------------------
+	# Load a pack of small tables in a single transaction, one savepoint per
+	# table so that a failing table does not undo the others
+	#
+	def load_pack(self, jobs):
+		results = []
+		try:
+			src, conn = self.get_session()
+			cursor = conn.cursor()
+			for job in jobs:
+				cursor.execute("SAVEPOINT pack_table;")
+				try:
+					self.copy_layer(src, cursor, job)
+					cursor.execute("RELEASE SAVEPOINT pack_table;")
+					results.append(0)
+				except (RuntimeError, psycopg2.Error) as err:
+					cursor.execute("ROLLBACK TO SAVEPOINT pack_table;")
+					logging.error(  str(err) )
+					logging.error(  "Unable to load %s ..." % job["feature"] )
+					results.append(1)
+			cursor.close()
+			conn.commit()
+
+		except (RuntimeError, psycopg2.Error) as err:
+			logging.error(  str(err) )
+			logging.error(  "Unable to load %s ..." % ", ".join([job["feature"] for job in jobs]) )
+			if getattr(self.local, "conn", None) is not None:
+				self.local.conn.rollback()
+			return [1] * len(jobs)
+
+		return results
+
+	def copy_layer(self, src, cursor, job):
+		table = "{}.{}".format(job["schema"], job["feature"].lower())
+		logging.debug(  "load (binary copy): {} ({} rows)".format(table, job["count"]) )
+		layer = src.GetLayerByName(job["feature"])
+		if layer is None:
+			raise RuntimeError("Layer %s not found" % job["feature"])
+		defn = layer.GetLayerDefn()
+		columns = self.get_columns(defn)
+
+		geometry = None
+		transform = None
+		srid = 0
+		if defn.GetGeomType() != self.ogr.wkbNone:
+			srid, transform = self.get_srs(layer)
+			pg_type, ogr_type = self.get_geometry_type(job)
+			geometry = (pg_type, srid, ogr_type)
+
+		# the FID ranges of a chunked layer are copied into the table of the first chunk
+		chunk = job.get("chunk")
+		if chunk is None or chunk["index"] == 0:
+			self.create_table(cursor, table, columns, geometry, job.get("unlogged", False))
+
+		names = ["id"] + ['"{}"'.format(c["name"]) for c in columns]
+		if geometry is not None:
+			names.append("geom")
+		sql = "COPY {} ({}) FROM STDIN WITH (FORMAT binary)".format(table, ", ".join(names))
+
+		buffer = BytesIO()
+		buffer.write(COPY_HEADER)
+		rows = 0
+		if chunk is not None:
+			layer.SetAttributeFilter(self.postgis.get_chunk_filter(job))
+		try:
+			layer.ResetReading()
+			for feature in layer:
+				buffer.write(self.encode_feature(feature, columns, geometry, transform, srid))
+				rows += 1
+				if rows % self.postgis.batch_size == 0:
+					self.flush(cursor, buffer, sql)
+		finally:
+			if chunk is not None:
+				# the layer object is reused by the next load of this worker
+				layer.SetAttributeFilter(None)
+
+		if rows % self.postgis.batch_size != 0:
+			self.flush(cursor, buffer, sql)
+
+		if chunk is not None:
+			# the id sequence is set once every chunk is loaded, see PostGIS.add_chunk_tasks
+			logging.debug(  "load (binary copy): {} {} rows ({})".format(table, rows, self.postgis.get_chunk_filter(job)) )
+			return rows
+
+		# the spatial index is built by a post-load task, see PostGIS.add_post_load_tasks
+		cursor.execute("SELECT setval(pg_get_serial_sequence('{}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {};".format(table, table))
+		logging.debug(  "load (binary copy): {} {} rows".format(table, rows) )
+		return rows
@@ -0,0 +1,206 @@
+#-*- coding: UTF-8 -*-
+##
+ # plan.py
+ #
+ # Description: Dry run of a conversion (--plan): the ordered tasks of the
+ #              pipeline with their row counts and sizes, and the duration of
+ #              each stage estimated from the run report of an earlier run
+ # Copyright: Cartologic 2017
+ #
+ ##
+import logging, json
+from os import path
+
+# stages run by PostGIS.process and convert outside of the task graph
+FIXED_STAGES = ["filegdb.process", "update_views", "create_schemas", "filegdb.cleanup"]
+
+
+#-------------------------------------------------------------------------------
+# Throughput profile of an earlier run, read from its run report
+# (<fgdb>.report.json) or from a benchmark result. Items with a row count
+# give the seconds per row of their stage, the sql units of a table are
+# given the row count of its load. Items without rows (scripts, views,
+# staging switches) are estimated by name.
+#
+class ThroughputProfile:
+	def __init__(self):
+		self.source = None
+		self.rates = {}
+		self.items = {}
+		self.stages = {}
+
+	def load(self, report_path):
+		if not report_path or not path.exists(report_path):
+			return False
+		with open(report_path, 'r') as f:
+			data = json.load(f)
+		# benchmark results embed the run report
+		data = data.get("report", data)
+
+		items = data.get("items") or []
+		# the chunks of a chunked layer are recorded under the name of the layer
+		loads = {}
+		for i in items:
+			if i["stage"] == "load_database" and i["rows"] is not None:
+				loads[i["name"]] = loads.get(i["name"], 0) + i["rows"]
+		for item in items:
+			rows = item["rows"]
+			if rows is None and item["stage"] != "load_database":
+				rows = loads.get(item["name"])
+			if rows is None:
+				self.items.setdefault( (item["stage"], item["name"]), [] ).append(item["seconds"])
+				continue
+			rate = self.rates.setdefault(item["stage"], [0, 0.0])
+			rate[0] += rows
+			rate[1] += item["seconds"]
+
+		for stage in data.get("stages") or []:
+			self.stages[stage["name"]] = stage["seconds"]
+		self.source = report_path
+		logging.debug( "Throughput profile %s: %d items" % (report_path, len(items)) )
+		return True
+
+	#-------------------------------------------------------------------------------
+	# Estimated seconds of an item, None when the profile knows nothing of it
+	#
+	def estimate(self, stage, name, rows=None):
+		rate = self.rates.get(stage)
+		if rows is not None and rate is not None and rate[0]:
+			return rows * rate[1] / rate[0]
+		seconds = self.items.get( (stage, name) )
+		if seconds:
+			return sum(seconds) / len(seconds)
+		return None
+
+
+#-------------------------------------------------------------------------------
+# Plan of a conversion: the task graph PostGIS would run, simulated on
+# --jobs workers with the estimated cost of each task. FileGDB must be
+# processed and PostGIS built with dry_run, the database is not used. The
+# journal is only read, to leave out the tasks --resume would skip.
+#
+def get_plan(postgis, filegdb, profile):
+	graph, jobs, packs = postgis.prepare_pipeline(filegdb)
+
+	counts = {}
+	sizes = {}
+	for lut in filegdb.domain_tables:
+		counts["{}.{}".format(lut["schema"], lut["feature"].lower())] = lut["count"]
+	for job in jobs:
+		counts[postgis.get_table_name(job)] = job["count"]
+		sizes[postgis.get_table_name(job)] = job.get("bytes")
+		for chunk in postgis.get_chunks(job):
+			counts[postgis.get_chunk_key(chunk)] = chunk["count"]
+			sizes[postgis.get_chunk_key(chunk)] = chunk.get("bytes")
+	for pack in packs:
+		counts[pack["key"]] = pack["count"]
+		sizes[pack["key"]] = sum([job.get("bytes") or 0 for job in pack["jobs"]]) or None
+	for v in filegdb.materialized_views:
+		counts[v["name"]] = v["count"]
+	packed = set([postgis.get_load_key(job) for job in jobs if "pack" in job])
+	chunked = set([postgis.get_load_key(job) for job in jobs if "pack" not in job and postgis.get_chunks(job)])
+
+	for task in graph.tasks:
+		task["name"] = get_item_name(task["key"])
+		task["rows"] = counts.get(task["key"], counts.get(task["name"]))
+		task["bytes"] = sizes.get(task["key"], sizes.get(task["name"]))
+		if task["key"] == "lookup_tables":
+			task["rows"] = sum([lut["count"] for lut in filegdb.domain_tables])
+
+	def cost(task):
+		if task["key"] in packed:
+			# loaded by its pack
+			return 0.0
+		if task["key"] == "lookup_tables":
+			seconds = [profile.estimate(task["stage"], name, rows) for name, rows in get_lookup_tables(filegdb)]
+			return sum(seconds) if None not in seconds else None
+		# ALTER ... SET LOGGED and the id sequence of chunked layers do not scale with the load rate
+		rows = task["rows"] if not task["key"].startswith("logged:") and task["key"] not in chunked else None
+		return profile.estimate(task["stage"], task["name"], rows)
+
+	completed = postgis.get_journal(filegdb).read() if postgis.resume else set()
+	for task in graph.tasks:
+		task["estimate"] = cost(task)
+	tasks = graph.simulate(postgis.jobs, cost=lambda t: t["estimate"], completed=completed)
+	return graph, tasks
+
+def get_item_name(key):
+	# name of the report item of a task, see PostGIS.build_graph
+	if key.startswith("chunk:"):
+		return key.split(":")[1]
+	if key.startswith("pack:") or ":" not in key:
+		return key + ".sql" if key in ("fix_data_errors", "split_schemas") else key
+	return key.split(":")[-1]
+
+def get_lookup_tables(filegdb):
+	return [("{}.{}".format(lut["schema"], lut["feature"].lower()), lut["count"]) for lut in filegdb.domain_tables]
+
+
+#-------------------------------------------------------------------------------
+# Log the plan: the tasks in the order they would start, then the estimated
+# wall time of each stage. Stages overlap, the total is the end of the last
+# task plus the stages run outside of the task graph.
+#
+def log_plan(postgis, filegdb, profile):
+	graph, tasks = get_plan(postgis, filegdb, profile)
+	skipped = len(graph.tasks) - len(tasks)
+
+	logging.info( "Plan of %s -> %s, %d tasks on %d workers" % (filegdb.workspace, postgis.dbname, len(tasks), postgis.jobs) )
+	if skipped:
+		logging.info( "%d tasks completed by the previous run are skipped (--resume)" % skipped )
+	if postgis.incremental:
+		logging.info( "Incremental run: the database is not read, every layer is listed" )
+	if profile.source is None:
+		logging.info( "No throughput profile (run report of an earlier run), durations are not estimated" )
+	else:
+		logging.info( "Durations estimated from %s" % profile.source )
+
+	logging.info( "%10s %10s  %-26s %-48s %12s %14s" % ("start", "seconds", "stage", "task", "rows", "bytes") )
+	for task in tasks:
+		logging.info( "%10s %10s  %-26s %-48s %12s %14s" % (format_seconds(task["started"] if profile.source else None),
+			format_seconds(task["estimate"]), task["stage"], task["key"], format_value(task["rows"]), format_value(task["bytes"])) )
+		if task["key"] == "lookup_tables":
+			for name, rows in get_lookup_tables(filegdb):
+				logging.info( "%10s %10s  %-26s   %-46s %12s" % ("", "", "", name, format_value(rows)) )
+
+	spans = dict(graph.get_stage_spans())
+	logging.info( "%-28s %8s %12s %14s %10s %10s" % ("stage", "tasks", "rows", "bytes", "seconds", "unknown") )
+	total = 0.0
+	for name in FIXED_STAGES[:-1]:
+		total += log_stage(name, None, profile.stages.get(name))
+	stages = []
+	for task in tasks:
+		if task["stage"] not in stages:
+			stages.append(task["stage"])
+	for stage in stages:
+		items = [t for t in tasks if t["stage"] == stage]
+		log_stage(stage, items, spans.get(stage) if profile.source else None)
+	total += max([t["finished"] for t in tasks] or [0.0])
+	total += log_stage(FIXED_STAGES[-1], None, profile.stages.get(FIXED_STAGES[-1]))
+	logging.info( "%-28s %8s %12s %14s %10s" % ("total", "", "", "", format_seconds(total if profile.source else None)) )
+	return tasks
+
+def log_stage(name, tasks, seconds):
+	tasks = tasks or []
+	# the tables of a pack and the chunks of a layer are counted by their load task
+	counted = [t for t in tasks if not t["key"].startswith("pack:") and not t["key"].startswith("chunk:")]
+	rows = get_total([t["rows"] for t in counted])
+	size = get_total([t["bytes"] for t in counted])
+	unknown = len([t for t in tasks if t["estimate"] is None])
+	logging.info( "%-28s %8s %12s %14s %10s %10s" % (name, len(tasks) if tasks else "-", format_value(rows),
+		format_value(size), format_seconds(seconds), unknown if tasks else "-") )
+	return seconds or 0.0
+
+def get_total(values):
+	values = [v for v in values if v is not None]
+	return sum(values) if values else None
+
+def format_value(value):
+	if value is None:
+		return "-"
+	return "%d" % value
+
+def format_seconds(seconds):
+	if seconds is None:
+		return "-"
+	return "%.2f" % seconds
@@ -9,12 +9,22 @@
  # Copyright: Cartologic 2017
  #
  ##
-import sys, logging
+import sys, logging, json, time, threading
 import psycopg2
+from psycopg2.pool import ThreadedConnectionPool
 from os import path, system
+from .taskgraph import TaskGraph
+from .journal import Journal
+from .pgcopy import copy_lookup_table
+from . import sqlunits
+from .report import RunReport
 
 class PostGIS:
-	def __init__(self, host, port, user, password, dbname,a_srs, t_srs):
+	def __init__(self, host, port, user, password, dbname,a_srs, t_srs, jobs=1, engine="ogr2ogr", batch_size=20000,
+			incremental=False, maintenance_work_mem=None, parallel_maintenance_workers=None,
+			validate_constraints=False, mv_unique_index=False, staging=False, report=None, resume=False,
+			cluster_rows=None, analyze=True, simplify=None, precision=None, connections=None, dry_run=False,
+			chunk_rows=None):
 		self.dbname = dbname
 		self.a_srs = a_srs
 		self.t_srs = t_srs
@@ -22,7 +32,35 @@ class PostGIS:
 		self.port = port
 		self.user = user
 		self.password = password
+		self.jobs = jobs
+		self.engine = engine
+		self.batch_size = batch_size
+		self.chunk_rows = chunk_rows
+		self.incremental = incremental
+		self.layers_table = "public.fgdb2postgis_layers"
+		self.maintenance_work_mem = maintenance_work_mem
+		self.parallel_maintenance_workers = parallel_maintenance_workers
+		self.validate_constraints = validate_constraints
+		self.mv_unique_index = mv_unique_index
+		self.staging = staging
+		self.staging_schema = "fgdb2postgis_staging"
+		self.resume = resume
+		self.cluster_rows = cluster_rows
+		self.analyze = analyze
+		self.simplify = simplify or []
+		self.precision = precision
+		self.journal = None
+		self.completed = set()
+		self.timings = []
+		self.statement_batch = 100
+		self.pack_tables = 50
+		self.report = report if report is not None else RunReport(dbname)
+		self.current_stage = None
 		self.conn = None
+		self.conn_lock = threading.Lock()
+		self.pool = None
+		self.connections = connections
+		self.dry_run = dry_run
 		self.conn_string = (
 			"dbname=%s host=%s port=%s user=%s password=%s" % (self.dbname, self.host, self.port, self.user, self.password)
 		)
@@ -36,30 +74,74 @@ class PostGIS:
 		logging.debug(  ' Port: %s' % self.port   )
 		logging.debug(  ' User: %s' % self.user   )
 		logging.debug(  ' Password: %s' % self.password  )
-		self.create_database()
+		logging.debug(  ' Jobs: %s' % self.jobs  )
+		logging.debug(  ' Engine: %s' % self.engine  )
+		logging.debug(  ' Incremental: %s' % self.incremental  )
+		logging.debug(  ' Staging: %s' % self.staging  )
+		logging.debug(  ' Resume: %s' % self.resume  )
+		logging.debug(  ' Cluster rows: %s' % self.cluster_rows  )
+		logging.debug(  ' Chunk rows: %s' % self.chunk_rows  )
+		logging.debug(  ' Simplify: %s, precision: %s' % (self.simplify, self.precision)  )
+		# --plan does not touch the database
+		if not self.dry_run:
+			self.create_database()
 
 	def process(self, filegdb):
+		if self.connections is not None:
+			self.claim_schemas(filegdb)
 		self.connect()
-		self.update_views()
-		self.create_schemas(filegdb)
-		self.load_database(filegdb)
-		self.apply_sql(filegdb)
+		self.open_journal(filegdb)
+		try:
+			self.run_stage("update_views", self.update_views)
+			self.run_stage("create_schemas", self.create_schemas, filegdb)
+			self.run_stage("pipeline", self.run_pipeline, filegdb)
+		finally:
+			self.journal.close()
 		self.disconnect()
 
+	#-------------------------------------------------------------------------------
+	# Conversions of a batch into the same database must not share a schema,
+	# create_schemas drops the schemas of the previous conversion otherwise
+	#
+	def claim_schemas(self, filegdb):
+		database = "{}:{}/{}".format(self.host, self.port, self.dbname)
+		taken = self.connections.claim_schemas(database, filegdb.workspace_path, filegdb.schemas)
+		for schema, owner in taken:
+			logging.error( "Schema %s of %s is already used by %s ..." % (schema, database, owner) )
+		if taken:
+			sys.exit(1)
+
+	def run_stage(self, name, func, *args):
+		self.current_stage = name
+		with self.report.stage(name):
+			return func(*args)
+
 
 	'''
 	Create a new database 
 	'''
 	def create_database(self):
 		logging.debug(  "create_database ...")
+		# set up once per batch, see batch.SharedConnections
+		if self.connections is not None and self.connections.is_done("create_database", self.dbname):
+			logging.debug(  "Database %s is already set up" % self.dbname )
+			return
+
 		try:
 			conn = psycopg2.connect("dbname=%s host=%s port=%s user=%s password=%s" % ("postgres", self.host, self.port, self.user, self.password) )
 			conn.set_isolation_level(0)
 			cursor = conn.cursor()
-			sql = " DROP DATABASE  IF EXISTS {} ; ".format(self.dbname)
-			cursor.execute(sql)
-			sql = " create DATABASE  {} ; ".format(self.dbname)
-			cursor.execute(sql)
+			if self.incremental or self.staging or self.resume:
+				# keep the existing database, only create it on the first run
+				cursor.execute("SELECT 1 FROM pg_database WHERE datname = %s ;", (self.dbname,))
+				exists = cursor.fetchone() is not None
+			else:
+				exists = False
+				sql = " DROP DATABASE  IF EXISTS {} ; ".format(self.dbname)
+				cursor.execute(sql)
+			if not exists:
+				sql = " create DATABASE  {} ; ".format(self.dbname)
+				cursor.execute(sql)
 			cursor.close()
 
 			conn = psycopg2.connect("dbname=%s host=%s port=%s user=%s password=%s" % (self.dbname, self.host, self.port, self.user, self.password) )
@@ -70,6 +152,8 @@ class PostGIS:
 			sql = "GRANT SELECT ON ALL TABLES IN SCHEMA information_schema TO {}".format(self.user )
 			cursor.execute(sql)
 			cursor.close()
+			if self.connections is not None:
+				self.connections.set_done("create_database", self.dbname)
 
 		except psycopg2.Error as err:
 			logging.error(  str(err)  )
@@ -80,7 +164,10 @@ class PostGIS:
 	def connect(self):
 		logging.debug(  "connect to database ...")
 		try:
-			self.conn = psycopg2.connect(self.conn_string)
+			if self.connections is not None:
+				self.conn = self.connections.get_connection(self.conn_string)
+			else:
+				self.conn = psycopg2.connect(self.conn_string)
 			logging.debug(  'Connect to database ...' )
 		except psycopg2.Error as err:
 			logging.error(  str(err)  )
@@ -91,7 +178,9 @@ class PostGIS:
 		logging.debug(  "disconnect from database ...")
 		if self.conn:
 			self.conn.commit()
-			self.conn.close()
+			# shared connections are closed at the end of the batch
+			if self.connections is None:
+				self.conn.close()
 
 		logging.debug(  "Disconnected from database." )
 
@@ -114,28 +203,352 @@ class PostGIS:
 		elif shapeType == 'Multipoint':
 			gdal_type = "MULTIPOINT"
 
-		return "  -nlt  {}  ".format(gdal_type)
+		return gdal_type
 
 
-	def load_database(self, filegdb):
+	#-------------------------------------------------------------------------------
+	# Load and sql pipeline
+	# Every lookup table load, layer load, index, foreign key unit and
+	# materialized view is a task of a TaskGraph with explicit dependencies,
+	# so that a layer is indexed while the next ones are still loading. At
+	# most --jobs tasks run at a time.
+	#
+	def run_pipeline(self, filegdb):
 		logging.debug(  "Loading database tables ...")
 
-		gdal_cmd = 'ogr2ogr -f "PostgreSQL" "PG:{}"  {}  {}   -overwrite -progress -skipfailures -append \
-			-a_srs {} 	-t_srs {} 	-lco launder=yes  -lco fid=id  	-lco GEOMETRY_NAME=geom -lco OVERWRITE=YES  \
-			--config OGR_TRUNCATE YES -nln {} -lco SCHEMA={} --config PG_USE_COPY YES {}  '
+		graph, jobs, packs = self.prepare_pipeline(filegdb)
+		index_statements = filegdb.get_statements("create_indexes")
+		constraint_statements = filegdb.get_statements("create_constraints")
+
+		loader = self.get_loader(filegdb)
+		self.load_func = loader.load if loader is not None else self.load_layer
+		self.load_pack_func = loader.load_pack if loader is not None else self.load_layers
+		self.timings = []
+		self.open_pool(self.get_session_sql(index_statements + constraint_statements))
+		try:
+			graph.run(self.jobs, completed=self.completed, on_done=self.journal.record)
+		finally:
+			self.close_pool()
+			if loader is not None:
+				loader.close()
+
+		for name, seconds in graph.get_stage_spans():
+			self.report.add_stage(name, seconds)
+
+		failed = [job["feature"] for job in jobs if not graph.succeeded(self.get_load_key(job))]
+		if failed:
+			logging.error(  "Loading failed for: {}".format(", ".join(failed)) )
+
+		if self.validate_constraints:
+			self.log_validation_timings()
+
+	#-------------------------------------------------------------------------------
+	# Load jobs, table packs and task graph of a run. Without a database
+	# (--plan) incremental runs cannot tell the changed layers, all are listed.
+	#
+	def prepare_pipeline(self, filegdb):
+		jobs = self.get_load_jobs(filegdb)
+		tables = set([self.get_table_name(job) for job in jobs])
+		if self.incremental and not self.dry_run:
+			jobs = self.get_changed_jobs(filegdb, jobs)
+		if self.staging:
+			for job in jobs:
+				job["final_schema"] = job["schema"]
+				job["schema"] = self.staging_schema
+				job["unlogged"] = True
+		logging.debug(  "Loading {} layers with {} workers ({}) ...".format(len(jobs), self.jobs, self.engine) )
+
+		packs = self.get_table_packs(jobs)
+		graph = self.build_graph(filegdb, jobs, packs, tables, filegdb.get_statements("create_indexes"),
+			filegdb.get_statements("create_constraints"))
+		return graph, jobs, packs
+
+	def build_graph(self, filegdb, jobs, packs, tables, index_statements, constraint_statements):
+		graph = TaskGraph()
+		context = { "loads": {}, "all_loads": [], "post_load": {}, "tables": tables, "barrier": [] }
+
+		# lookup tables, layers and packs of small tables
+		context["all_loads"].append( graph.add("lookup_tables", self.on_connection, (self.load_lookup_tables, filegdb),
+			stage="load_database") )
+		for lut in filegdb.domain_tables:
+			context["loads"]["{}.{}".format(lut["schema"], lut["feature"].lower())] = "lookup_tables"
+		packs = dict((pack["key"], pack) for pack in packs)
+		for job in jobs:
+			if "pack" in job:
+				if not graph.has(job["pack"]):
+					graph.add(job["pack"], self.timed_load_pack, (packs[job["pack"]],), stage="load_database")
+				key = graph.add(self.get_load_key(job), self.load_packed, (job,), after=[job["pack"]], stage="load_database")
+			elif self.get_chunks(job):
+				key = self.add_chunk_tasks(graph, job, self.get_chunks(job))
+			else:
+				key = graph.add(self.get_load_key(job), self.timed_load, (job,), stage="load_database")
+			context["loads"][self.get_table_name(job)] = key
+			context["all_loads"].append(key)
+
+		# staging tables are only in place once they are all switched, they are
+		# set LOGGED before the post-load tasks as SET LOGGED rewrites indexes
+		post_load = []
+		for job in jobs:
+			keys = []
+			depends = [self.get_load_key(job)]
+			if self.staging:
+				unit = { "key": self.get_table_name(job), "statements": [
+					"ALTER TABLE {}.{} SET LOGGED;".format(self.staging_schema, job["feature"].lower()) ] }
+				depends = [graph.add("logged:" + self.get_table_name(job), self.run_sql_unit, ("load_database", unit),
+					depends=depends, stage="load_database")]
+				keys += depends
+			keys += self.add_post_load_tasks(graph, job, depends)
+			context["post_load"][self.get_table_name(job)] = keys
+			post_load += keys
+
+		if self.staging:
+			context["barrier"].append( graph.add("switch_staging", self.on_connection, (self.switch_loaded, graph, filegdb, jobs),
+				after=context["all_loads"] + post_load, stage="load_database") )
+
+		if self.incremental:
+			graph.add("save_fingerprints", self.on_connection, (self.save_loaded_fingerprints, graph, jobs),
+				depends=context["barrier"], after=context["all_loads"], stage="load_database")
+
+		if self.has_statements(filegdb, "fix_data_errors"):
+			context["barrier"].append( graph.add("fix_data_errors", self.on_connection, (self.execute_script, filegdb, "fix_data_errors", "apply_sql"),
+				after=context["all_loads"] + context["barrier"], stage="apply_sql") )
+
+		# one task per index, a table is indexed as soon as it is loaded
+		indexes = {}
+		sql_tasks = []
+		for i, unit in enumerate(sqlunits.index_units(index_statements)):
+			depends, after = self.get_table_deps(unit["key"], context)
+			key = graph.add("index:%d:%s" % (i, unit["key"]), self.run_sql_unit, ("build_indexes", unit),
+				depends=depends, after=after, stage="build_indexes")
+			indexes.setdefault(unit["key"], []).append(key)
+			sql_tasks.append(key)
+
+		# foreign keys wait for the unique index of their parent table
+		for unit in sqlunits.constraint_units(constraint_statements):
+			after = list(indexes.get(unit["key"], []))
+			for table in [unit["key"]] + [sqlunits.get_table(s) for s in unit["statements"]]:
+				depends, table_after = self.get_table_deps(table, context)
+				after += depends + table_after
+			sql_tasks.append( graph.add("constraints:%s" % unit["key"], self.run_sql_unit, ("build_constraints", unit),
+				after=after, stage="build_constraints") )
+
+		if self.validate_constraints:
+			for unit in self.get_validation_units(filegdb):
+				key = "constraints:%s" % unit["key"]
+				graph.add("validate:%s" % unit["key"], self.run_sql_unit, ("validate_constraints", unit),
+					depends=[key] if graph.has(key) else [], stage="validate_constraints")
+
+		if self.has_statements(filegdb, "split_schemas"):
+			context["barrier"].append( graph.add("split_schemas", self.on_connection, (self.execute_script, filegdb, "split_schemas", "apply_sql"),
+				after=context["all_loads"] + context["barrier"] + sql_tasks, stage="apply_sql") )
+
+		self.add_view_tasks(graph, filegdb, context)
+		return graph
+
+	#-------------------------------------------------------------------------------
+	# Post-load tasks of a layer
+	# Layers are loaded without spatial index. Once the load is finished the
+	# generalized geometry columns are added, then the GiST indexes are built,
+	# followed by an optional CLUSTER of large layers and by ANALYZE.
+	#
+	def add_post_load_tasks(self, graph, job, depends):
+		table = "{}.{}".format(job["schema"], job["feature"].lower())
+		name = self.get_table_name(job)
+		keys = []
+		columns = self.get_generalized_columns(job)
+		if columns:
+			depends = [graph.add("generalize:" + name, self.run_sql_unit, ("generalize", self.get_generalize_unit(name, table, columns)),
+				depends=depends, stage="generalize")]
+			keys += depends
+
+		if job.get("geometry"):
+			index = "{}_geom_geom_idx".format(job["feature"].lower())
+			unit = { "key": name, "statements": [ "CREATE INDEX IF NOT EXISTS {} ON {} USING GIST (geom);".format(index, table) ] }
+			for column, expression in columns:
+				unit["statements"].append( "CREATE INDEX IF NOT EXISTS {}_{}_idx ON {} USING GIST ({});".format(
+					job["feature"].lower(), column, table, column) )
+			if self.cluster_rows is not None and job["count"] >= self.cluster_rows:
+				unit["statements"].append( "CLUSTER {} USING {};".format(table, index) )
+			depends = [graph.add("gist:" + name, self.run_sql_unit, ("post_load", unit), depends=depends, stage="post_load")]
+			keys += depends
+
+		if self.analyze:
+			unit = { "key": name, "statements": [ "ANALYZE {};".format(table) ] }
+			keys.append( graph.add("analyze:" + name, self.run_sql_unit, ("post_load", unit), depends=depends, stage="post_load") )
+		return keys
+
+	#-------------------------------------------------------------------------------
+	# Generalized geometries for web publishing
+	# Line and polygon layers get one extra geometry column per --simplify
+	# tolerance (ST_SimplifyPreserveTopology), snapped to the --precision grid
+	# (ST_ReducePrecision) when it is set. With --precision alone a single
+	# geom_p column is added. The materialized views select them as well.
+	#
+	def get_generalized_columns(self, job):
+		if not job.get("geometry") or job["gdal_type"] not in ("MULTIPOLYGON", "MULTILINESTRING"):
+			return []
+
+		tolerances = list(self.simplify)
+		if not tolerances and self.precision:
+			tolerances = [None]
+
+		columns = []
+		for tolerance in tolerances:
+			expression = "geom"
+			if tolerance is None:
+				column = "geom_p"
+			else:
+				column = "geom_s" + ("%g" % tolerance).replace(".", "_").replace("-", "m").replace("+", "")
+				expression = "ST_SimplifyPreserveTopology({}, {})".format(expression, tolerance)
+			if self.precision:
+				expression = "ST_ReducePrecision({}, {})".format(expression, self.precision)
+			columns.append( (column, "ST_Multi({})".format(expression)) )
+		return columns
+
+	def get_generalize_unit(self, name, table, columns):
+		return { "key": name, "statements": [
+			"ALTER TABLE {} {};".format(table, ", ".join(["ADD COLUMN IF NOT EXISTS {} geometry".format(c) for c, e in columns])),
+			# a single UPDATE rewrites the table once for all the columns
+			"UPDATE {} SET {};".format(table, ", ".join(["{} = {}".format(c, e) for c, e in columns])),
+			# typmod (type, srid) of the new columns from their data
+			"SELECT Populate_Geometry_Columns('{}'::regclass);".format(table) ] }
+
+	#-------------------------------------------------------------------------------
+	# The views script creates the views WITH NO DATA, each view is created once the
+	# tables it selects from are loaded and post-processed (generalized columns,
+	# indexes), then refreshed. A materialized view only selects from its layer
+	# and the lookup tables of its foreign keys, never from another view, so
+	# the refreshes do not wait for each other.
+	#
+	def add_view_tasks(self, graph, filegdb, context):
+		views = dict((v["name"], v) for v in filegdb.materialized_views)
+		for unit in sqlunits.view_units(filegdb.get_statements("views")):
+			view = views.get(unit["key"])
+			after = list(context["barrier"])
+			for table in (view["depends"] if view else [None]):
+				depends, table_after = self.get_table_deps(table, context)
+				after += depends + table_after
+				# t.* only selects the generalized columns once they are added
+				if table is None:
+					after += [key for keys in context["post_load"].values() for key in keys]
+				else:
+					after += context["post_load"].get(table, [])
+			graph.add("view:%s" % unit["key"], self.run_sql_unit, ("create_views", unit), after=after, stage="create_views")
+
+		for v in sorted(filegdb.materialized_views, key=lambda x: x["count"], reverse=True):
+			if not graph.has("view:%s" % v["name"]):
+				continue
+			statements = []
+			if self.mv_unique_index:
+				# a unique index allows later REFRESH MATERIALIZED VIEW CONCURRENTLY
+				statements.append( "CREATE UNIQUE INDEX IF NOT EXISTS {}_id_idx ON {} (id);".format(v["name"].split(".")[-1], v["name"]) )
+			statements.append( "REFRESH MATERIALIZED VIEW {};".format(v["name"]) )
+			graph.add("refresh:%s" % v["name"], self.run_sql_unit, ("refresh_materialized_views", { "key": v["name"], "statements": statements }),
+				depends=["view:%s" % v["name"]], stage="refresh_materialized_views")
+
+	#-------------------------------------------------------------------------------
+	# (depends, after) of a task working on table: the table's load task, the
+	# tasks every sql task waits for and, for tables that are neither loaded
+	# nor known to exist already, every load
+	#
+	def get_table_deps(self, table, context):
+		if table in context["loads"]:
+			return [context["loads"][table]], list(context["barrier"])
+		if table in context["tables"]:
+			return [], list(context["barrier"])
+		return [], context["all_loads"] + context["barrier"]
+
+	def get_load_key(self, job):
+		return "load:" + self.get_table_name(job)
+
+	def get_loaded(self, graph, jobs):
+		key = "logged:%s" if self.staging else "load:%s"
+		return [job for job in jobs if graph.succeeded(key % self.get_table_name(job))]
+
+	def switch_loaded(self, graph, filegdb, jobs):
+		lookup_tables = filegdb.domain_tables if graph.succeeded("lookup_tables") else []
+		return self.switch_staging(self.get_loaded(graph, jobs), lookup_tables)
+
+	def save_loaded_fingerprints(self, graph, jobs):
+		self.save_fingerprints(self.get_loaded(graph, jobs))
+
+	#-------------------------------------------------------------------------------
+	# Checkpoint journal
+	# Every pipeline task that succeeds is recorded in the journal next to the
+	# sql folder. With --resume the tasks completed by the previous run of the
+	# same geodatabase into the same database are skipped.
+	#
+	def open_journal(self, filegdb):
+		self.journal = self.get_journal(filegdb)
+		self.completed = self.journal.open(self.resume)
+
+	def get_journal(self, filegdb):
+		header = { "workspace": filegdb.workspace_path, "fingerprint": filegdb.get_workspace_fingerprint(),
+			"database": "{}:{}/{}".format(self.host, self.port, self.dbname) }
+		return Journal(filegdb.journalfile_path, header)
+
+	#-------------------------------------------------------------------------------
+	# Tasks using the main connection run one at a time
+	#
+	def on_connection(self, func, *args):
+		with self.conn_lock:
+			try:
+				return func(*args)
+			except psycopg2.Error:
+				self.conn.rollback()
+				raise
+
+	def get_loader(self, filegdb):
+		# the loaders need the GDAL python bindings, ogr2ogr does not
+		if self.engine == "gdal":
+			from .ogrloader import OGRLoader
+			return OGRLoader(self, filegdb.workspace)
+		elif self.engine == "copy":
+			from .pgcopy import BinaryCopyLoader
+			return BinaryCopyLoader(self, filegdb.workspace)
+		return None
+
+	#-------------------------------------------------------------------------------
+	# Lookup tables (domains and subtypes) are built in memory by FileGDB and
+	# written with one binary COPY each, all of them in one transaction. With
+	# staging they are written to the staging schema and switched with the
+	# layers.
+	#
+	def load_lookup_tables(self, filegdb):
+		logging.debug(  "Loading {} lookup tables ...".format(len(filegdb.domain_tables)) )
+		cursor = self.conn.cursor()
+		try:
+			for lut in filegdb.domain_tables:
+				table = "{}.{}".format(lut["schema"], lut["feature"].lower())
+				start = time.time()
+				copy_lookup_table(cursor, "{}.{}".format(self.staging_schema if self.staging else lut["schema"],
+					lut["feature"].lower()), lut["columns"], lut["rows"])
+				self.report.record("load_database", table, time.time() - start, rows=lut["count"])
+			self.conn.commit()
+		except psycopg2.Error as err:
+			self.conn.rollback()
+			logging.error(  str(err)  )
+			logging.error(  "Unable to load lookup tables ..." )
+			return 1
+		finally:
+			cursor.close()
+		return 0
 
-		commands = []
-		for domain in filegdb.domain_tables:
-			#logging.debug( domain)
-			c = gdal_cmd.format(  self.conn_string, filegdb.workspace, domain["feature"], self.a_srs, self.t_srs, domain["feature"].lower(), 
-				domain["schema"] , ""  )
-			commands.append(c)
+	'''
+	Build one load job per feature class, largest first so that the longest
+	load is not the last one to start
+	'''
+	def get_load_jobs(self, filegdb):
+		jobs = []
 
-		#TODO  tables
+		for table in filegdb.tables_list:
+			jobs.append( { "feature": table["feature"], "schema": table["schema"], "count": table["count"],
+				"workspace": filegdb.workspace, "gdal_type": "", "geometry": False } )
 
 		for feat in filegdb.standalone_features:
-			logging.debug( feat)
-		
+			jobs.append( { "feature": feat["feature"], "schema": feat["schema"], "count": feat["count"],
+				"workspace": filegdb.workspace, "gdal_type": self.get_gdal_type( feat ), "geometry": True } )
+
 		#logging.debug( filegdb.datasets )
 		datasets = filegdb.datasets
 		for d  in datasets:
@@ -143,25 +556,253 @@ class PostGIS:
 			features = datasets[d] 
 			for feat in features:
 				logging.debug( feat)
-				c = gdal_cmd.format(  self.conn_string, filegdb.workspace, feat["feature"], self.a_srs, self.t_srs, feat["feature"].lower(), 
-					feat["schema"], self.get_gdal_type( feat )  )
-				commands.append(c)
+				jobs.append( { "feature": feat["feature"], "schema": feat["schema"], "count": feat["count"],
+					"workspace": filegdb.workspace, "gdal_type": self.get_gdal_type( feat ), "geometry": True } )
+
+		sizes = filegdb.get_table_sizes()
+		for job in jobs:
+			job["bytes"] = sizes.get(job["feature"])
+
+		# sort is stable, equally sized layers keep their discovery order
+		jobs.sort(key=lambda x: x["count"], reverse=True)
+		return jobs
+
+	#-------------------------------------------------------------------------------
+	# Table packs
+	# Small non-spatial tables of the same schema are packed together and
+	# loaded by a single task in one session: one ogr2ogr call, one
+	# VectorTranslate or one COPY transaction, so that opening the geodatabase
+	# and the database does not dominate their load time. Each table keeps its
+	# own load task, which picks up the result of its pack.
+	#
+	def get_table_packs(self, jobs):
+		packs = []
+		last = {}
+		for job in jobs:
+			if job["geometry"] or job["count"] >= self.batch_size:
+				continue
+			pack = last.get(job["schema"])
+			if pack is None or pack["count"] + job["count"] > self.batch_size or len(pack["jobs"]) >= self.pack_tables:
+				pack = { "key": "pack:{}:{}".format(job["schema"], len(packs)), "schema": job["schema"], "count": 0, "jobs": [] }
+				packs.append(pack)
+				last[job["schema"]] = pack
+			pack["jobs"].append(job)
+			pack["count"] += job["count"]
+
+		packs = [pack for pack in packs if len(pack["jobs"]) > 1]
+		for pack in packs:
+			for job in pack["jobs"]:
+				job["pack"] = pack["key"]
+		return packs
+
+	#-------------------------------------------------------------------------------
+	# Chunked loads
+	# A layer with at least twice --chunk_rows rows is split into FID ranges of
+	# about --chunk_rows rows. The first chunk creates the empty table, the
+	# ranges are then loaded concurrently into it, each keeping the source FIDs
+	# as ids, and the load task of the layer moves the id sequence past the
+	# largest FID. The last range is open ended, FIDs left by deleted rows
+	# only make it longer.
+	#
+	def get_chunks(self, job):
+		if not self.chunk_rows or job["count"] < 2 * self.chunk_rows:
+			return []
+
+		ranges = -(-job["count"] // self.chunk_rows)
+		size = -(-job["count"] // ranges)
+		chunks = []
+		# geodatabase FIDs start at 1, the first chunk only creates the table
+		bounds = [(None, 1)] + [(1 + i * size, 1 + (i + 1) * size if i < ranges - 1 else None) for i in range(ranges)]
+		for i, (first, last) in enumerate(bounds):
+			chunk = dict(job)
+			chunk["chunk"] = { "index": i, "first": first, "last": last }
+			chunk["count"] = 0 if i == 0 else min(size, job["count"] - (i - 1) * size)
+			if job.get("bytes"):
+				chunk["bytes"] = job["bytes"] * chunk["count"] // job["count"]
+			chunks.append(chunk)
+		return chunks
+
+	def add_chunk_tasks(self, graph, job, chunks):
+		create = graph.add(self.get_chunk_key(chunks[0]), self.timed_load, (chunks[0],), stage="load_database")
+		keys = [create] + [graph.add(self.get_chunk_key(chunk), self.load_chunk, (chunk,), depends=[create],
+			stage="load_database") for chunk in chunks[1:]]
+
+		table = "{}.{}".format(job["schema"], job["feature"].lower())
+		unit = { "key": self.get_table_name(job), "statements": [
+			"SELECT setval(pg_get_serial_sequence('{0}', 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {0};".format(table) ] }
+		return graph.add(self.get_load_key(job), self.run_sql_unit, ("load_database", unit), depends=keys, stage="load_database")
+
+	def get_chunk_key(self, chunk):
+		return "chunk:{}:{}".format(self.get_table_name(chunk), chunk["chunk"]["index"])
+
+	def get_chunk_filter(self, chunk, column="FID"):
+		clauses = []
+		if chunk["chunk"]["first"] is not None:
+			clauses.append( "{} >= {}".format(column, chunk["chunk"]["first"]) )
+		if chunk["chunk"]["last"] is not None:
+			clauses.append( "{} < {}".format(column, chunk["chunk"]["last"]) )
+		return " AND ".join(clauses)
+
+	def load_chunk(self, chunk):
+		# rows of the range left by an interrupted run (--resume) are loaded again
+		table = "{}.{}".format(chunk["schema"], chunk["feature"].lower())
+		failed = self.run_unit( { "key": self.get_chunk_key(chunk), "statements": [
+			"DELETE FROM {} WHERE {};".format(table, self.get_chunk_filter(chunk, "id")) ] } )
+		if failed:
+			return failed
+		return self.timed_load(chunk)
+
+	def timed_load_pack(self, pack):
+		start = time.time()
+		results = self.load_pack_func(pack["jobs"])
+		for job, rc in zip(pack["jobs"], results):
+			job["rc"] = rc
+		self.report.record("load_database", pack["key"], time.time() - start, rows=pack["count"],
+			bytes=sum([job.get("bytes") or 0 for job in pack["jobs"]]) or None, ok=not any(results))
+		return len([rc for rc in results if rc])
+
+	def load_packed(self, job):
+		if "rc" in job:
+			return job["rc"]
+		# the pack did not run (completed by a previous run) or broke down
+		return self.timed_load(job)
+
+	def timed_load(self, job):
+		start = time.time()
+		rc = self.load_func(job)
+		self.report.record("load_database", self.get_table_name(job), time.time() - start,
+			rows=job["count"], bytes=job.get("bytes"), ok=rc == 0)
+		return rc
+
+	def get_table_name(self, job):
+		return "{}.{}".format(job.get("final_schema", job["schema"]), job["feature"].lower())
+
+	#-------------------------------------------------------------------------------
+	# Staging loads
+	# Layers are loaded into UNLOGGED tables of the staging schema (indexes
+	# included) and switched to LOGGED as soon as they are loaded, they are
+	# then moved into their final schema in one short transaction, along with
+	# the lookup tables. Failed layers are left in the staging schema.
+	#
+	def switch_staging(self, jobs, lookup_tables=()):
+		logging.debug(  "Switching {} staging tables ...".format(len(jobs) + len(lookup_tables)) )
+
+		tables = [(job["feature"].lower(), job["final_schema"]) for job in jobs]
+		tables += [(lut["feature"].lower(), lut["schema"]) for lut in lookup_tables]
+		cursor = self.conn.cursor()
+		try:
+			for table, schema in tables:
+				cursor.execute("DROP TABLE IF EXISTS {}.{} CASCADE;".format(schema, table))
+				cursor.execute("ALTER TABLE {}.{} SET SCHEMA {};".format(self.staging_schema, table, schema))
+			self.conn.commit()
+		except psycopg2.Error as err:
+			self.conn.rollback()
+			logging.error(  str(err)  )
+			logging.error(  "Unable to switch staging tables, they are kept in %s ..." % self.staging_schema )
+			return 1
+		finally:
+			cursor.close()
+		return 0
 
-		for cmd in commands:
-			logging.debug(cmd)
-			system(cmd)
+	#-------------------------------------------------------------------------------
+	# Incremental loads
+	# Per layer fingerprints (row count, extent, .gdbtable size and mtime) are
+	# kept in the layers table of the target database, only layers whose
+	# fingerprint changed since the last load are reloaded
+	#
+	def get_changed_jobs(self, filegdb, jobs):
+		self.execute("CREATE TABLE IF NOT EXISTS {} (layer text PRIMARY KEY, fingerprint text, loaded_at timestamp);".format(self.layers_table))
 
+		cursor = self.conn.cursor()
+		cursor.execute("SELECT layer, fingerprint FROM {} ;".format(self.layers_table))
+		stored = dict(cursor.fetchall())
+		cursor.close()
 
-		# cmd = 'ogr2ogr -f "PostgreSQL" "PG:%s" 	-overwrite -progress -skipfailures -append \
-		# 	-a_srs %s 	-t_srs %s 	-lco launder=yes  -lco fid=id  \
-		# 	-lco geometry_name=geom -lco OVERWRITE=YES  \
-		# 	--config OGR_TRUNCATE YES 	--config PG_USE_COPY YES \
-		# 	%s' % (self.conn_string, self.a_srs, self.t_srs, filegdb.workspace)
-		# logging.debug( cmd)
-		# system(cmd)
+		fingerprints = filegdb.get_fingerprints([job["feature"] for job in jobs])
+		changed = []
+		for job in jobs:
+			key = self.get_table_name(job)
+			job["fingerprint"] = json.dumps(fingerprints.get(job["feature"]), sort_keys=True)
+			if stored.get(key) == job["fingerprint"]:
+				logging.debug(  "Unchanged, skipping %s" % key )
+				continue
+			changed.append(job)
+
+		logging.debug(  "Incremental load: {} of {} layers changed".format(len(changed), len(jobs)) )
+		return changed
+
+	def save_fingerprints(self, jobs):
+		sql = "INSERT INTO {} (layer, fingerprint, loaded_at) VALUES (%s, %s, now()) \
+			ON CONFLICT (layer) DO UPDATE SET fingerprint = EXCLUDED.fingerprint, loaded_at = EXCLUDED.loaded_at ;".format(self.layers_table)
+		cursor = self.conn.cursor()
+		for job in jobs:
+			cursor.execute(sql, (self.get_table_name(job), job["fingerprint"]))
+		cursor.close()
+		self.conn.commit()
+
+	def get_ogr2ogr_cmd(self, job):
+		# progress dots from concurrent loads would interleave on the console
+		progress = "-progress" if self.jobs <= 1 else ""
+		unlogged = "-lco UNLOGGED=ON" if job.get("unlogged") else ""
+		nlt = "-nlt  {}".format(job["gdal_type"]) if job["gdal_type"] else ""
+
+		gdal_cmd = 'ogr2ogr -f "PostgreSQL" "PG:{}"  {}  {}   -overwrite {} -skipfailures -append \
+			-a_srs {} 	-t_srs {} 	-lco launder=yes  -lco fid=id  	-lco GEOMETRY_NAME=geom -lco OVERWRITE=YES  \
+			-lco SPATIAL_INDEX=NONE --config OGR_TRUNCATE YES -nln {} -lco SCHEMA={} {} --config PG_USE_COPY YES {}  '
+
+		return gdal_cmd.format(  self.conn_string, job["workspace"], job["feature"], progress, self.a_srs, self.t_srs,
+			job["feature"].lower(), job["schema"], unlogged, nlt  )
+
+	#-------------------------------------------------------------------------------
+	# One ogr2ogr call per chunk of a chunked layer, the first one creates the
+	# table, the others append their FID range to it without truncating it
+	#
+	def get_ogr2ogr_chunk_cmd(self, job):
+		where = '-preserve_fid -where "{}"'.format(self.get_chunk_filter(job))
+		if job["chunk"]["index"] == 0:
+			return self.get_ogr2ogr_cmd(job) + where
+
+		nlt = "-nlt  {}".format(job["gdal_type"]) if job["gdal_type"] else ""
+
+		gdal_cmd = 'ogr2ogr -f "PostgreSQL" "PG:{}"  {}  {}  -append -skipfailures {} \
+			-a_srs {} 	-t_srs {} 	-nln {}.{} --config PG_USE_COPY YES {}  '
+
+		return gdal_cmd.format(  self.conn_string, job["workspace"], job["feature"], where, self.a_srs, self.t_srs,
+			job["schema"], job["feature"].lower(), nlt  )
+
+	#-------------------------------------------------------------------------------
+	# One ogr2ogr call for a pack of non-spatial tables, they keep their
+	# (laundered) names
+	#
+	def get_ogr2ogr_pack_cmd(self, jobs):
+		unlogged = "-lco UNLOGGED=ON" if jobs[0].get("unlogged") else ""
+
+		gdal_cmd = 'ogr2ogr -f "PostgreSQL" "PG:{}"  {}  {}   -overwrite -skipfailures -append \
+			-lco launder=yes  -lco fid=id  -lco OVERWRITE=YES  \
+			--config OGR_TRUNCATE YES -lco SCHEMA={} {} --config PG_USE_COPY YES  '
+
+		return gdal_cmd.format(  self.conn_string, jobs[0]["workspace"], " ".join([job["feature"] for job in jobs]),
+			jobs[0]["schema"], unlogged  )
+
+	def load_layer(self, job):
+		cmd = self.get_ogr2ogr_chunk_cmd(job) if "chunk" in job else self.get_ogr2ogr_cmd(job)
+		logging.debug(cmd)
+		rc = system(cmd)
+		if rc != 0:
+			logging.error(  "ogr2ogr exited with {} for {}".format(rc, job["feature"]) )
+		return rc
+
+	def load_layers(self, jobs):
+		cmd = self.get_ogr2ogr_pack_cmd(jobs)
+		logging.debug(cmd)
+		rc = system(cmd)
+		if rc != 0:
+			logging.error(  "ogr2ogr exited with {} for {}".format(rc, ", ".join([job["feature"] for job in jobs])) )
+		return [rc] * len(jobs)
 
 	def update_views(self):
-		
+		if self.connections is not None and self.connections.is_done("update_views", self.dbname):
+			return
 
 		logging.debug(  "Updating database views ..."  )
 		sql_files = [
@@ -172,40 +813,158 @@ class PostGIS:
 		for sql_file in sql_files:
 			sql_file = path.join(path.abspath(path.dirname(__file__)), 'sql_files/%s' % sql_file)
 			self.execute_sql(sql_file)
+		if self.connections is not None:
+			self.connections.set_done("update_views", self.dbname)
 
 	def create_schemas(self, filegdb):
 		logging.debug(  "Creating schemas ..."  )
 
-		sql_files = ['create_schemas.sql']
-		for sql_file in sql_files:
-			sql_file = path.join(filegdb.sqlfolder_path, sql_file)
-			self.execute_sql(sql_file)
-
-	def apply_sql(self, filegdb):
-		logging.debug(  "Applying sql scripts ..." )
-		sql_files = [
-			'fix_data_errors.sql',
-			'create_indexes.sql',
-			'create_constraints.sql',
-			'split_schemas.sql', 
-			'views.sql'
-		]
-
-		for sql_file in sql_files:
-			sql_file = path.join(filegdb.sqlfolder_path, sql_file)
-			self.execute_sql(sql_file)
+		# the create_schemas script drops the schemas, keep them on incremental, staging and resumed loads
+		if self.incremental or self.staging or self.completed:
+			self.execute("CREATE EXTENSION IF NOT EXISTS postgis;")
+			for schema in filegdb.schemas:
+				if schema.lower() != 'public':
+					self.execute('CREATE SCHEMA IF NOT EXISTS "%s";' % schema.lower())
+			if self.staging and self.completed:
+				self.execute('CREATE SCHEMA IF NOT EXISTS "%s";' % self.staging_schema)
+			elif self.staging:
+				self.execute('DROP SCHEMA IF EXISTS "%s" CASCADE;' % self.staging_schema)
+				self.execute('CREATE SCHEMA "%s";' % self.staging_schema)
+			return
+
+		self.execute_script(filegdb, "create_schemas")
+
+	def has_statements(self, filegdb, name):
+		return len([s for s in filegdb.get_statements(name) if not sqlunits.is_session_statement(s)]) > 0
+
+	def get_session_sql(self, statements):
+		session_sql = []
+		for s in statements:
+			if sqlunits.is_session_statement(s) and s not in session_sql:
+				session_sql.append(s)
+		if self.maintenance_work_mem:
+			session_sql.append("SET maintenance_work_mem = '%s';" % self.maintenance_work_mem)
+		if self.parallel_maintenance_workers is not None:
+			session_sql.append("SET max_parallel_maintenance_workers = %d;" % self.parallel_maintenance_workers)
+		return session_sql
+
+	#-------------------------------------------------------------------------------
+	# Pool of --jobs connections shared by the sql tasks, session_sql is run
+	# once on each connection
+	#
+	def open_pool(self, session_sql=None):
+		session_sql = session_sql or []
+		if self.connections is not None:
+			# the pool was used by the previous conversion, undo its session settings
+			self.pool = self.connections.get_pool(self.conn_string, max(1, self.jobs))
+			session_sql = ["RESET ALL;"] + session_sql
+		else:
+			self.pool = ThreadedConnectionPool(1, max(1, self.jobs), self.conn_string)
+		self.session_sql = session_sql
+		self.configured = set()
+
+	def close_pool(self):
+		if self.pool is not None:
+			if self.connections is None:
+				self.pool.closeall()
+			self.pool = None
+
+	def run_sql_unit(self, stage, unit):
+		start = time.time()
+		failed = self.run_unit(unit)
+		self.report.record(stage, unit["key"], time.time() - start, ok=failed == 0)
+		return failed
+
+	#-------------------------------------------------------------------------------
+	# Foreign key validation
+	# Constraints are created NOT VALID, they are validated in one unit per
+	# referenced lookup table and the time spent on each one is logged
+	#
+	def get_validation_units(self, filegdb):
+		units = []
+		by_parent = {}
+		for fk in filegdb.foreign_key_constraints:
+			if fk["parent"] not in by_parent:
+				by_parent[fk["parent"]] = { "key": fk["parent"], "statements": [], "batch": 1 }
+				units.append(by_parent[fk["parent"]])
+			by_parent[fk["parent"]]["statements"].append( "ALTER TABLE {} VALIDATE CONSTRAINT {};".format(fk["table"], fk["name"]) )
+		return units
+
+	def log_validation_timings(self):
+		logging.debug(  "Foreign key validation timings:" )
+		timings = [t for t in self.timings if "VALIDATE CONSTRAINT" in t["sql"]]
+		for t in sorted(timings, key=lambda x: x["seconds"], reverse=True):
+			logging.debug(  " {:>10.3f}s {:<6} {}".format(t["seconds"], "ok" if t["ok"] else "FAILED", t["sql"]) )
+
+	#-------------------------------------------------------------------------------
+	# Statements of a unit run in order on a pooled connection, see
+	# run_statements. Validation units run one statement per batch to time
+	# each constraint.
+	#
+	def run_unit(self, unit):
+		conn = self.pool.getconn()
+		try:
+			if id(conn) not in self.configured:
+				cursor = conn.cursor()
+				for sql in self.session_sql:
+					cursor.execute(sql)
+				cursor.close()
+				conn.commit()
+				self.configured.add(id(conn))
+
+			return self.run_statements(conn, unit["key"], unit["statements"], unit.get("batch"))
+		finally:
+			self.pool.putconn(conn)
+
+	#-------------------------------------------------------------------------------
+	# Run statements in batches, each batch is sent as one command in its own
+	# transaction. A failing batch is rolled back and its statements run again
+	# one by one, so that only the failing statements are lost and reported.
+	# Returns the number of failed statements.
+	#
+	def run_statements(self, conn, key, statements, batch=None):
+		batch = batch or self.statement_batch
+		cursor = conn.cursor()
+		failed = 0
+		for i in range(0, len(statements), batch):
+			failed += self.run_batch(conn, cursor, key, statements[i:i + batch])
+			if len(statements) > batch:
+				logging.debug(  "{}: {}/{} statements".format(key, min(i + batch, len(statements)), len(statements)) )
+		cursor.close()
+		return failed
 
+	def run_batch(self, conn, cursor, key, statements):
+		start = time.time()
+		try:
+			cursor.execute("\n".join(statements))
+			conn.commit()
+			ok = True
+		except psycopg2.Error as err:
+			conn.rollback()
+			if len(statements) > 1:
+				return sum([self.run_batch(conn, cursor, key, [sql]) for sql in statements])
+			logging.error(  str(err)  )
+			logging.error(  statements[0] )
+			ok = False
+		self.timings.append( { "key": key, "sql": "\n".join(statements), "statements": len(statements),
+			"seconds": time.time() - start, "ok": ok } )
+		return 0 if ok else 1
 
-	
 	def execute(self, sql):
 		cursor = self.conn.cursor()
-		cursor.execute(sql)
-		cursor.close()
+		try:
+			cursor.execute(sql)
+		except psycopg2.Error:
+			self.conn.rollback()
+			raise
+		finally:
+			cursor.close()
 		self.conn.commit()
 
-	def execute_sql(self, sql_file):
+	def execute_sql(self, sql_file, stage=None):
 		cursor = self.conn.cursor()
 
+		start = time.time()
 		if path.exists(sql_file):
 			# logging.debug(  " %s" % sql_file )
 			with open(sql_file, "r") as sql:
@@ -217,3 +976,18 @@ class PostGIS:
 
 		cursor.close()
 		self.conn.commit()
+		self.record_sql(sql_file, time.time() - start, stage=stage)
+
+	#-------------------------------------------------------------------------------
+	# Run a script generated by FileGDB on the main connection
+	#
+	def execute_script(self, filegdb, name, stage=None):
+		statements = filegdb.get_statements(name)
+		start = time.time()
+		failed = self.run_statements(self.conn, name, statements)
+		self.report.record(stage or self.current_stage, "%s.sql" % name, time.time() - start, ok=failed == 0)
+		return failed
+
+	def record_sql(self, sql_file, seconds, ok=True, stage=None):
+		size = path.getsize(sql_file) if path.exists(sql_file) else None
+		self.report.record(stage or self.current_stage, path.basename(sql_file), seconds, bytes=size, ok=ok)
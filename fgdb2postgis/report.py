@@ -0,0 +1,101 @@
+#-*- coding: UTF-8 -*-
+##
+ # report.py
+ #
+ # Description: Per stage and per item (layer, sql file) timing and
+ #              throughput of a conversion, saved as a json run report
+ # Copyright: Cartologic 2017
+ #
+ ##
+import logging, json, time, threading
+from contextlib import contextmanager
+
+REPORT_VERSION = 1
+
+
+class RunReport:
+	def __init__(self, name=None):
+		self.name = name
+		self.started = time.time()
+		self.finished = None
+		self.stages = []
+		self.items = []
+		self.lock = threading.Lock()
+
+	#-------------------------------------------------------------------------------
+	# Time a pipeline stage
+	#
+	@contextmanager
+	def stage(self, name):
+		start = time.time()
+		logging.debug( "stage %s ..." % name )
+		try:
+			yield
+		finally:
+			seconds = time.time() - start
+			self.add_stage(name, seconds)
+			logging.debug( "stage %s done in %.3fs" % (name, seconds) )
+
+	def add_stage(self, name, seconds):
+		with self.lock:
+			self.stages.append( { "name": name, "seconds": seconds } )
+
+	#-------------------------------------------------------------------------------
+	# Record one item (layer load, sql file ...) of a stage
+	#
+	def record(self, stage, name, seconds, rows=None, bytes=None, ok=True):
+		item = { "stage": stage, "name": name, "seconds": seconds, "rows": rows, "bytes": bytes, "ok": ok,
+			"rows_per_sec": self.rate(rows, seconds) }
+		with self.lock:
+			self.items.append(item)
+		return item
+
+	def rate(self, value, seconds):
+		if value is None or not seconds:
+			return None
+		return value / seconds
+
+	def get_stages(self):
+		stages = []
+		for stage in self.stages:
+			items = [i for i in self.items if i["stage"] == stage["name"]]
+			rows = sum([i["rows"] for i in items if i["rows"] is not None]) if items else None
+			size = sum([i["bytes"] for i in items if i["bytes"] is not None]) if items else None
+			stages.append( { "name": stage["name"], "seconds": stage["seconds"], "items": len(items),
+				"rows": rows, "bytes": size, "rows_per_sec": self.rate(rows, stage["seconds"]),
+				"bytes_per_sec": self.rate(size, stage["seconds"]) } )
+		return stages
+
+	def to_dict(self):
+		finished = self.finished or time.time()
+		return {
+			"version": REPORT_VERSION,
+			"name": self.name,
+			"started": self.started,
+			"finished": finished,
+			"seconds": finished - self.started,
+			"stages": self.get_stages(),
+			"items": self.items
+		}
+
+	def save(self, report_path):
+		self.finished = time.time()
+		logging.debug( "Saving run report %s ..." % report_path )
+		with open(report_path, 'w') as f:
+			json.dump(self.to_dict(), f, indent=2)
+
+	#-------------------------------------------------------------------------------
+	# Log a summary table of the stages
+	#
+	def summary(self):
+		data = self.to_dict()
+		logging.info( "%-28s %10s %8s %12s %14s %12s" % ("stage", "seconds", "items", "rows", "bytes", "rows/sec") )
+		for s in data["stages"]:
+			logging.info( "%-28s %10.2f %8d %12s %14s %12s" % (s["name"], s["seconds"], s["items"],
+				self.format_value(s["rows"]), self.format_value(s["bytes"]), self.format_value(s["rows_per_sec"])) )
+		logging.info( "%-28s %10.2f" % ("total", data["seconds"]) )
+
+	def format_value(self, value):
+		if value is None:
+			return "-"
+		return "%d" % value
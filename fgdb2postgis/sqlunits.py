@@ -0,0 +1,141 @@
+#-*- coding: UTF-8 -*-
+##
+ # sqlunits.py
+ #
+ # Description: Collect the generated sql scripts in memory and split them into
+ #              units of work that can be executed independently on a pool
+ #              of connections
+ # Copyright: Cartologic 2017
+ #
+ ##
+import re
+
+INDEX_RE = re.compile(r'CREATE\s+(?:UNIQUE\s+)?INDEX\s+(?:IF\s+NOT\s+EXISTS\s+)?\S+\s+ON\s+(\S+)', re.I)
+ALTER_TABLE_RE = re.compile(r'ALTER\s+TABLE\s+(\S+)', re.I)
+REFERENCES_RE = re.compile(r'REFERENCES\s+(\S+)', re.I)
+VIEW_RE = re.compile(r'MATERIALIZED\s+VIEW\s+(?:IF\s+(?:NOT\s+)?EXISTS\s+)?([^\s;]+)', re.I)
+
+
+#-------------------------------------------------------------------------------
+# In-memory sql script, FileGDB writes to it like to a file, one or more whole
+# lines at a time. Saving it as a .sql file is optional.
+#
+class SqlScript:
+	def __init__(self, name):
+		self.name = name
+		self.chunks = []
+		self.statements = None
+
+	def write(self, text):
+		self.chunks.append(text)
+		self.statements = None
+
+	def lines(self):
+		for chunk in self.chunks:
+			for line in chunk.splitlines():
+				yield line
+
+	def get_statements(self):
+		if self.statements is None:
+			self.statements = split_lines(self.lines())
+		return self.statements
+
+	def save(self, sql_file):
+		with open(sql_file, "w") as f:
+			f.writelines(self.chunks)
+
+#-------------------------------------------------------------------------------
+# Split sql code into statements, a statement ends with ';' at the end of a line
+# Comments and blank lines between statements are dropped
+#
+def split_statements(code):
+	return split_lines(code.splitlines())
+
+def split_lines(lines):
+	statements = []
+	current = []
+	for line in lines:
+		stripped = line.strip()
+		if not current and (not stripped or stripped.startswith("--")):
+			continue
+		current.append(line)
+		if stripped.endswith(";"):
+			statements.append("\n".join(current).strip())
+			current = []
+
+	if current:
+		statements.append("\n".join(current).strip())
+	return statements
+
+#-------------------------------------------------------------------------------
+# Session statements (SET ...) are applied once per connection, they are
+# not units of work
+#
+def is_session_statement(statement):
+	return statement.upper().startswith("SET ")
+
+#-------------------------------------------------------------------------------
+# Every CREATE INDEX is a unit of its own
+#
+def index_units(statements):
+	return [ { "key": get_index_table(s), "statements": [s] } for s in statements if not is_session_statement(s) ]
+
+#-------------------------------------------------------------------------------
+# Foreign key constraints are grouped by their parent (referenced) table,
+# constraints on the same parent would otherwise queue on its lock. The
+# DROP CONSTRAINT preceding each ADD CONSTRAINT stays in the same unit.
+#
+def constraint_units(statements):
+	units = []
+	by_parent = {}
+	pending = []
+	for s in statements:
+		if is_session_statement(s):
+			continue
+		pending.append(s)
+		parent = get_parent_table(s)
+		if parent is None:
+			continue
+
+		if parent not in by_parent:
+			by_parent[parent] = { "key": parent, "statements": [] }
+			units.append(by_parent[parent])
+		by_parent[parent]["statements"] += pending
+		pending = []
+
+	if pending:
+		units.append( { "key": None, "statements": pending } )
+	return units
+
+#-------------------------------------------------------------------------------
+# Materialized view statements are grouped by view, the DROP preceding each
+# CREATE stays in the same unit
+#
+def view_units(statements):
+	units = []
+	by_view = {}
+	for s in statements:
+		if is_session_statement(s):
+			continue
+		view = get_view(s)
+		if view not in by_view:
+			by_view[view] = { "key": view, "statements": [] }
+			units.append(by_view[view])
+		by_view[view]["statements"].append(s)
+	return units
+
+def get_index_table(statement):
+	m = INDEX_RE.search(statement)
+	return m.group(1) if m else None
+
+def get_table(statement):
+	m = ALTER_TABLE_RE.search(statement)
+	return m.group(1) if m else None
+
+def get_parent_table(statement):
+	m = REFERENCES_RE.search(statement)
+	return m.group(1) if m else None
+
+def get_view(statement):
+	m = VIEW_RE.search(statement)
+	return m.group(1) if m else None
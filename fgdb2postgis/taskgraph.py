@@ -0,0 +1,288 @@
+#-*- coding: UTF-8 -*-
+##
+ # taskgraph.py
+ #
+ # Description: Run tasks with explicit dependencies over a bounded set of
+ #              workers, a task starts as soon as the tasks it depends on
+ #              are finished
+ # Copyright: Cartologic 2017
+ #
+ ##
+import logging, threading, time, heapq
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+class TaskGraph:
+	def __init__(self):
+		self.tasks = []
+		self.by_key = {}
+		self.cond = threading.Condition()
+		self.running = 0
+
+	#-------------------------------------------------------------------------------
+	# Add a task, func(*args) returns 0 on success
+	# depends: tasks that must succeed first, the task is skipped otherwise
+	# after:   tasks that must be finished first, whatever their outcome
+	# Ready tasks are started deepest first, then in the order they were
+	# added, see get_depths.
+	#
+	def add(self, key, func, args=(), depends=(), after=(), stage=None):
+		if key in self.by_key:
+			raise ValueError("Duplicate task %s" % key)
+
+		depends = unique([d for d in depends if d != key])
+		required = set(depends)
+		task = { "key": key, "func": func, "args": args, "stage": stage, "depends": depends,
+			"after": unique([a for a in after if a != key and a not in required]),
+			"state": PENDING, "result": None, "started": None, "finished": None }
+		self.tasks.append(task)
+		self.by_key[key] = task
+		return key
+
+	def has(self, key):
+		return key in self.by_key
+
+	def succeeded(self, key):
+		return key in self.by_key and self.by_key[key]["state"] == DONE
+
+	def get_keys(self, state):
+		return [t["key"] for t in self.tasks if t["state"] == state]
+
+	#-------------------------------------------------------------------------------
+	# Run every task with at most `jobs` of them at a time
+	# Tasks in `completed` are not run again, see get_resumed. on_done is
+	# called with the key of every task that succeeds.
+	#
+	def run(self, jobs=1, completed=(), on_done=None):
+		self.on_done = on_done
+		self.prepare(completed)
+
+		workers = max(1, min(jobs or 1, len(self.tasks)))
+		logging.debug( "TaskGraph: {} tasks on {} workers".format(len(self.tasks), workers) )
+		if workers == 1:
+			self.work()
+		else:
+			threads = [threading.Thread(target=self.work) for i in range(workers)]
+			for thread in threads:
+				thread.daemon = True
+				thread.start()
+			for thread in threads:
+				thread.join()
+
+		failed = self.get_keys(FAILED)
+		skipped = self.get_keys(SKIPPED)
+		if failed or skipped:
+			logging.error( "{} tasks failed, {} skipped: {}".format(len(failed), len(skipped), ", ".join(failed)) )
+		return failed
+
+	#-------------------------------------------------------------------------------
+	# Simulate a run on `jobs` workers without running any task: every task
+	# succeeds and takes cost(task) seconds, None counts as 0. Returns the
+	# tasks in the order they would start, their started and finished times
+	# are offsets from the start of the run. A graph is run or simulated once.
+	#
+	def simulate(self, jobs=1, cost=None, completed=()):
+		self.prepare(completed)
+
+		workers = max(1, jobs or 1)
+		now = 0.0
+		running = []
+		started = []
+		while True:
+			task = self.next_task() if len(running) < workers else None
+			if task is not None:
+				task["state"] = RUNNING
+				self.running += 1
+				seconds = cost(task) if cost is not None else None
+				task["started"] = now
+				task["finished"] = now + (seconds or 0)
+				heapq.heappush(running, (task["finished"], task["order"], task["key"]))
+				started.append(task)
+				continue
+
+			if not running:
+				return started
+			finished, order, key = heapq.heappop(running)
+			now = max(now, finished)
+			self.running -= 1
+			self.finish(self.by_key[key], DONE)
+
+	def prepare(self, completed):
+		for task in self.tasks:
+			for key in task["depends"] + task["after"]:
+				if key not in self.by_key:
+					raise ValueError("Task %s depends on unknown task %s" % (task["key"], key))
+
+		resumed = self.get_resumed(completed)
+		if resumed:
+			logging.debug( "TaskGraph: {} tasks completed by the previous run".format(len(resumed)) )
+		for task in self.tasks:
+			if task["key"] in resumed:
+				task["state"] = DONE
+
+		depths = self.get_depths()
+		self.dependents = dict((t["key"], []) for t in self.tasks)
+		self.ready = []
+		for order, task in enumerate(self.tasks):
+			task["order"] = order
+			task["depth"] = depths.get(task["key"], 0)
+			task["remaining"] = 0
+			if task["state"] != PENDING:
+				continue
+			for keys, required in [(task["depends"], True), (task["after"], False)]:
+				for key in keys:
+					if self.by_key[key]["state"] == PENDING:
+						self.dependents[key].append( (task, required) )
+						task["remaining"] += 1
+			if task["remaining"] == 0:
+				heapq.heappush(self.ready, (-task["depth"], order, task["key"]))
+
+	#-------------------------------------------------------------------------------
+	# Depth of each task: the length of the longest chain of tasks it waits
+	# for. Preferring deeper ready tasks finishes what was started first, the
+	# indexes of a loaded layer are built while the next layers still load
+	# instead of after every load has started. Tasks of a cycle have none.
+	#
+	def get_depths(self):
+		children = dict((t["key"], []) for t in self.tasks)
+		remaining = {}
+		for task in self.tasks:
+			for key in task["depends"] + task["after"]:
+				children[key].append(task["key"])
+			remaining[task["key"]] = len(task["depends"]) + len(task["after"])
+
+		depths = dict((key, 0) for key, count in remaining.items() if count == 0)
+		queue = list(depths)
+		while queue:
+			key = queue.pop()
+			for child in children[key]:
+				depths[child] = max(depths.get(child, 0), depths[key] + 1)
+				remaining[child] -= 1
+				if remaining[child] == 0:
+					queue.append(child)
+		return depths
+
+	def work(self):
+		while True:
+			with self.cond:
+				task = self.next_task()
+				while task is None and self.running:
+					self.cond.wait()
+					task = self.next_task()
+				if task is None:
+					self.cond.notify_all()
+					return
+				task["state"] = RUNNING
+				self.running += 1
+
+			# the other workers wait for this one, whatever happens to the task
+			state = FAILED
+			try:
+				state = self.run_task(task)
+			finally:
+				with self.cond:
+					self.running -= 1
+					self.finish(task, state)
+					self.cond.notify_all()
+
+	#-------------------------------------------------------------------------------
+	# A task that on_done fails to record (e.g. a journal write error) fails
+	#
+	def run_task(self, task):
+		task["started"] = time.time()
+		try:
+			task["result"] = task["func"](*task["args"])
+			state = FAILED if task["result"] else DONE
+			if state == DONE and self.on_done is not None:
+				self.on_done(task["key"])
+		except Exception as e:
+			logging.error( "Task %s: %s" % (task["key"], e) )
+			state = FAILED
+		task["finished"] = time.time()
+		return state
+
+	#-------------------------------------------------------------------------------
+	# A completed task is only skipped when none of the tasks it waits for
+	# runs again, a reloaded table loses its indexes, constraints and views
+	#
+	def get_resumed(self, completed):
+		resumed = set([key for key in completed if key in self.by_key])
+		changed = True
+		while changed:
+			changed = False
+			for task in self.tasks:
+				if task["key"] in resumed and [k for k in task["depends"] + task["after"] if k not in resumed]:
+					resumed.discard(task["key"])
+					changed = True
+		return resumed
+
+	#-------------------------------------------------------------------------------
+	# Release the tasks waiting on a finished task, called with the condition
+	# held. Tasks depending on a failed or skipped task are skipped in turn.
+	#
+	def finish(self, task, state):
+		finished = [(task, state)]
+		while finished:
+			task, state = finished.pop()
+			task["state"] = state
+			for dependent, required in self.dependents[task["key"]]:
+				if dependent["state"] != PENDING:
+					continue
+				if required and state != DONE:
+					logging.debug( "TaskGraph: skipping %s" % dependent["key"] )
+					dependent["state"] = SKIPPED
+					finished.append( (dependent, SKIPPED) )
+					continue
+				dependent["remaining"] -= 1
+				if dependent["remaining"] == 0:
+					heapq.heappush(self.ready, (-dependent["depth"], dependent["order"], dependent["key"]))
+
+	#-------------------------------------------------------------------------------
+	# Next ready task, deepest and earliest added first, called with the
+	# condition held.
+	# Tasks still pending once nothing is ready or running are part of a cycle.
+	#
+	def next_task(self):
+		while self.ready:
+			depth, order, key = heapq.heappop(self.ready)
+			if self.by_key[key]["state"] == PENDING:
+				return self.by_key[key]
+
+		if not self.running:
+			pending = self.get_keys(PENDING)
+			if pending:
+				logging.error( "Circular dependency between tasks: {}".format(pending) )
+				for key in pending:
+					self.by_key[key]["state"] = SKIPPED
+		return None
+
+	#-------------------------------------------------------------------------------
+	# Wall time of each stage, from the start of its first task to the end of
+	# its last one. Stages overlap.
+	#
+	def get_stage_spans(self):
+		spans = []
+		for task in self.tasks:
+			if task["stage"] is None or task["started"] is None:
+				continue
+			if task["stage"] not in [s[0] for s in spans]:
+				spans.append( [task["stage"], task["started"], task["finished"]] )
+			span = [s for s in spans if s[0] == task["stage"]][0]
+			span[1] = min(span[1], task["started"])
+			span[2] = max(span[2], task["finished"])
+		return [(name, finished - started) for name, started, finished in spans]
+
+
+def unique(keys):
+	result = []
+	seen = set()
+	for key in keys:
+		if key not in seen:
+			seen.add(key)
+			result.append(key)
+	return result
@@ -1,13 +1,12 @@
-
-from nose.tools import *
+#-*- coding: UTF-8 -*-
+import unittest
 import fgdb2postgis
 
-def setup():
-    print "SETUP!"
 
-def teardown():
-    print "TEAR DOWN!"
+class PackageTest(unittest.TestCase):
+	def test_version(self):
+		self.assertTrue(fgdb2postgis.get_current_version().startswith("0.4"))
+
 
-def test_basic():
-    print "I RAN!"
-    
\ No newline at end of file
+if __name__ == '__main__':
+	unittest.main()
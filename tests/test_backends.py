@@ -0,0 +1,208 @@
+#-*- coding: UTF-8 -*-
+import unittest
+from fgdb2postgis import gdalimport
+from fgdb2postgis.backends import GdalBackend, cast_value, get_field_type
+
+FEATURE_DATASET = "{74737149-DCB5-4257-8904-B9724E32A530}"
+FEATURE_CLASS = "{70737809-852C-4A03-9E22-2CECEA5B9BFA}"
+TABLE = "{CD06BC3B-789D-4C51-AAFA-A467912B8965}"
+RELATIONSHIP_CLASS = "{B606A7E1-FA5B-439C-849C-6E9C2481537B}"
+CODED_VALUE_DOMAIN = "{8C368B12-A12E-4C7E-9638-C9C64E69E98F}"
+RANGE_DOMAIN = "{C29DA988-8C3E-45F7-8B5C-18E51EE7BEB4}"
+WORKSPACE = "{C673FE0F-7280-404F-8532-20755DD8FC06}"
+
+PARCELS = """<DEFeatureClassInfo>
+	<CatalogPath>\\Cadastre\\Parcels</CatalogPath>
+	<Name>Parcels</Name>
+	<Fields><FieldArray>
+		<Field><Name>OBJECTID</Name><Type>esriFieldTypeOID</Type></Field>
+		<Field><Name>KIND</Name><Type>esriFieldTypeSmallInteger</Type></Field>
+		<Field><Name>LANDUSE</Name><Type>esriFieldTypeSmallInteger</Type></Field>
+		<Field><Name>GlobalID</Name><Type>esriFieldTypeGlobalID</Type></Field>
+		<Field><Name>OWNER_ID</Name><Type>esriFieldTypeGUID</Type></Field>
+	</FieldArray></Fields>
+	<GPFieldInfoExs>
+		<GPFieldInfoEx><Name>OBJECTID</Name></GPFieldInfoEx>
+		<GPFieldInfoEx><Name>LANDUSE</Name><DomainName>LandUse</DomainName></GPFieldInfoEx>
+	</GPFieldInfoExs>
+	<SubtypeFieldName>KIND</SubtypeFieldName>
+	<DefaultSubtypeCode>1</DefaultSubtypeCode>
+	<Subtypes>
+		<Subtype>
+			<SubtypeName>Urban</SubtypeName>
+			<SubtypeCode>1</SubtypeCode>
+			<FieldInfos>
+				<SubtypeFieldInfo><FieldName>LANDUSE</FieldName><DomainName>UrbanUse</DomainName></SubtypeFieldInfo>
+			</FieldInfos>
+		</Subtype>
+		<Subtype>
+			<SubtypeName>Rural</SubtypeName>
+			<SubtypeCode>2</SubtypeCode>
+		</Subtype>
+	</Subtypes>
+	<FeatureType>esriFTSimple</FeatureType>
+	<ShapeType>esriGeometryPolygon</ShapeType>
+	<RelationshipClassNames><Name>OwnersParcels</Name></RelationshipClassNames>
+</DEFeatureClassInfo>"""
+
+ROADS = """<DEFeatureClassInfo>
+	<CatalogPath>\\Roads</CatalogPath>
+	<FeatureType>esriFTSimpleEdge</FeatureType>
+	<ShapeType>esriGeometryPolyline</ShapeType>
+</DEFeatureClassInfo>"""
+
+OWNERS = """<DETableInfo>
+	<CatalogPath>\\Owners</CatalogPath>
+	<GPFieldInfoExs>
+		<GPFieldInfoEx><Name>NAME</Name></GPFieldInfoEx>
+	</GPFieldInfoExs>
+	<RelationshipClassNames><Name>OwnersParcels</Name></RelationshipClassNames>
+</DETableInfo>"""
+
+OWNERS_PARCELS = """<DERelationshipClassInfo>
+	<CatalogPath>\\OwnersParcels</CatalogPath>
+	<OriginClassNames><Name>Owners</Name></OriginClassNames>
+	<DestinationClassNames><Name>Parcels</Name></DestinationClassNames>
+	<IsAttachmentRelationship>false</IsAttachmentRelationship>
+	<OriginClassKeys>
+		<RelationshipClassKey>
+			<ObjectKeyName>OWNER_ID</ObjectKeyName>
+			<KeyRole>esriRelKeyRoleOriginForeign</KeyRole>
+		</RelationshipClassKey>
+		<RelationshipClassKey>
+			<ObjectKeyName>GlobalID</ObjectKeyName>
+			<KeyRole>esriRelKeyRoleOriginPrimary</KeyRole>
+		</RelationshipClassKey>
+	</OriginClassKeys>
+</DERelationshipClassInfo>"""
+
+LAND_USE = """<GPCodedValueDomain2>
+	<DomainName>LandUse</DomainName>
+	<FieldType>esriFieldTypeSmallInteger</FieldType>
+	<CodedValues>
+		<CodedValue><Name>Housing</Name><Code>1</Code></CodedValue>
+		<CodedValue><Name>Retail</Name><Code>2</Code></CodedValue>
+	</CodedValues>
+</GPCodedValueDomain2>"""
+
+SLOPE = """<GPRangeDomain2>
+	<DomainName>Slope</DomainName>
+	<FieldType>esriFieldTypeDouble</FieldType>
+	<MinValue>0</MinValue>
+	<MaxValue>90.5</MaxValue>
+</GPRangeDomain2>"""
+
+
+class FakeRow:
+	def __init__(self, item_type, name, path, definition):
+		self.fields = { "Type": item_type, "Name": name, "Path": path, "Definition": definition }
+
+	def GetField(self, name):
+		return self.fields[name]
+
+class FakeDataset:
+	def __init__(self, rows):
+		self.rows = rows
+
+	def GetLayerByName(self, name):
+		return self.rows if name == "GDB_Items" else None
+
+class FakeGdal:
+	pass
+
+
+class GdalBackendTest(unittest.TestCase):
+	def setUp(self):
+		self.gdal, self.ogr = gdalimport.gdal, gdalimport.ogr
+		gdalimport.gdal = FakeGdal()
+		gdalimport.ogr = object()
+
+		self.backend = GdalBackend("test.gdb")
+		self.backend.ds = FakeDataset([
+			FakeRow(WORKSPACE, "", "\\", "<DEWorkspace/>"),
+			FakeRow(FEATURE_DATASET, "Cadastre", "\\Cadastre", "<DEFeatureDataset/>"),
+			FakeRow(FEATURE_CLASS.lower(), "Parcels", "\\Cadastre\\Parcels", PARCELS),
+			FakeRow(FEATURE_CLASS, "Roads", "\\Roads", ROADS),
+			FakeRow(TABLE, "Owners", "\\Owners", OWNERS),
+			FakeRow(RELATIONSHIP_CLASS, "OwnersParcels", "\\OwnersParcels", OWNERS_PARCELS),
+			FakeRow(CODED_VALUE_DOMAIN, "LandUse", "", LAND_USE),
+			FakeRow(RANGE_DOMAIN, "Slope", "", SLOPE),
+			FakeRow(TABLE, "Empty", "\\Empty", None)
+		])
+
+	def tearDown(self):
+		gdalimport.gdal, gdalimport.ogr = self.gdal, self.ogr
+
+	def test_describe_feature_class(self):
+		desc = self.backend.describe("parcels")
+		self.assertEqual(desc["name"], "parcels")
+		self.assertEqual(desc["dataType"], "FeatureClass")
+		self.assertEqual(desc["featureType"], "Simple")
+		self.assertEqual(desc["shapeType"], "Polygon")
+		self.assertEqual(desc["relationshipClassNames"], ["OwnersParcels"])
+		self.assertEqual(self.backend.describe("Roads")["featureType"], "SimpleEdge")
+
+	def test_describe_table_and_unknown_names(self):
+		desc = self.backend.describe("Owners")
+		self.assertEqual((desc["dataType"], desc["featureType"], desc["shapeType"]), ("Table", None, None))
+		self.assertEqual(desc["relationshipClassNames"], ["OwnersParcels"])
+		self.assertEqual(self.backend.describe("Empty")["dataType"], None)
+		self.assertEqual(self.backend.describe("Missing")["dataType"], None)
+
+	def test_describe_relationship_class(self):
+		desc = self.backend.describe("OwnersParcels")
+		self.assertEqual(desc["dataType"], "RelationshipClass")
+		self.assertEqual(desc["isAttachmentRelationship"], False)
+		self.assertEqual(desc["originClassNames"], ["Owners"])
+		self.assertEqual(desc["destinationClassNames"], ["Parcels"])
+		# origin primary key first, as arcpy reports them
+		self.assertEqual(desc["originClassKeys"], [["GlobalID", "OriginPrimary", ""], ["OWNER_ID", "OriginForeign", ""]])
+
+	def test_list_subtypes(self):
+		self.assertEqual(self.backend.list_subtypes("Parcels"), {
+			1: { 'Name': "Urban", 'Default': True, 'SubtypeField': "KIND",
+				'FieldValues': { "OBJECTID": None, "LANDUSE": "UrbanUse" } },
+			2: { 'Name': "Rural", 'Default': False, 'SubtypeField': "KIND",
+				'FieldValues': { "OBJECTID": None, "LANDUSE": "LandUse" } }
+		})
+
+	def test_list_subtypes_without_subtypes(self):
+		self.assertEqual(self.backend.list_subtypes("Owners"), {
+			0: { 'Name': "Owners", 'Default': True, 'SubtypeField': '', 'FieldValues': { "NAME": None } } })
+		self.assertEqual(self.backend.list_subtypes("Missing"), {})
+
+	def test_list_fields(self):
+		self.assertEqual(self.backend.list_fields("Parcels"), [
+			{ "name": "OBJECTID", "type": "OID" }, { "name": "KIND", "type": "SmallInteger" },
+			{ "name": "LANDUSE", "type": "SmallInteger" }, { "name": "GlobalID", "type": "GlobalID" },
+			{ "name": "OWNER_ID", "type": "Guid" } ])
+
+	def test_list_domains(self):
+		self.assertEqual(self.backend.list_domains(), [
+			{ "name": "LandUse", "domainType": "CodedValue", "fieldType": "SmallInteger",
+				"codedValues": [[1, "Housing"], [2, "Retail"]], "range": None },
+			{ "name": "Slope", "domainType": "Range", "fieldType": "Double",
+				"codedValues": [], "range": [0.0, 90.5] }
+		])
+
+	def test_list_datasets_and_feature_classes(self):
+		self.assertEqual(self.backend.list_datasets(), ["Cadastre"])
+		self.assertEqual(self.backend.list_feature_classes("Cadastre"), ["Parcels"])
+		self.assertEqual(self.backend.list_feature_classes(None), ["Roads"])
+
+
+class FieldTypeTest(unittest.TestCase):
+	def test_field_types(self):
+		self.assertEqual(get_field_type("esriFieldTypeInteger"), "Integer")
+		self.assertEqual(get_field_type("esriFieldTypeGUID"), "Guid")
+		self.assertEqual(get_field_type(None), "")
+
+	def test_cast_value(self):
+		self.assertEqual(cast_value("3", "SmallInteger"), 3)
+		self.assertEqual(cast_value("1.5", "Single"), 1.5)
+		self.assertEqual(cast_value("x", "String"), "x")
+		self.assertEqual(cast_value(None, "Integer"), None)
+
+
+if __name__ == '__main__':
+	unittest.main()
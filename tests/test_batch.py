@@ -0,0 +1,88 @@
+#-*- coding: UTF-8 -*-
+import unittest, os, shutil, tempfile
+import psycopg2.extensions
+from fgdb2postgis.batch import SharedConnections, to_argv, read_manifest, check_conversions
+from fgdb2postgis.__main__ import get_parser
+
+CONN_STRING = "dbname=db host=localhost port=5432 user=user password=password"
+
+
+class FakeConnection:
+	closed = False
+
+	def __init__(self, status):
+		self.status = status
+		self.rollbacks = 0
+
+	def get_transaction_status(self):
+		return self.status
+
+	def rollback(self):
+		self.rollbacks += 1
+		self.status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+
+class SharedConnectionsTest(unittest.TestCase):
+	def test_failed_transaction_is_rolled_back(self):
+		connections = SharedConnections()
+		conn = FakeConnection(psycopg2.extensions.TRANSACTION_STATUS_INERROR)
+		connections.conns[CONN_STRING] = conn
+		self.assertTrue(connections.get_connection(CONN_STRING) is conn)
+		self.assertEqual(conn.rollbacks, 1)
+		connections.get_connection(CONN_STRING)
+		self.assertEqual(conn.rollbacks, 1)
+
+	def test_claim_schemas(self):
+		connections = SharedConnections()
+		database = "localhost:5432/regions"
+		self.assertEqual(connections.claim_schemas(database, "north.gdb", ["public", "North", "Roads"]), [])
+		# the same geodatabase again (--resume of a batch) keeps its schemas
+		self.assertEqual(connections.claim_schemas(database, "north.gdb", ["north", "roads"]), [])
+		# dataset schemas of another geodatabase collide, public never does
+		self.assertEqual(connections.claim_schemas(database, "south.gdb", ["public", "south", "ROADS"]),
+			[("roads", "north.gdb")])
+		# nothing is claimed by a rejected conversion
+		self.assertEqual(connections.claim_schemas(database, "east.gdb", ["south"]), [])
+		self.assertEqual(connections.claim_schemas("otherhost:5432/regions", "south.gdb", ["roads"]), [])
+
+
+class ManifestTest(unittest.TestCase):
+	def test_to_argv(self):
+		self.assertEqual(to_argv({ "fgdb": "north.gdb", "jobs": 4, "staging": True, "incremental": False,
+			"simplify": [1, 10.5] }), ["--fgdb", "north.gdb", "--jobs", "4", "--staging", "true",
+			"--incremental", "false", "--simplify", "1,10.5"])
+
+	def test_read_manifest(self):
+		folder = tempfile.mkdtemp()
+		try:
+			manifest = os.path.join(folder, "batch.yml")
+			with open(manifest, "w") as f:
+				f.write("defaults:\n  host: localhost\n  jobs: 4\n"
+					"conversions:\n  - fgdb: north.gdb\n    database: regions\n    schema: north\n"
+					"  - fgdb: south.gdb\n    database: regions\n    jobs: 2\n")
+			conversions = read_manifest(manifest)
+		finally:
+			shutil.rmtree(folder)
+
+		self.assertEqual(conversions, [
+			["--host", "localhost", "--jobs", "4", "--fgdb", "north.gdb", "--database", "regions", "--schema", "north"],
+			["--host", "localhost", "--jobs", "4", "--fgdb", "south.gdb", "--database", "regions", "--jobs", "2"]
+		])
+		# entries override the defaults
+		args = get_parser().parse_args(conversions[1])
+		self.assertEqual((args.fgdb, args.jobs, args.schema), ("south.gdb", 2, "public"))
+
+	def test_check_conversions(self):
+		parser = get_parser()
+		north = parser.parse_args(["--fgdb", "north.gdb", "--database", "regions", "--schema", "north",
+			"--lookup_tables_schema", "north_lookup"])
+		south = parser.parse_args(["--fgdb", "south.gdb", "--database", "regions", "--schema", "south",
+			"--lookup_tables_schema", "south_lookup"])
+		self.assertTrue(check_conversions([north, south]))
+		# both use the default lookup_tables schema
+		self.assertFalse(check_conversions([parser.parse_args(["--fgdb", "a.gdb", "--database", "regions"]),
+			parser.parse_args(["--fgdb", "b.gdb", "--database", "regions"])]))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,99 @@
+#-*- coding: UTF-8 -*-
+import unittest, os, shutil, tempfile
+from fgdb2postgis.filegdb import FileGDB, get_yaml
+
+
+#-------------------------------------------------------------------------------
+# Metadata backend of a geodatabase with a feature dataset (Cadastre/Parcels),
+# a root feature class (Roads) with a coded value domain, a table (Owners) and
+# a relationship class Owners -> Parcels
+#
+class StubBackend:
+	def __init__(self):
+		self.calls = 0
+
+	def setenv(self):
+		pass
+
+	def describe(self, name):
+		self.calls += 1
+		desc = { "name": name, "dataType": None, "featureType": None, "shapeType": None, "relationshipClassNames": None,
+			"isAttachmentRelationship": None, "originClassNames": None, "destinationClassNames": None, "originClassKeys": None }
+		if name in ("Parcels", "Roads"):
+			desc.update( { "dataType": "FeatureClass", "featureType": "Simple", "shapeType": "Polygon",
+				"relationshipClassNames": ["OwnersParcels"] if name == "Parcels" else [] } )
+		elif name == "Owners":
+			desc.update( { "dataType": "Table", "relationshipClassNames": ["OwnersParcels"] } )
+		elif name == "OwnersParcels":
+			desc.update( { "dataType": "RelationshipClass", "isAttachmentRelationship": False,
+				"originClassNames": ["Owners"], "destinationClassNames": ["Parcels"],
+				"originClassKeys": [["OBJECTID", "OriginPrimary", ""], ["OWNER_ID", "OriginForeign", ""]] } )
+		return desc
+
+	def list_subtypes(self, name):
+		field_values = { "ROADTYPE": "RoadType" } if name == "Roads" else {}
+		return { 0: { 'Name': name, 'Default': True, 'SubtypeField': '', 'FieldValues': field_values } }
+
+	def list_fields(self, name):
+		return []
+
+	def list_domains(self):
+		return [ { "name": "RoadType", "domainType": "CodedValue", "fieldType": "SmallInteger",
+			"codedValues": [[1, "Main"], [2, "Local"]], "range": None } ]
+
+	def list_datasets(self):
+		return ["Cadastre"]
+
+	def list_feature_classes(self, fds):
+		return { "Cadastre": ["Parcels"], None: ["Roads"] }[fds]
+
+	def list_tables(self, wildcard="*"):
+		return ["Owners"]
+
+	def get_count(self, name):
+		return 10
+
+
+class FileGDBTest(unittest.TestCase):
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		workspace = os.path.join(self.folder, "test.gdb")
+		os.mkdir(workspace)
+		self.filegdb = FileGDB(workspace, False, "lookup_tables", catalog_cache=False, write_sql=False)
+		self.filegdb.backend = StubBackend()
+
+	def tearDown(self):
+		shutil.rmtree(self.folder)
+
+	def test_relationship_class(self):
+		self.filegdb.process()
+
+		constraints = self.filegdb.get_statements("create_constraints")
+		self.assertTrue("ALTER TABLE cadastre.parcels ADD CONSTRAINT parcels_owner_id_owners_fkey FOREIGN KEY (owner_id) "
+			"REFERENCES public.owners (id) NOT VALID;" in constraints)
+		self.assertTrue("CREATE UNIQUE INDEX IF NOT EXISTS owners_id_idx ON public.owners  (id);"
+			in self.filegdb.get_statements("create_indexes"))
+		self.assertTrue(any(["insert into public.owners" in s for s in self.filegdb.get_statements("fix_data_errors")]))
+
+		# views only label lookup tables
+		self.assertEqual([v["name"] for v in self.filegdb.materialized_views], ["public.roads_mv"])
+
+	def test_schemas(self):
+		self.filegdb.process()
+		items = dict((item["feature"], item["schema"]) for item in self.filegdb.get_items())
+		self.assertEqual(items, { "Owners": "public", "Roads": "public", "Parcels": "cadastre" })
+		self.assertEqual([t["feature"] for t in self.filegdb.domain_tables], ["lut_roadtype"])
+
+	def test_create_yaml(self):
+		# --yml: the yml file is written before the geodatabase is processed
+		self.filegdb.create_yaml()
+		with open(self.filegdb.yamlfile_path) as f:
+			data = get_yaml().load(f)
+		self.assertEqual(data["Schemas"], ["Cadastre"])
+		self.assertEqual(data["FeatureDatasets"], { "Cadastre": ["Cadastre"] })
+		self.assertEqual(data["FeatureClasses"], { "public": ["Roads"] })
+		self.assertEqual(data["Tables"], { "public": ["Owners"] })
+
+
+if __name__ == '__main__':
+	unittest.main()
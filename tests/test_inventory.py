@@ -0,0 +1,106 @@
+#-*- coding: UTF-8 -*-
+import unittest
+from fgdb2postgis import inventory, gdalimport
+
+# stands in for ogr.wkbNone, deliberately not 0
+WKB_NONE = 100
+
+
+class FakeGdal:
+	OF_VECTOR = 4
+	OF_READONLY = 0
+
+	def __init__(self, ds):
+		self.ds = ds
+
+	def OpenEx(self, *args, **kwargs):
+		return self.ds
+
+class FakeOgr:
+	wkbNone = WKB_NONE
+	wkbPolygon = 3
+
+
+class FakeLayer:
+	def __init__(self, name, count, geom_type, definition=None):
+		self.name = name
+		self.count = count
+		self.geom_type = geom_type
+		self.definition = definition
+
+	def GetName(self):
+		return self.name
+
+	def GetFeatureCount(self):
+		return self.count
+
+	def GetGeomType(self):
+		return self.geom_type
+
+	def GetMetadata_List(self, domain):
+		if self.definition is None:
+			return None
+		return [self.definition]
+
+class FakeDataset:
+	def __init__(self, layers):
+		self.layers = layers
+
+	def GetLayerCount(self):
+		return len(self.layers)
+
+	def GetLayer(self, i):
+		return self.layers[i]
+
+	def GetLayerByName(self, name):
+		return [l for l in self.layers if l.name == name][0]
+
+
+POLYGON_DEFINITION = """<DEFeatureClassInfo>
+	<CatalogPath>\\Cadastre\\Parcels</CatalogPath>
+	<FeatureType>esriFTSimple</FeatureType>
+	<ShapeType>esriGeometryPolygon</ShapeType>
+</DEFeatureClassInfo>"""
+
+TABLE_DEFINITION = """<DETableInfo>
+	<CatalogPath>\\Owners</CatalogPath>
+</DETableInfo>"""
+
+
+class InventoryTest(unittest.TestCase):
+	def setUp(self):
+		self.gdal, self.ogr = gdalimport.gdal, gdalimport.ogr
+		ds = FakeDataset([
+			FakeLayer("Parcels", 12, FakeOgr.wkbPolygon, POLYGON_DEFINITION),
+			FakeLayer("Owners", 3, WKB_NONE, TABLE_DEFINITION),
+			FakeLayer("Points", 0, 0)
+		])
+		gdalimport.gdal = FakeGdal(ds)
+		gdalimport.ogr = FakeOgr()
+
+	def tearDown(self):
+		gdalimport.gdal, gdalimport.ogr = self.gdal, self.ogr
+
+	def test_feature_class(self):
+		item = inventory.Inventory("x.gdb").describe("Parcels")
+		self.assertEqual(item, { "feature": "Parcels", "count": 12, "dataset": "Cadastre", "type": "feature_class",
+			"feature_type": "Simple", "shapeType": "Polygon" })
+
+	def test_table(self):
+		item = inventory.Inventory("x.gdb").describe("Owners")
+		self.assertEqual(item, { "feature": "Owners", "count": 3, "dataset": None, "type": "table" })
+
+	def test_geometry_type_is_compared_with_wkb_none(self):
+		# a geometry type of 0 (wkbUnknown) is still a feature class
+		item = inventory.Inventory("x.gdb").describe("Points")
+		self.assertEqual(item["type"], "feature_class")
+		self.assertEqual(item["feature_type"], "Simple")
+
+	def test_scan(self):
+		items = inventory.Inventory("x.gdb").scan()
+		self.assertEqual([(i["feature"], i["type"]) for i in items],
+			[("Parcels", "feature_class"), ("Owners", "table"), ("Points", "feature_class")])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,68 @@
+#-*- coding: UTF-8 -*-
+import unittest, os, json, shutil, tempfile
+from fgdb2postgis.journal import Journal
+
+HEADER = { "workspace": "/data/test.gdb", "fingerprint": [["a00000001.gdbtable", 100, 1]], "database": "localhost:5432/db" }
+
+
+class JournalTest(unittest.TestCase):
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		self.journal_path = os.path.join(self.folder, "test.gdb.journal")
+
+	def tearDown(self):
+		shutil.rmtree(self.folder)
+
+	def write_run(self, keys, header=HEADER):
+		journal = Journal(self.journal_path, header)
+		journal.open()
+		for key in keys:
+			journal.record(key)
+		journal.close()
+
+	def test_resume(self):
+		self.write_run(["lookup_tables", "load:public.roads"])
+		journal = Journal(self.journal_path, HEADER)
+		self.assertEqual(journal.open(resume=True), set(["lookup_tables", "load:public.roads"]))
+		journal.record("gist:public.roads")
+		journal.close()
+		self.assertEqual(Journal(self.journal_path, HEADER).read(), set(["lookup_tables", "load:public.roads", "gist:public.roads"]))
+
+	def test_without_resume_the_journal_starts_over(self):
+		self.write_run(["lookup_tables"])
+		journal = Journal(self.journal_path, HEADER)
+		self.assertEqual(journal.open(), set())
+		journal.close()
+		self.assertEqual(Journal(self.journal_path, HEADER).read(), set())
+
+	def test_header_mismatch(self):
+		self.write_run(["lookup_tables"])
+		header = dict(HEADER, database="localhost:5432/other")
+		self.assertEqual(Journal(self.journal_path, header).read(), set())
+
+		# the journal of the other run is replaced
+		journal = Journal(self.journal_path, header)
+		self.assertEqual(journal.open(resume=True), set())
+		journal.close()
+		with open(self.journal_path) as f:
+			self.assertEqual([json.loads(line) for line in f], [header])
+
+	def test_truncated_last_line(self):
+		self.write_run(["lookup_tables", "load:public.roads"])
+		with open(self.journal_path, "a") as f:
+			f.write('{"task": "gist:publ')
+		self.assertEqual(Journal(self.journal_path, HEADER).read(), set(["lookup_tables", "load:public.roads"]))
+
+		# the tasks of the resumed run are recorded on lines of their own
+		journal = Journal(self.journal_path, HEADER)
+		journal.open(resume=True)
+		journal.record("gist:public.roads")
+		journal.close()
+		self.assertEqual(Journal(self.journal_path, HEADER).read(), set(["lookup_tables", "load:public.roads", "gist:public.roads"]))
+
+	def test_missing_journal(self):
+		self.assertEqual(Journal(self.journal_path, HEADER).read(), set())
+
+
+if __name__ == '__main__':
+	unittest.main()
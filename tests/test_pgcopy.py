@@ -0,0 +1,128 @@
+#-*- coding: UTF-8 -*-
+import unittest, struct, datetime
+from fgdb2postgis import pgcopy
+
+
+class FakeCursor:
+	def __init__(self):
+		self.sql = []
+		self.copies = []
+
+	def execute(self, sql):
+		self.sql.append(sql)
+
+	def copy_expert(self, sql, buffer):
+		self.copies.append( (sql, buffer.read()) )
+
+
+#-------------------------------------------------------------------------------
+# Parse a binary COPY buffer into rows of raw field bytes (None for NULL)
+#
+def parse_copy(data):
+	assert data.startswith(pgcopy.COPY_HEADER)
+	pos = len(pgcopy.COPY_HEADER)
+	rows = []
+	while True:
+		count = struct.unpack('!h', data[pos:pos + 2])[0]
+		pos += 2
+		if count == -1:
+			break
+		row = []
+		for i in range(count):
+			size = struct.unpack('!i', data[pos:pos + 4])[0]
+			pos += 4
+			if size == -1:
+				row.append(None)
+				continue
+			row.append(data[pos:pos + size])
+			pos += size
+		rows.append(row)
+	assert pos == len(data)
+	return rows
+
+
+class EncoderTest(unittest.TestCase):
+	def test_integers(self):
+		self.assertEqual(pgcopy.encode_int2(-2), b'\x00\x00\x00\x02\xff\xfe')
+		self.assertEqual(pgcopy.encode_int4(1), b'\x00\x00\x00\x04\x00\x00\x00\x01')
+		self.assertEqual(pgcopy.encode_int8(1), b'\x00\x00\x00\x08' + b'\x00' * 7 + b'\x01')
+
+	def test_floats(self):
+		self.assertEqual(pgcopy.encode_float8(1.5), struct.pack('!id', 8, 1.5))
+		self.assertEqual(pgcopy.encode_float4(1.5), struct.pack('!if', 4, 1.5))
+
+	def test_bool(self):
+		self.assertEqual(pgcopy.encode_bool(2), b'\x00\x00\x00\x01\x01')
+		self.assertEqual(pgcopy.encode_bool(0), b'\x00\x00\x00\x01\x00')
+
+	def test_bytes(self):
+		self.assertEqual(pgcopy.encode_bytes(u"é"), b'\x00\x00\x00\x02\xc3\xa9')
+		self.assertEqual(pgcopy.encode_bytes(b'ab'), b'\x00\x00\x00\x02ab')
+
+	def test_date(self):
+		self.assertEqual(pgcopy.encode_date((2000, 1, 2)), struct.pack('!ii', 4, 1))
+		self.assertEqual(pgcopy.encode_date((1999, 12, 31)), struct.pack('!ii', 4, -1))
+
+	def test_timestamp(self):
+		self.assertEqual(pgcopy.encode_timestamp((2000, 1, 1, 0, 0, 1.5, 0)), struct.pack('!iq', 8, 1500000))
+		days = (datetime.date(2020, 2, 29) - datetime.date(2000, 1, 1)).days
+		self.assertEqual(pgcopy.encode_timestamp((2020, 2, 29, 12, 0, 0, 0)),
+			struct.pack('!iq', 8, (days * 86400 + 12 * 3600) * 1000000))
+
+	def test_time(self):
+		self.assertEqual(pgcopy.encode_time((0, 0, 0, 1, 2, 3.25)), struct.pack('!iq', 8, 3723250000))
+
+
+class EwkbTest(unittest.TestCase):
+	def test_srid_is_embedded(self):
+		wkb = b'\x01' + struct.pack('<I', 1) + struct.pack('<dd', 1.0, 2.0)
+		ewkb = pgcopy.to_ewkb(wkb, 4326)
+		self.assertEqual(ewkb[0:1], b'\x01')
+		self.assertEqual(struct.unpack('<I', bytes(ewkb[1:5]))[0], 1 | pgcopy.EWKB_SRID_FLAG)
+		self.assertEqual(struct.unpack('<I', bytes(ewkb[5:9]))[0], 4326)
+		self.assertEqual(bytes(ewkb[9:]), wkb[5:])
+
+	def test_big_endian(self):
+		wkb = b'\x00' + struct.pack('>I', 0x80000001) + struct.pack('>ddd', 1.0, 2.0, 3.0)
+		ewkb = pgcopy.to_ewkb(wkb, 2100)
+		self.assertEqual(struct.unpack('>I', bytes(ewkb[1:5]))[0], 0x80000001 | pgcopy.EWKB_SRID_FLAG)
+		self.assertEqual(struct.unpack('>I', bytes(ewkb[5:9]))[0], 2100)
+
+	def test_no_srid(self):
+		wkb = b'\x01' + struct.pack('<I', 1) + struct.pack('<dd', 1.0, 2.0)
+		self.assertEqual(pgcopy.to_ewkb(wkb, 0), wkb)
+
+	def test_epsg_code(self):
+		self.assertEqual(pgcopy.get_epsg_code("EPSG:4686"), 4686)
+		self.assertEqual(pgcopy.get_epsg_code("epsg:2100"), 2100)
+		self.assertEqual(pgcopy.get_epsg_code("+proj=longlat"), 0)
+		self.assertEqual(pgcopy.get_epsg_code(None), 0)
+
+
+class LookupTableTest(unittest.TestCase):
+	def test_copy_lookup_table(self):
+		cursor = FakeCursor()
+		pgcopy.copy_lookup_table(cursor, "lookup.lut_roadtype", [("Code", "SmallInteger"), ("Description", "String")],
+			[[1, "Main"], [2, None], [3, 42]])
+
+		self.assertEqual(cursor.sql, [
+			"DROP TABLE IF EXISTS lookup.lut_roadtype CASCADE;",
+			'CREATE TABLE lookup.lut_roadtype (id serial PRIMARY KEY, "code" smallint, "description" varchar);'
+		])
+		sql, data = cursor.copies[0]
+		self.assertEqual(sql, 'COPY lookup.lut_roadtype ("code", "description") FROM STDIN WITH (FORMAT binary)')
+		self.assertEqual(parse_copy(data), [
+			[struct.pack('!h', 1), b'Main'],
+			[struct.pack('!h', 2), None],
+			[struct.pack('!h', 3), b'42']
+		])
+
+	def test_unknown_types_are_varchar(self):
+		cursor = FakeCursor()
+		pgcopy.copy_lookup_table(cursor, "lookup.lut_d", [("Code", "Date"), ("Description", "String")], [[u"2020-01-01", u"x"]])
+		self.assertTrue('"code" varchar' in cursor.sql[1])
+		self.assertEqual(parse_copy(cursor.copies[0][1]), [[b'2020-01-01', b'x']])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,81 @@
+#-*- coding: UTF-8 -*-
+import unittest, json, os, shutil, tempfile
+from os import path
+from fgdb2postgis.report import RunReport
+from fgdb2postgis.plan import ThroughputProfile, get_item_name
+
+
+def get_report():
+	report = RunReport("x.gdb")
+	# a layer loaded in two chunks, its indexes and a script
+	report.record("load_database", "public.parcels", 3.0, rows=600, bytes=6000)
+	report.record("load_database", "public.parcels", 2.0, rows=400, bytes=4000)
+	report.record("load_database", "public.roads", 5.0, rows=1000, bytes=8000)
+	report.record("create_indexes", "public.parcels", 1.0)
+	report.record("create_indexes", "public.roads", 3.0)
+	report.record("fix_data_errors", "fix_data_errors.sql", 0.5)
+	report.record("fix_data_errors", "fix_data_errors.sql", 1.5)
+	report.add_stage("filegdb.process", 4.0)
+	report.add_stage("load_database", 10.0)
+	return report
+
+
+class ThroughputProfileTest(unittest.TestCase):
+	def setUp(self):
+		self.tempdir = tempfile.mkdtemp()
+		self.report_path = path.join(self.tempdir, "x.gdb.report.json")
+		get_report().save(self.report_path)
+
+	def tearDown(self):
+		shutil.rmtree(self.tempdir)
+
+	def test_rates(self):
+		profile = ThroughputProfile()
+		self.assertTrue(profile.load(self.report_path))
+		self.assertEqual(profile.source, self.report_path)
+		self.assertEqual(profile.rates["load_database"], [2000, 10.0])
+		self.assertEqual(profile.estimate("load_database", "public.other", 500), 2.5)
+		self.assertEqual(profile.stages, { "filegdb.process": 4.0, "load_database": 10.0 })
+
+	def test_sql_items_get_the_rows_of_their_table(self):
+		profile = ThroughputProfile()
+		profile.load(self.report_path)
+		# the chunks of public.parcels add up to 1000 rows
+		self.assertEqual(profile.rates["create_indexes"], [2000, 4.0])
+		self.assertEqual(profile.estimate("create_indexes", "public.other", 1000), 2.0)
+
+	def test_items_without_rows_are_estimated_by_name(self):
+		profile = ThroughputProfile()
+		profile.load(self.report_path)
+		self.assertEqual(profile.items, { ("fix_data_errors", "fix_data_errors.sql"): [0.5, 1.5] })
+		self.assertEqual(profile.estimate("fix_data_errors", "fix_data_errors.sql"), 1.0)
+		self.assertEqual(profile.estimate("split_schemas", "split_schemas.sql"), None)
+
+	def test_benchmark_result(self):
+		benchmark_path = path.join(self.tempdir, "benchmark.json")
+		with open(benchmark_path, 'w') as f:
+			json.dump({ "seconds": 12.0, "report": get_report().to_dict() }, f)
+		profile = ThroughputProfile()
+		self.assertTrue(profile.load(benchmark_path))
+		self.assertEqual(profile.rates["load_database"], [2000, 10.0])
+
+	def test_missing_report(self):
+		profile = ThroughputProfile()
+		self.assertFalse(profile.load(path.join(self.tempdir, "missing.json")))
+		self.assertFalse(profile.load(None))
+		self.assertEqual(profile.source, None)
+
+
+class ItemNameTest(unittest.TestCase):
+	def test_item_names(self):
+		self.assertEqual(get_item_name("chunk:public.parcels:3"), "public.parcels")
+		self.assertEqual(get_item_name("pack:public:0"), "pack:public:0")
+		self.assertEqual(get_item_name("lookup_tables"), "lookup_tables")
+		self.assertEqual(get_item_name("fix_data_errors"), "fix_data_errors.sql")
+		self.assertEqual(get_item_name("split_schemas"), "split_schemas.sql")
+		self.assertEqual(get_item_name("load:public.parcels"), "public.parcels")
+		self.assertEqual(get_item_name("index:0:public.parcels"), "public.parcels")
+
+
+if __name__ == '__main__':
+	unittest.main()
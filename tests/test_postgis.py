@@ -0,0 +1,187 @@
+#-*- coding: UTF-8 -*-
+import unittest
+from fgdb2postgis.postgis import PostGIS
+
+
+def get_postgis(**kwargs):
+	# dry_run: the database is not created
+	return PostGIS("localhost", 5432, "user", "password", "db", "EPSG:4326", "EPSG:4326", dry_run=True, **kwargs)
+
+def get_job(feature, count):
+	return { "feature": feature, "schema": "public", "count": count, "workspace": "x.gdb",
+		"gdal_type": "MULTIPOLYGON", "geometry": True, "bytes": count * 10 }
+
+
+class ChunksTest(unittest.TestCase):
+	def test_small_layers_are_not_chunked(self):
+		postgis = get_postgis(chunk_rows=1000)
+		self.assertEqual(postgis.get_chunks(get_job("Parcels", 1999)), [])
+		self.assertEqual(get_postgis().get_chunks(get_job("Parcels", 10 ** 6)), [])
+
+	def test_chunk_bounds(self):
+		postgis = get_postgis(chunk_rows=1000)
+		chunks = postgis.get_chunks(get_job("Parcels", 2500))
+
+		self.assertEqual([c["chunk"]["index"] for c in chunks], [0, 1, 2, 3])
+		self.assertEqual([(c["chunk"]["first"], c["chunk"]["last"]) for c in chunks],
+			[(None, 1), (1, 835), (835, 1669), (1669, None)])
+		self.assertEqual([c["count"] for c in chunks], [0, 834, 834, 832])
+		self.assertEqual(sum([c["bytes"] for c in chunks]), 25000)
+		self.assertEqual([postgis.get_chunk_key(c) for c in chunks][:2], ["chunk:public.parcels:0", "chunk:public.parcels:1"])
+
+	def test_ranges_cover_every_fid_once(self):
+		postgis = get_postgis(chunk_rows=1000)
+		chunks = postgis.get_chunks(get_job("Parcels", 7001))
+		for a, b in zip(chunks, chunks[1:]):
+			self.assertEqual(a["chunk"]["last"], b["chunk"]["first"])
+		self.assertEqual(chunks[0]["chunk"]["first"], None)
+		self.assertEqual(chunks[-1]["chunk"]["last"], None)
+		self.assertEqual(sum([c["count"] for c in chunks]), 7001)
+
+	def test_chunk_filters(self):
+		postgis = get_postgis(chunk_rows=1000)
+		chunks = postgis.get_chunks(get_job("Parcels", 2500))
+		self.assertEqual(postgis.get_chunk_filter(chunks[0]), "FID < 1")
+		self.assertEqual(postgis.get_chunk_filter(chunks[1]), "FID >= 1 AND FID < 835")
+		self.assertEqual(postgis.get_chunk_filter(chunks[3], "id"), "id >= 1669")
+
+
+def get_table(feature, count, schema="public"):
+	return { "feature": feature, "schema": schema, "count": count, "workspace": "x.gdb",
+		"gdal_type": "", "geometry": False }
+
+
+class PacksTest(unittest.TestCase):
+	def test_small_tables_of_a_schema_are_packed(self):
+		postgis = get_postgis(batch_size=100)
+		jobs = [get_table("a", 40), get_table("b", 40), get_table("c", 40), get_table("d", 10, "other"),
+			get_table("e", 5, "other"), get_job("Roads", 10), get_table("big", 100)]
+		packs = postgis.get_table_packs(jobs)
+
+		self.assertEqual([(p["key"], [j["feature"] for j in p["jobs"]], p["count"]) for p in packs],
+			[("pack:public:0", ["a", "b"], 80), ("pack:other:2", ["d", "e"], 15)])
+		self.assertEqual([j.get("pack") for j in jobs], ["pack:public:0", "pack:public:0", None, "pack:other:2",
+			"pack:other:2", None, None])
+
+	def test_pack_size_is_bounded(self):
+		postgis = get_postgis(batch_size=1000)
+		postgis.pack_tables = 3
+		jobs = [get_table("t%d" % i, 1) for i in range(7)]
+		packs = postgis.get_table_packs(jobs)
+		self.assertEqual([len(p["jobs"]) for p in packs], [3, 3])
+		self.assertTrue("pack" not in jobs[6])
+
+
+class FakeFileGDB:
+	domain_tables = []
+	materialized_views = []
+
+	def get_statements(self, name):
+		return []
+
+
+class FakeCursor:
+	def __init__(self, conn):
+		self.conn = conn
+
+	def execute(self, sql):
+		self.conn.sql.append(sql)
+
+	def copy_expert(self, sql, buffer):
+		self.conn.sql.append(sql)
+
+	def close(self):
+		pass
+
+
+class FakeConnection:
+	def __init__(self):
+		self.sql = []
+		self.commits = 0
+
+	def cursor(self):
+		return FakeCursor(self)
+
+	def commit(self):
+		self.commits += 1
+
+	def rollback(self):
+		pass
+
+
+class StagingFileGDB(FakeFileGDB):
+	domain_tables = [ { "feature": "LUT_RoadType", "schema": "lookup", "type": "table",
+		"columns": [("Code", "SmallInteger"), ("Description", "String")], "rows": [[1, "Main"]], "count": 1 } ]
+
+
+class StagingTest(unittest.TestCase):
+	def setUp(self):
+		self.postgis = get_postgis(staging=True)
+		self.postgis.conn = FakeConnection()
+		self.filegdb = StagingFileGDB()
+
+	def test_lookup_tables_are_staged(self):
+		self.assertEqual(self.postgis.load_lookup_tables(self.filegdb), 0)
+		self.assertEqual(self.postgis.conn.sql[0],
+			"DROP TABLE IF EXISTS fgdb2postgis_staging.lut_roadtype CASCADE;")
+		self.assertFalse([sql for sql in self.postgis.conn.sql if "lookup." in sql])
+		self.assertEqual([i["name"] for i in self.postgis.report.items], ["lookup.lut_roadtype"])
+
+	def test_lookup_tables_are_switched_with_the_layers(self):
+		job = get_job("Roads", 10)
+		job.update({ "final_schema": "public", "schema": self.postgis.staging_schema, "unlogged": True })
+		graph = self.postgis.build_graph(self.filegdb, [job], [], set(["public.roads"]), [], [])
+		graph.simulate(2)
+		self.assertEqual(self.postgis.switch_loaded(graph, self.filegdb, [job]), 0)
+		self.assertEqual(self.postgis.conn.sql, [
+			"DROP TABLE IF EXISTS public.roads CASCADE;",
+			"ALTER TABLE fgdb2postgis_staging.roads SET SCHEMA public;",
+			"DROP TABLE IF EXISTS lookup.lut_roadtype CASCADE;",
+			"ALTER TABLE fgdb2postgis_staging.lut_roadtype SET SCHEMA lookup;"
+		])
+		self.assertEqual(self.postgis.conn.commits, 1)
+
+
+class ViewsFileGDB(FakeFileGDB):
+	domain_tables = [ { "feature": "LUT_RoadType", "schema": "lookup", "count": 1 } ]
+	materialized_views = [
+		{ "name": "public.roads_mv", "table": "public.roads", "count": 1000, "depends": ["public.roads", "lookup.lut_roadtype"] },
+		{ "name": "public.parcels_mv", "table": "public.parcels", "count": 10, "depends": ["public.parcels"] } ]
+
+	def get_statements(self, name):
+		if name != "views":
+			return []
+		return ["CREATE MATERIALIZED VIEW %s AS select t.* from %s as t WITH NO DATA;" % (v["name"], v["table"])
+			for v in self.materialized_views]
+
+
+class GraphTest(unittest.TestCase):
+	def test_layers_are_indexed_while_others_load(self):
+		postgis = get_postgis()
+		jobs = [get_job("Layer%d" % i, 1000) for i in range(6)]
+		tables = set([postgis.get_table_name(job) for job in jobs])
+		graph = postgis.build_graph(FakeFileGDB(), jobs, [], tables, [], [])
+		graph.simulate(2, cost=lambda t: 10.0 if t["key"].startswith("load:") else 1.0)
+
+		first = graph.by_key["gist:public.layer0"]
+		last = graph.by_key["load:public.layer5"]
+		self.assertEqual(first["started"], 10.0)
+		self.assertTrue(first["finished"] < last["started"])
+		self.assertTrue(graph.by_key["analyze:public.layer0"]["finished"] < last["started"])
+
+	def test_materialized_views_wait_for_their_tables(self):
+		postgis = get_postgis()
+		filegdb = ViewsFileGDB()
+		jobs = [get_job("Roads", 1000), get_job("Parcels", 10)]
+		tables = set([postgis.get_table_name(job) for job in jobs])
+		graph = postgis.build_graph(filegdb, jobs, [], tables, [], [])
+
+		view = graph.by_key["view:public.roads_mv"]
+		self.assertTrue("load:public.roads" in view["after"] and "lookup_tables" in view["after"])
+		self.assertTrue("load:public.parcels" not in view["after"])
+		refresh = graph.by_key["refresh:public.roads_mv"]
+		self.assertEqual((refresh["depends"], refresh["after"]), (["view:public.roads_mv"], []))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,68 @@
+#-*- coding: UTF-8 -*-
+import unittest
+from fgdb2postgis import sqlunits
+
+
+class SplitTest(unittest.TestCase):
+	def test_split_statements(self):
+		code = "\n".join([
+			"-- Indexes",
+			"",
+			"SET maintenance_work_mem = '1GB';",
+			"CREATE INDEX a_idx",
+			"  ON public.a (x);",
+			"-- trailing comment",
+			"DROP TABLE b"
+		])
+		self.assertEqual(sqlunits.split_statements(code), [
+			"SET maintenance_work_mem = '1GB';",
+			"CREATE INDEX a_idx\n  ON public.a (x);",
+			"DROP TABLE b"
+		])
+
+	def test_semicolon_inside_a_line_does_not_split(self):
+		self.assertEqual(sqlunits.split_statements("SELECT ';' AS x, 1\nFROM t;"), ["SELECT ';' AS x, 1\nFROM t;"])
+
+	def test_script(self):
+		script = sqlunits.SqlScript("create_indexes")
+		script.write("CREATE INDEX a ON public.a (x);\n")
+		self.assertEqual(script.get_statements(), ["CREATE INDEX a ON public.a (x);"])
+		script.write("CREATE INDEX b ON public.b (y);\n")
+		self.assertEqual(len(script.get_statements()), 2)
+
+
+class UnitsTest(unittest.TestCase):
+	def test_index_units(self):
+		units = sqlunits.index_units([
+			"SET maintenance_work_mem = '1GB';",
+			"CREATE UNIQUE INDEX IF NOT EXISTS a_idx ON public.a (x);",
+			"CREATE INDEX b_idx ON public.b USING GIST (geom);"
+		])
+		self.assertEqual([u["key"] for u in units], ["public.a", "public.b"])
+		self.assertEqual([len(u["statements"]) for u in units], [1, 1])
+
+	def test_constraint_units_group_by_parent(self):
+		units = sqlunits.constraint_units([
+			"ALTER TABLE public.a DROP CONSTRAINT IF EXISTS a_x_fk;",
+			"ALTER TABLE public.a ADD CONSTRAINT a_x_fk FOREIGN KEY (x) REFERENCES lookup.lut_x (code) NOT VALID;",
+			"ALTER TABLE public.b DROP CONSTRAINT IF EXISTS b_y_fk;",
+			"ALTER TABLE public.b ADD CONSTRAINT b_y_fk FOREIGN KEY (y) REFERENCES lookup.lut_y (code) NOT VALID;",
+			"ALTER TABLE public.c ADD CONSTRAINT c_x_fk FOREIGN KEY (x) REFERENCES lookup.lut_x (code) NOT VALID;",
+			"COMMENT ON TABLE public.a IS 'a';"
+		])
+		self.assertEqual([u["key"] for u in units], ["lookup.lut_x", "lookup.lut_y", None])
+		self.assertEqual(len(units[0]["statements"]), 3)
+		self.assertTrue(units[0]["statements"][0].startswith("ALTER TABLE public.a DROP"))
+		self.assertEqual(units[2]["statements"], ["COMMENT ON TABLE public.a IS 'a';"])
+
+	def test_view_units(self):
+		units = sqlunits.view_units([
+			"DROP MATERIALIZED VIEW IF EXISTS public.a_mv;",
+			"CREATE MATERIALIZED VIEW public.a_mv AS SELECT * FROM public.a WITH NO DATA;",
+			"CREATE MATERIALIZED VIEW public.b_mv AS SELECT * FROM public.b WITH NO DATA;"
+		])
+		self.assertEqual([(u["key"], len(u["statements"])) for u in units], [("public.a_mv", 2), ("public.b_mv", 1)])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,142 @@
+#-*- coding: UTF-8 -*-
+import unittest
+from fgdb2postgis.taskgraph import TaskGraph, DONE, FAILED, SKIPPED, PENDING
+
+
+class TaskGraphTest(unittest.TestCase):
+	def setUp(self):
+		self.calls = []
+
+	def task(self, key, rc=0):
+		def func():
+			self.calls.append(key)
+			return rc
+		return func
+
+	def test_runs_dependencies_first(self):
+		graph = TaskGraph()
+		graph.add("index", self.task("index"), depends=["load"])
+		graph.add("load", self.task("load"))
+		self.assertEqual(graph.run(), [])
+		self.assertEqual(self.calls, ["load", "index"])
+
+	def test_ready_tasks_start_in_insertion_order(self):
+		graph = TaskGraph()
+		for key in ["c", "a", "b"]:
+			graph.add(key, self.task(key))
+		graph.run()
+		self.assertEqual(self.calls, ["c", "a", "b"])
+
+	def test_failed_dependency_skips_dependents(self):
+		graph = TaskGraph()
+		graph.add("load", self.task("load", 1))
+		graph.add("gist", self.task("gist"), depends=["load"])
+		graph.add("analyze", self.task("analyze"), depends=["gist"])
+		self.assertEqual(graph.run(), ["load"])
+		self.assertEqual(self.calls, ["load"])
+		self.assertEqual(graph.get_keys(SKIPPED), ["gist", "analyze"])
+
+	def test_after_runs_whatever_the_outcome(self):
+		graph = TaskGraph()
+		graph.add("load", self.task("load", 1))
+		graph.add("switch", self.task("switch"), after=["load"])
+		graph.run()
+		self.assertEqual(self.calls, ["load", "switch"])
+		self.assertTrue(graph.succeeded("switch"))
+
+	def test_exception_fails_the_task(self):
+		def boom():
+			raise RuntimeError("boom")
+		graph = TaskGraph()
+		graph.add("load", boom)
+		graph.add("index", self.task("index"), depends=["load"])
+		self.assertEqual(graph.run(), ["load"])
+		self.assertEqual(graph.by_key["index"]["state"], SKIPPED)
+
+	def test_cycle_is_skipped(self):
+		graph = TaskGraph()
+		graph.add("free", self.task("free"))
+		graph.add("a", self.task("a"), depends=["b"])
+		graph.add("b", self.task("b"), after=["a"])
+		graph.run()
+		self.assertEqual(self.calls, ["free"])
+		self.assertEqual(sorted(graph.get_keys(SKIPPED)), ["a", "b"])
+
+	def test_unknown_dependency(self):
+		graph = TaskGraph()
+		graph.add("index", self.task("index"), depends=["load"])
+		self.assertRaises(ValueError, graph.run)
+
+	def test_duplicate_task(self):
+		graph = TaskGraph()
+		graph.add("load", self.task("load"))
+		self.assertRaises(ValueError, graph.add, "load", self.task("load"))
+
+	def test_many_workers(self):
+		graph = TaskGraph()
+		for i in range(20):
+			graph.add("load:%d" % i, self.task("load:%d" % i))
+			graph.add("index:%d" % i, self.task("index:%d" % i), depends=["load:%d" % i])
+		self.assertEqual(graph.run(jobs=4), [])
+		self.assertEqual(len(self.calls), 40)
+		for i in range(20):
+			self.assertTrue(self.calls.index("load:%d" % i) < self.calls.index("index:%d" % i))
+
+	def test_resumed_tasks_are_not_run(self):
+		graph = TaskGraph()
+		graph.add("load", self.task("load"))
+		graph.add("index", self.task("index"), depends=["load"])
+		done = []
+		graph.run(completed=["load"], on_done=done.append)
+		self.assertEqual(self.calls, ["index"])
+		self.assertEqual(done, ["index"])
+
+	def test_get_resumed_reruns_tasks_of_a_reloaded_table(self):
+		graph = TaskGraph()
+		graph.add("load:a", self.task("load:a"))
+		graph.add("load:b", self.task("load:b"))
+		graph.add("index:a", self.task("index:a"), depends=["load:a"])
+		graph.add("view", self.task("view"), after=["index:a", "load:b"])
+		resumed = graph.get_resumed(["load:b", "index:a", "view", "unknown"])
+		self.assertEqual(resumed, set(["load:b"]))
+
+	def test_simulate(self):
+		graph = TaskGraph()
+		graph.add("load:a", None, stage="load")
+		graph.add("load:b", None, stage="load")
+		graph.add("index:a", None, depends=["load:a"], stage="index")
+		costs = { "load:a": 10.0, "load:b": 4.0, "index:a": 2.0 }
+		tasks = graph.simulate(2, cost=lambda t: costs[t["key"]])
+		self.assertEqual([t["key"] for t in tasks], ["load:a", "load:b", "index:a"])
+		self.assertEqual([(t["started"], t["finished"]) for t in tasks], [(0.0, 10.0), (0.0, 4.0), (10.0, 12.0)])
+		self.assertEqual(graph.get_stage_spans(), [("load", 10.0), ("index", 2.0)])
+		self.assertEqual(graph.get_keys(DONE), ["load:a", "load:b", "index:a"])
+		self.assertEqual(graph.get_keys(PENDING) + graph.get_keys(FAILED), [])
+
+	def test_on_done_failure_fails_the_task(self):
+		def record(key):
+			raise IOError("disk full")
+		graph = TaskGraph()
+		graph.add("load", self.task("load"))
+		graph.add("index", self.task("index"), depends=["load"])
+		graph.add("other", self.task("other"))
+		# the other worker must not wait for the failed one forever
+		self.assertEqual(graph.run(jobs=2, on_done=record), ["load", "other"])
+		self.assertEqual(graph.get_keys(SKIPPED), ["index"])
+
+	def test_dependent_tasks_start_before_later_loads(self):
+		graph = TaskGraph()
+		for i in range(6):
+			graph.add("load:%d" % i, None)
+		for i in range(6):
+			graph.add("gist:%d" % i, None, depends=["load:%d" % i])
+			graph.add("analyze:%d" % i, None, depends=["gist:%d" % i])
+		graph.simulate(2, cost=lambda t: 10.0 if t["key"].startswith("load") else 1.0)
+		self.assertEqual(graph.by_key["gist:0"]["started"], 10.0)
+		self.assertEqual(graph.by_key["analyze:0"]["started"], 11.0)
+		self.assertEqual(graph.by_key["load:2"]["started"], 12.0)
+		self.assertTrue(graph.by_key["gist:0"]["finished"] < graph.by_key["load:5"]["started"])
+
+
+if __name__ == '__main__':
+	unittest.main()